@@ -1,27 +1,70 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from pymongo.errors import PyMongoError
 
 from app.db.mongo import get_db
 from app.db.repositories import counters_repo
 from app.models.counters import CounterOut, CounterUpdateIn, CounterIncrementIn, CounterRollbackIn
+from app.utils import cache, etag
 
 router = APIRouter(prefix="/counters", tags=["counters"])
 
+_CACHE_TTL_SECONDS = 60
+
+
+def _cache_key(counter_id: str) -> str:
+    return f"counters:{counter_id}"
+
 
 def _to_out(doc: dict) -> CounterOut:
-    data = {**doc}
-    data["id"] = str(data.pop("_id"))
-    data["seq"] = int(data.get("seq", 0) or 0)
-    return CounterOut(**data)
+    # Documento confiable desde Mongo: se construye sin revalidar ni copiar el dict
+    extra = {k: v for k, v in doc.items() if k not in ("_id", "seq")}
+    return CounterOut.model_construct(
+        id=str(doc["_id"]),
+        seq=int(doc.get("seq", 0) or 0),
+        **extra,
+    )
+
+
+def _respond(request: Request, out: CounterOut, *, stale: bool = False):
+    # El valor de seq identifica la versión: si el cliente ya la tiene, 304 sin body
+    tag = etag.weak_etag(out.id, out.seq)
+    not_modified = etag.not_modified(request, tag)
+    if not_modified is not None:
+        return not_modified
+    headers = {"ETag": tag}
+    if stale:
+        headers[cache.STALE_HEADER] = "STALE"
+    # CounterOut ya está armado: se serializa directo sin otra pasada de response_model
+    return ORJSONResponse(out.model_dump(mode="json"), headers=headers)
 
 
-@router.get("/{counter_id}", response_model=CounterOut)
-async def get_counter(counter_id: str, db=Depends(get_db)):
-    doc = await counters_repo.find_by_id(counter_id, db=db)
+@router.get("/{counter_id}", response_model=None, responses={200: {"model": CounterOut}})
+async def get_counter(counter_id: str, request: Request, db=Depends(get_db)):
+    key = _cache_key(counter_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return _respond(request, cached)
+    try:
+        doc = await asyncio.wait_for(
+            counters_repo.find_by_id(counter_id, db=db),
+            timeout=cache.stale_timeout(key),
+        )
+    except (asyncio.TimeoutError, PyMongoError):
+        # Mongo lento o caído: se sirve la última versión conocida si existe
+        stale = cache.get_stale(key)
+        if stale is None:
+            raise
+        return _respond(request, stale, stale=True)
     if not doc:
         raise HTTPException(status_code=404, detail="Contador no encontrado")
-    return _to_out(doc)
+    out = _to_out(doc)
+    cache.set(key, out, _CACHE_TTL_SECONDS, keep_stale=True)
+    return _respond(request, out)
 
 
 @router.patch("/{counter_id}", response_model=CounterOut)
@@ -29,6 +72,7 @@ async def update_counter(counter_id: str, body: CounterUpdateIn, db=Depends(get_
     updated = await counters_repo.update_seq(counter_id, body.seq, db=db)
     if not updated:
         raise HTTPException(status_code=404, detail="Contador no encontrado")
+    cache.clear(_cache_key(counter_id))
     return _to_out(updated)
 
 
@@ -38,6 +82,7 @@ async def increment_counter(counter_id: str, body: CounterIncrementIn | None = N
     updated = await counters_repo.increment_seq(counter_id, step=step, db=db)
     if not updated:
         raise HTTPException(status_code=404, detail="Contador no encontrado")
+    cache.clear(_cache_key(counter_id))
     return _to_out(updated)
 
 
@@ -46,10 +91,11 @@ async def rollback_counter(counter_id: str, body: CounterRollbackIn | None = Non
     step = body.step if body else 1
     updated = await counters_repo.decrement_seq(counter_id, step=step, db=db)
     if updated:
+        cache.clear(_cache_key(counter_id))
         return _to_out(updated)
 
-    existing = await counters_repo.find_by_id(counter_id, db=db)
-    if not existing:
+    # None puede ser 404 o 409: solo en ese caso se consulta la existencia
+    if not await counters_repo.exists(counter_id, db=db):
         raise HTTPException(status_code=404, detail="Contador no encontrado")
     raise HTTPException(
         status_code=409,
@@ -1,22 +1,57 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Path
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Response
+from pymongo.errors import PyMongoError
 
 from app.db.mongo import get_db
 from app.models.dashboards import DashboardNetSkusOut
 from app.services import dashboards as dashboards_service
+from app.utils import cache, etag
 
 router = APIRouter(prefix="/dashboards", tags=["dashboards"])
 
 
+def _with_etag(request: Request, response: Response, out: dict):
+    # Los netos se alimentan del sync S3 (no solo de gestión): el ETag sale del contenido
+    tag = etag.content_etag(out["OT"], out["skus"])
+    not_modified = etag.not_modified(request, tag)
+    if not_modified is not None:
+        return not_modified
+    response.headers["ETag"] = tag
+    return out
+
+
 @router.get("/ot/{ot}/skus", response_model=DashboardNetSkusOut)
 async def get_dashboard_net_skus(
+    request: Request,
+    response: Response,
     ot: int = Path(..., ge=1, description="Número de OT sin prefijo"),
     db=Depends(get_db),
 ):
+    key = dashboards_service.net_skus_cache_key(ot)
+    cached = cache.get(key)
+    if cached is not None:
+        return _with_etag(request, response, cached)
+
     try:
-        net = await dashboards_service.get_net_skus_by_ot(db, ot)
+        net = await asyncio.wait_for(
+            dashboards_service.get_net_skus_by_ot(db, ot),
+            timeout=cache.stale_timeout(key),
+        )
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=str(exc))
+    except (asyncio.TimeoutError, PyMongoError):
+        # Mongo lento o caído: se sirve la última versión conocida si existe
+        stale = cache.get_stale(key)
+        if stale is None:
+            raise
+        response.headers[cache.STALE_HEADER] = "STALE"
+        return _with_etag(request, response, stale)
 
-    return {"OT": int(ot), "work_order": f"OT-{int(ot)}", "skus": net}
+    out = {"OT": int(ot), "work_order": f"OT-{int(ot)}", "skus": net}
+    cache.set(
+        key, out, dashboards_service.NET_SKUS_CACHE_TTL_SECONDS, keep_stale=True
+    )
+    return _with_etag(request, response, out)
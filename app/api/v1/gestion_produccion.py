@@ -2,22 +2,24 @@ from __future__ import annotations
 
 from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 
 from app.db.mongo import get_db
 from app.models.gestion_produccion import (
     GestionOTProdCreateIn,
-    GestionOTProdFilters,
     GestionOTProdOut,
     GestionOTProdUpdateIn,
 )
+from app.services import dashboards as dashboards_service
 from app.services import gestion_ot_prod
+from app.utils import cache, pagination
 
 router = APIRouter(prefix="/gestion-produccion", tags=["gestion-produccion"])
 
 
 @router.get("", response_model=list[GestionOTProdOut])
 async def list_gestion_ot_entries(
+    response: Response,
     limit: int = Query(50, ge=1, le=200),
     skip: int = Query(0, ge=0),
     ot: int | None = Query(None, ge=1, description="Número de OT exacto."),
@@ -28,24 +30,40 @@ async def list_gestion_ot_entries(
         le=23,
         description="Hora del día (0-23) basada en audit.createdAt (UTC).",
     ),
+    after: str | None = Query(
+        None,
+        description="Cursor devuelto en el header X-Next-Cursor. Si se envía, `skip` se ignora.",
+    ),
     db=Depends(get_db),
 ):
-    has_filters = any(value is not None for value in (ot, fecha, hora))
-    filters = GestionOTProdFilters(ot=ot, fecha=fecha, hora=hora) if has_filters else None
-    return await gestion_ot_prod.list_entries(
+    try:
+        after_key = pagination.decode_cursor(after) if after else None
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    # FastAPI ya validó los query params: se arma la query sin otra capa Pydantic
+    items = await gestion_ot_prod.list_entries(
         db,
         limit=limit,
         skip=skip,
-        filters=filters,
+        query=gestion_ot_prod.build_query(ot, fecha, hora),
+        after=after_key,
     )
+    if len(items) == limit:
+        last = items[-1]
+        created_at = (last.get("audit") or {}).get("createdAt")
+        if created_at is not None:
+            response.headers["X-Next-Cursor"] = pagination.encode_cursor(created_at, last["_id"])
+    return items
 
 
 @router.post("", response_model=GestionOTProdOut)
 async def create_gestion_ot_entry(body: GestionOTProdCreateIn, db=Depends(get_db)):
     try:
-        return await gestion_ot_prod.create_entry(db, body)
+        created = await gestion_ot_prod.create_entry(db, body)
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=str(exc))
+    cache.clear(dashboards_service.net_skus_cache_key(body.OT))
+    return created
 
 
 @router.patch("/{ot}", response_model=GestionOTProdOut)
@@ -56,8 +74,10 @@ async def update_gestion_ot_entry(
     db=Depends(get_db),
 ):
     try:
-        return await gestion_ot_prod.update_entry(db, ot, body)
+        updated = await gestion_ot_prod.update_entry(db, ot, body)
     except ValueError as exc:
         message = str(exc)
         status = 404 if "no encontrada" in message.lower() else 422
         raise HTTPException(status_code=status, detail=message)
+    cache.clear(dashboards_service.net_skus_cache_key(ot))
+    return updated
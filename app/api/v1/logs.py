@@ -3,17 +3,24 @@ from __future__ import annotations
 from datetime import date
 from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
 from app.db.mongo import get_db
 from app.models.logs import LogCreateIn, LogOut, LogsListFilters, LogsListOut
 from app.services import logs_service
+from app.utils import pagination
+from app.utils.json_body import openapi_body, parse_body
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 
-@router.post("", response_model=LogOut, status_code=status.HTTP_201_CREATED)
-async def create_log(body: LogCreateIn, db=Depends(get_db)):
+@router.post(
+    "",
+    response_model=LogOut,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra=openapi_body(LogCreateIn),
+)
+async def create_log(request: Request, db=Depends(get_db)):
     """
     Registra un nuevo log proveniente del front.
 
@@ -21,6 +28,8 @@ async def create_log(body: LogCreateIn, db=Depends(get_db)):
     - Construye el campo `accion` como actor.entidad.evento.
     - Normaliza el alias para búsquedas case-insensitive.
     """
+    # Valida directo desde los bytes (sin pasar por request.json() -> dict)
+    body = await parse_body(request, LogCreateIn)
     return await logs_service.create_log(db, body)
 
 
@@ -28,7 +37,7 @@ async def create_log(body: LogCreateIn, db=Depends(get_db)):
 async def list_logs(
     q: Optional[str] = Query(
         None,
-        description="Filtro LIKE (regex) por alias del usuario.",
+        description="Filtro por prefijo del alias del usuario (case-insensitive).",
     ),
     severity: Optional[Literal["INFO", "WARN"]] = Query(
         None,
@@ -41,8 +50,38 @@ async def list_logs(
     ),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = Query(
+        None,
+        description="Cursor devuelto en `next_cursor`. Si se envía, `skip` se ignora.",
+    ),
+    include_total: bool = Query(
+        False,
+        description="Incluye el total de registros (consulta adicional). Usar `has_more` para paginar.",
+    ),
     db=Depends(get_db),
 ):
+    try:
+        after_key = pagination.decode_cursor(after) if after else None
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
     filters = LogsListFilters(q=q, severity=severity, date=date_filter)
-    items, total = await logs_service.list_logs(db, filters, skip=skip, limit=limit)
-    return {"items": items, "total": total, "skip": skip, "limit": limit}
+    items, total, has_more = await logs_service.list_logs(
+        db,
+        filters,
+        skip=skip,
+        limit=limit,
+        after=after_key,
+        include_total=include_total,
+    )
+    next_cursor = None
+    if has_more:
+        last = items[-1]
+        next_cursor = pagination.encode_cursor(last["loggedAt"], last["id"])
+    return {
+        "items": items,
+        "total": total,
+        "skip": 0 if after_key else skip,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
+    }
@@ -2,30 +2,36 @@
 # -----------------------------------------------------------------------------
 # Router de Products (endpoints HTTP).
 # - NO habla directo con Mongo: usa el repositorio (products_repo).
-# - Serializa ObjectId -> str con un helper (_to_out).
+# - Serializa ObjectId -> str con un helper (_to_dict) y responde con orjson.
 # - Incluye paginación y orden opcional.
 # -----------------------------------------------------------------------------
 
 from __future__ import annotations
 
+import asyncio
 import re
+import inspect
 import io, csv
+from functools import lru_cache
 from uuid import uuid4
-from typing import List, Optional, Literal, Any, Dict 
+from typing import List, Optional, Literal, Any, Dict, Iterable, Iterator, Annotated
 from datetime import datetime, timedelta
 from bson import ObjectId
+from bson.errors import InvalidId
+from bson.regex import Regex
 
 from fastapi import APIRouter, HTTPException, Query, Path, UploadFile, File, Body, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
-from pydantic import BaseModel, ConfigDict, field_validator
-from pymongo.errors import DuplicateKeyError, BulkWriteError
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from pymongo.errors import DuplicateKeyError
+from pymongo.asynchronous.database import AsyncDatabase
 
 from app.db.mongo import get_db                 
 from app.db.repositories import products_repo    
 from app.domain.familias_map import resolve_codes
+from app.utils import cache
 
-router = APIRouter(prefix="/products", tags=["products"])
+router = APIRouter(prefix="/products", tags=["products"], default_response_class=ORJSONResponse)
 # ----------------------- Modelos de salida (Pydantic) ------------------------
 class ProductOut(BaseModel):
     """
@@ -35,10 +41,17 @@ class ProductOut(BaseModel):
       (sku, nombre, categoría, stock, etc.) y no queremos romper la respuesta.
     """
     id: str
-    model_config = ConfigDict(extra="allow")  # acepta campos adicionales
+    # acepta campos adicionales; el validador se construye recién al primer uso
+    model_config = ConfigDict(extra="allow", defer_build=True)
+
+# nombre no puede ser vacío (al menos un carácter que no sea espacio).
+# Se declara como restricción del esquema para que la valide pydantic-core
+# (Rust) sin llamar a un validador Python por request.
+NombreNoVacio = Annotated[str, Field(pattern=r"\S")]
 
 class ProductPatch(BaseModel):
-    nombre: Optional[str] = None
+    model_config = ConfigDict(defer_build=True)
+    nombre: Optional[NombreNoVacio] = None
     sku: Optional[str] = None
     c_barra: Optional[int] = None
     unidad: Optional[str] = None
@@ -52,18 +65,14 @@ class ProductPatch(BaseModel):
     activo: Optional[bool] = None
     valor_repo: Optional[int] = None
 
-    @field_validator("nombre")
-    @classmethod
-    def nombre_no_vacio(cls, v: Optional[str]) -> Optional[str]:
-        if v is not None and not v.strip():
-            raise ValueError("nombre no puede ser vacío")
-        return v
 
 class ProductActive(BaseModel):
+    model_config = ConfigDict(defer_build=True)
     activo: bool
 
 class ProductCreate(BaseModel):
-    nombre: str
+    model_config = ConfigDict(defer_build=True)
+    nombre: NombreNoVacio
     sku: str
     c_barra: int
     unidad: str
@@ -76,26 +85,99 @@ class ProductCreate(BaseModel):
     tipo: str
     activo: bool
     valor_repo: Optional[str]
-
-    @field_validator("nombre")
-    @classmethod
-    def nombre_no_vacio(cls, v: Optional[str]) -> Optional[str]:
-        if v is not None and not v.strip():
-            raise ValueError("nombre no puede ser vacío")
-        return v
 # --------------------------- Helpers de serialización ------------------------
-def _to_out(doc: dict) -> ProductOut:
+def _to_dict(doc: dict) -> dict:
     """
-    Transforma el documento Mongo en un objeto JSON-friendly.
+    Transforma el documento Mongo en un dict JSON-friendly.
     - Convierte '_id' (ObjectId) a 'id' (str).
-    - Deja el resto de campos tal cual.
+    - Deja el resto de campos tal cual (salvo el derivado 'sku_ci').
+    - Modifica 'doc' en el lugar: cada doc viene recién leído de Mongo y nadie
+      más lo referencia, así que no se paga una copia por documento.
     """
     if not doc:
         raise ValueError("Documento vacío")
-    data = {**doc}
-    if "_id" in data:
-        data["id"] = str(data.pop("_id"))
-    return ProductOut(**data)
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    # Campo derivado solo para búsquedas: no se expone
+    doc.pop("sku_ci", None)
+    return doc
+
+
+def _item_response(doc: dict) -> ORJSONResponse:
+    """
+    Respuesta de un producto: serializa el dict directo con orjson, sin
+    construir ProductOut ni la pasada de validación de response_model.
+    """
+    return ORJSONResponse(_to_dict(doc))
+
+
+# ----------------------------- Cache de lecturas -----------------------------
+# by-id cachea el perfil (5 min); las búsquedas por texto, la página (60 s).
+# Las mutaciones invalidan explícitamente; el TTL es solo red de seguridad.
+PRODUCT_CACHE_TTL_SECONDS = 300
+SEARCH_CACHE_TTL_SECONDS = 60
+SEARCH_CACHE_PREFIX = "search:products:"
+
+
+def _product_cache_key(product_id: str) -> str:
+    return f"product:{product_id}:profile"
+
+
+def _search_cache_key(*parts: Any) -> str:
+    return SEARCH_CACHE_PREFIX + ":".join(str(p) for p in parts)
+
+
+def _invalidate_product_cache(product_id: Optional[str] = None) -> None:
+    """Sin product_id (ej: import masivo) se invalidan todos los perfiles."""
+    if product_id is None:
+        cache.clear_prefix("product:")
+    else:
+        cache.clear(_product_cache_key(product_id))
+    cache.clear_prefix(SEARCH_CACHE_PREFIX)
+_LIST_RESPONSES = {200: {"model": List[ProductOut]}}
+_ITEM_RESPONSES = {200: {"model": ProductOut}}
+
+
+# ------------------------------ Paginado ------------------------------------
+# Más allá de este skip Mongo recorre y descarta demasiadas entradas:
+# se exige paginar por cursor (after=<id del último item>).
+MAX_SKIP = 10_000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _parse_after(after: Optional[str], skip: int) -> Optional[ObjectId]:
+    if after:
+        try:
+            return ObjectId(after)
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor 'after' inválido")
+    if skip > MAX_SKIP:
+        raise HTTPException(
+            status_code=400,
+            detail=f"skip máximo {MAX_SKIP}; usa after=<id del último item> para paginar más allá.",
+        )
+    return None
+
+
+def _page_response(out: List[dict], limit: int, by_id: bool = True) -> ORJSONResponse:
+    """
+    Listado + header X-Next-Cursor (id del último item) si la página vino
+    completa y ordenada por _id: el cliente lo envía como 'after'.
+    """
+    resp = ORJSONResponse(out)
+    if by_id and out and len(out) >= limit:
+        resp.headers[NEXT_CURSOR_HEADER] = out[-1]["id"]
+    return resp
+
+
+_AFTER_QUERY_DESCRIPTION = "Cursor: id del último item recibido (header X-Next-Cursor). Ignora skip."
+@lru_cache(maxsize=1024)
+def _prefix_regex(needle: str, flags: str = "") -> Regex:
+    """
+    Regex anclado al inicio (^needle) para que Mongo recorra solo el rango del
+    índice. Cacheado: búsquedas repetidas (typeahead) no reescapan el patrón.
+    """
+    return Regex("^" + re.escape(needle), flags)
 # --------------------------- Helper de Import ----------------------------
 REQUIRED_HEADERS = {
     "SKU", "CODIGO_BARRA", "NOMBRE", "UNIDAD_MEDIDA",
@@ -105,40 +187,180 @@ REQUIRED_HEADERS = {
 PREVIEW_LIMIT = 50
 MAX_ROWS = 5000
 
+_DECIMAL_COMMA = str.maketrans(",", ".")
+
 def _to_int(v: Any, default: int = 0) -> int:
+    if v is None:
+        return default
+    s = str(v).translate(_DECIMAL_COMMA).strip()
+    if not s:
+        return default
+    try:
+        # Camino rápido para enteros ("4500"); decimales ("4,5") pasan por float
+        return int(s)
+    except ValueError:
+        pass
     try:
-        if v is None or str(v).strip() == "":
-            return default
-        return int(float(str(v).replace(",", ".").strip()))
-    except:
+        return int(float(s))
+    except (ValueError, OverflowError):
         return default
 
+def _cell(row: List[str], i: Optional[int]) -> str:
+    """Valor de la columna i (sin espacios) o "" si la columna no existe en la fila."""
+    if i is None or i >= len(row):
+        return ""
+    return (row[i] or "").strip()
+
+
+def _parse_import_csv(binary_stream, encoding: str):
+    """
+    Recorre el CSV fila a fila (sin cargar el archivo completo ni materializar
+    la lista de filas) y arma preview, items del batch y errores por fila.
+    Lanza UnicodeDecodeError si el encoding no corresponde.
+    """
+    text_stream = io.TextIOWrapper(binary_stream, encoding=encoding, newline="")
+    try:
+        reader = csv.reader(text_stream, delimiter=";")
+        header_row = next(reader, None)
+        if header_row is None:
+            raise HTTPException(status_code=400, detail="El archivo está vacío.")
+        if len(header_row) < 2:
+            raise HTTPException(status_code=400, detail="El archivo debe usar ';' como separador.")
+
+        headers = [h.strip() for h in header_row]
+        missing = [h for h in REQUIRED_HEADERS if h not in headers]
+        if missing:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Faltan columnas requeridas: {', '.join(missing)}"
+            )
+        idx = {h: i for i, h in enumerate(headers)}
+        # Posiciones resueltas una vez (no por fila ni por columna)
+        i_sku, i_nombre, i_uom, i_clasif = (
+            idx.get("SKU"), idx.get("NOMBRE"), idx.get("UNIDAD_MEDIDA"), idx.get("CLASIFICACION"),
+        )
+        i_pneto, i_dg, i_dsg = idx.get("PRECIO_NETO"), idx.get("NOMBRE_GRUPO"), idx.get("NOMBRE_SUBGRUPO")
+        i_cod_g, i_cod_sg = idx.get("CODIGO_GRUPO"), idx.get("CODIGO_SUBGRUPO")
+        i_c_barra, i_valor_repo = idx.get("CODIGO_BARRA"), idx.get("VALOR_REPOSICION")
+
+        preview: List[Dict[str, Any]] = []
+        items_for_batch: List[Dict[str, Any]] = []
+        errorsByRow: Dict[int, List[str]] = {}
+        warningsByRow: Dict[int, List[str]] = {}
+        seen_skus = set()
+
+        for r_index, row in enumerate(reader, start=1):
+            if r_index > MAX_ROWS:
+                break
+
+            errs: List[str] = []
+            warns: List[str] = []
+
+            sku = _cell(row, i_sku).upper()
+            nombre = _cell(row, i_nombre)
+            uom = _cell(row, i_uom).upper()
+            clasif = _cell(row, i_clasif).upper()
+
+            if not sku: errs.append("SKU es requerido.")
+            if not nombre: errs.append("NOMBRE es requerido.")
+            if not uom: errs.append("UNIDAD_MEDIDA es requerida.")
+            if clasif not in ("MP", "PT"):
+                errs.append("CLASIFICACION debe ser MP o PT.")
+
+            if sku in seen_skus:
+                errs.append("SKU duplicado en el archivo.")
+            seen_skus.add(sku)
+
+            pneto = _to_int(_cell(row, i_pneto), 0)
+            if pneto <= 0:
+                errs.append("PRECIO_NETO debe ser mayor a 0.")
+
+            dg = _cell(row, i_dg)
+            dsg = _cell(row, i_dsg)
+            codigo_g = _to_int(_cell(row, i_cod_g), 0)
+            codigo_sg = _to_int(_cell(row, i_cod_sg), 0)
+
+            cod_g_res, cod_sg_res, dg_res, dsg_res = resolve_codes(dg, dsg, codigo_g, codigo_sg)
+
+            if not dg and not codigo_g:
+                errs.append("Debe informar NOMBRE_GRUPO o CODIGO_GRUPO.")
+            if not dsg and not codigo_sg:
+                errs.append("Debe informar NOMBRE_SUBGRUPO o CODIGO_SUBGRUPO.")
+
+            c_barra = _to_int(_cell(row, i_c_barra), 0)
+            valor_repo = _to_int(_cell(row, i_valor_repo), 0)  # opcional
+
+            payload = {
+                "nombre": nombre.upper(),
+                "sku": sku,
+                "c_barra": c_barra,
+                "unidad": uom.upper(),
+                "dg": dg_res.upper() or "",
+                "codigo_g": int(cod_g_res or 0),
+                "dsg": dsg_res.upper() or "",
+                "codigo_sg": int(cod_sg_res or 0),
+                "pneto": pneto,
+                "piva": int(round(pneto * 1.19)),
+                "tipo": clasif.upper(),
+                "valor_repo": str(valor_repo),
+            }
+
+            if errs:
+                errorsByRow[r_index] = errs
+            if warns:
+                warningsByRow[r_index] = warns
+
+            if len(preview) < PREVIEW_LIMIT:
+                preview.append({**payload, "__row": r_index})
+
+            items_for_batch.append({
+                "row": r_index,
+                "payload": payload,
+                "errors": errs,
+                "warnings": warns,
+            })
+    finally:
+        # Suelta el stream binario sin cerrarlo (lo administra UploadFile)
+        text_stream.detach()
+
+    return headers, preview, items_for_batch, errorsByRow, warningsByRow
+
 # -------------------------------- Endpoints ----------------------------------
 
 # -------------------------------- Busqueda ----------------------------------
 @router.get("/by-id/{product_id}")
 async def get_product_by_id(product_id: str, db=Depends(get_db)):
-    # Validación de ObjectId
-    if not ObjectId.is_valid(product_id):
+    # Solo ids válidos llegan al cache: un hit no necesita parsear el ObjectId
+    key = _product_cache_key(product_id)
+    cached = cache.get(key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
+    # Validación de ObjectId (un solo parseo)
+    try:
+        oid = ObjectId(product_id)
+    except (InvalidId, TypeError):
         raise HTTPException(status_code=422, detail="ObjectId inválido")
 
-    doc = await db["products"].find_one({"_id": ObjectId(product_id)}, {"sku": 1, "nombre": 1, "tipo": 1})
+    doc = await products_repo.get_collection(db).find_one({"_id": oid}, {"sku": 1, "nombre": 1, "tipo": 1})
     if not doc:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
-    # Serializamos _id -> id por consistencia
-    return {
+    # Serializamos _id -> id por consistencia; dict plano directo a orjson
+    out = {
         "id": str(doc["_id"]),
         "sku": doc.get("sku"),
         "nombre": doc.get("nombre"),
         "tipo": doc.get("tipo"),
     }
+    cache.set(key, out, PRODUCT_CACHE_TTL_SECONDS, keep_stale=False)
+    return ORJSONResponse(out)
 
-@router.get("", response_model=List[ProductOut])
+@router.get("", response_model=None, responses=_LIST_RESPONSES)
 async def list_products(
     q: Optional[str] = Query(
         None,
-        description="Filtro simple por nombre (regex, case-insensitive)."
+        description="Filtro simple por prefijo del nombre (case-insensitive)."
     ),
     limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
     skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
@@ -148,122 +370,109 @@ async def list_products(
     sort_dir: int = Query(
         1, description="Dirección de orden: 1 asc, -1 desc.",
     ),
+    after: Optional[str] = Query(None, description=_AFTER_QUERY_DESCRIPTION),
 ):
     """
     GET /products
     - Construye un filtro simple (por nombre si viene 'q').
-    - Llama al repositorio para traer documentos paginados y ordenados.
+    - Llama al repositorio para traer documentos paginados y ordenados
+      (por _id si no se indica sort_field).
     - Serializa cada doc para exponer 'id' en lugar de '_id'.
+    - Con 'after' pagina por cursor (orden por _id).
     """
+    after_id = _parse_after(after, skip)
+    if sort_field is None or after_id is not None:
+        sort_field, sort_dir = "_id", 1
+    by_id = sort_field == "_id" and sort_dir == 1
+
     filtro = {}
+    key = None
     if q:
-        # Búsqueda por nombre con regex (case-insensitive)
-        filtro = {"nombre": {"$regex": q, "$options": "i"}}
-
-    sort = [(sort_field, sort_dir)] if (sort_field is not None and sort_dir is not None) else None
+        # Búsqueda por prefijo de nombre (case-insensitive)
+        filtro = {"nombre": _prefix_regex(q.strip(), "i")}
+        # Solo se cachean búsquedas: el listado global cambia demasiado
+        key = _search_cache_key("list", q.strip().lower(), limit, skip, sort_field, sort_dir, after)
+        cached = cache.get(key)
+        if cached is not None:
+            return _page_response(cached, limit, by_id)
 
     docs = await products_repo.find_many(
         filtro=filtro,
         limit=limit,
         skip=skip,
-        sort=sort,
-    )
-    return [_to_out(d) for d in docs]
-
-
-@router.get("/{product_id}", response_model=ProductOut)
-async def get_product_by_id(product_id: str):
-    """
-    GET /products/{product_id}
-    - Busca por _id (string). Si no existe, responde 404.
-    """
-    doc = await products_repo.find_by_id(product_id)
-    if not doc:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return _to_out(doc)
-
-
-@router.get("/by-sku/{sku}", response_model=List[ProductOut])
-async def search_products_by_sku(
-    sku: str,
-    limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
-    skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
-):
-    """
-    GET /products/by-sku/{sku}
-    - Busca productos cuyo SKU contenga el fragmento indicado (case-insensitive).
-    - Pensado para búsquedas en vivo, soporta paginación con limit/skip.
-    """
-    docs = await products_repo.find_by_sku_like(
-        sku,
-        limit=limit,
-        skip=skip,
-    )
-    if not docs:
-        raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return [_to_out(d) for d in docs]
-
-@router.get("/by-familia/{familia}", response_model=List[ProductOut])
-async def get_product_by_fam(
-    familia: str,
-    limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
-    skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
-    ):
-    docs = await products_repo.find_product_by_fam(
-        familia,
-        limit=limit,
-        skip=skip
+        sort=[(sort_field, sort_dir)],
+        after=after_id,
     )
-    if not docs:
-        raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return[_to_out(d) for d in docs]
-
-@router.get("/by-subfamilia/{subfamilia}", response_model=List[ProductOut])
-async def get_product_by_subfam(
-    subfamilia: str,
-    limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
-    skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
-    ):
-    docs = await products_repo.find_product_by_subfam(
-        subfamilia,
-        limit=limit,
-        skip=skip
-    )
-    if not docs:
-        raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return[_to_out(d) for d in docs]
-
-@router.get("/by-name/{name}", response_model=List[ProductOut])
-async def get_product_by_name(
-    name: str,
-    limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
-    skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
-    ):
-    docs = await products_repo.find_product_by_name(
-        name,
-        limit=limit,
-        skip=skip
-    )
-    if not docs:
-        raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return[_to_out(d) for d in docs]
-
-@router.get("/by-type/{tipo}", response_model=List[ProductOut])
-async def get_product_by_name(
-    tipo: str,
-    limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
-    skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
-    ):
-    docs = await products_repo.find_product_by_type(
-        tipo,
-        limit=limit,
-        skip=skip
+    out = [_to_dict(d) for d in docs]
+    if key is not None:
+        cache.set(key, out, SEARCH_CACHE_TTL_SECONDS, keep_stale=False)
+    return _page_response(out, limit, by_id)
+
+
+# Búsquedas "contiene" por un solo campo: (ruta, parámetro, campo Mongo, mayúsculas).
+# Todas comparten el mismo handler; solo cambia el campo consultado.
+SEARCH_FIELDS = [
+    ("/by-sku/{sku}", "sku", "sku", False),
+    ("/by-familia/{familia}", "familia", "dg", True),
+    ("/by-subfamilia/{subfamilia}", "subfamilia", "dsg", True),
+    ("/by-name/{name}", "name", "nombre", True),
+    ("/by-type/{tipo}", "tipo", "tipo", True),
+]
+
+
+def _make_search_handler(param: str, field: str, uppercase: bool):
+    async def handler(**params):
+        limit, skip, after = params["limit"], params["skip"], params["after"]
+        after_id = _parse_after(after, skip)
+        key = _search_cache_key(field, params[param], limit, skip, after)
+        cached = cache.get(key)
+        if cached is not None:
+            return _page_response(cached, limit)
+        docs = await products_repo.find_by_field(
+            field,
+            params[param],
+            uppercase=uppercase,
+            limit=limit,
+            skip=skip,
+            after=after_id,
+        )
+        if not docs:
+            raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
+        out = [_to_dict(d) for d in docs]
+        cache.set(key, out, SEARCH_CACHE_TTL_SECONDS, keep_stale=False)
+        return _page_response(out, limit)
+
+    # FastAPI lee los parámetros desde la firma: se expone la del endpoint original
+    handler.__signature__ = inspect.Signature([
+        inspect.Parameter(param, inspect.Parameter.KEYWORD_ONLY, annotation=str),
+        inspect.Parameter(
+            "limit", inspect.Parameter.KEYWORD_ONLY, annotation=int,
+            default=Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
+        ),
+        inspect.Parameter(
+            "skip", inspect.Parameter.KEYWORD_ONLY, annotation=int,
+            default=Query(0, ge=0, description="Desplazamiento para paginado."),
+        ),
+        inspect.Parameter(
+            "after", inspect.Parameter.KEYWORD_ONLY, annotation=Optional[str],
+            default=Query(None, description=_AFTER_QUERY_DESCRIPTION),
+        ),
+    ])
+    handler.__name__ = f"search_products_by_{param}"
+    handler.__doc__ = f"Busca productos cuyo '{field}' contenga el fragmento indicado."
+    return handler
+
+
+for _path, _param, _field, _uppercase in SEARCH_FIELDS:
+    router.add_api_route(
+        _path,
+        _make_search_handler(_param, _field, _uppercase),
+        methods=["GET"],
+        response_model=None,
+        responses=_LIST_RESPONSES,
     )
-    if not docs:
-        raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return[_to_out(d) for d in docs]
 
-@router.get("/by-mixed/", response_model=List[ProductOut])
+@router.get("/by-mixed/", response_model=None, responses=_LIST_RESPONSES)
 async def find_product_mixed(
     name: str | None = Query(None),
     dg: str | None = Query(None),
@@ -272,15 +481,19 @@ async def find_product_mixed(
     activo: bool | None = Query(None),
     limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
     skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
+    after: Optional[str] = Query(None, description=_AFTER_QUERY_DESCRIPTION),
     ):
+    after_id = _parse_after(after, skip)
 
     filtro: dict = {}
+    # Prefijos anclados y en mayúsculas (así se guardan): usan idx_nombre/idx_dg/idx_dsg.
+    # Solo con tipo/activo el filtro queda en igualdades, sin regex.
     if name:
-        filtro["nombre"]= {"$regex": f"{re.escape(name.upper())}"}
+        filtro["nombre"] = _prefix_regex(name.upper())
     if dg:
-        filtro["dg"]={"$regex": f"{re.escape(dg.upper())}"}
+        filtro["dg"] = _prefix_regex(dg.upper())
     if dsg:
-        filtro["dsg"]={"$regex": f"{re.escape(dsg.upper())}"}
+        filtro["dsg"] = _prefix_regex(dsg.upper())
     if tipo:
         filtro["tipo"]=tipo.upper()
     if activo is not None:
@@ -289,14 +502,15 @@ async def find_product_mixed(
     docs = await products_repo.find_product_mixed(
         filtro,
         limit=limit,
-        skip=skip
+        skip=skip,
+        after=after_id,
     )
     if not docs:
         raise HTTPException(status_code=404, detail="Producto(s) no encontrado(s).")
-    return[_to_out(d) for d in docs]
+    return _page_response([_to_dict(d) for d in docs], limit)
 
 # -------------------------------- Actualizar ----------------------------------
-@router.patch("/upd/{id}", response_model=ProductOut)
+@router.patch("/upd/{id}", response_model=None, responses=_ITEM_RESPONSES)
 async def update_by_id(
     id: str = Path(..., description="ObjectId del producto"),
     body: ProductPatch = ...,
@@ -317,39 +531,40 @@ async def update_by_id(
         changes["dsg"] = dsg_res.upper() or ""
         changes["codigo_sg"] = int(c_sg or 0)
 
-    to_unset = {k: "" for k, v in changes.items() if v is None}
-    to_set   = {k: v  for k, v in changes.items() if v is not None}
-
-     # 2) Derivados/control (agrega a to_set, no a 'data')
-    if "nombre" in to_set:
-        to_set["nombre_ci"] = to_set["nombre"].lower()
-    if "nombre" in to_unset:
-        # si borras nombre, también borra nombre_ci
-        to_unset["nombre_ci"] = ""
-
     # (opcional) Campos que NO se pueden actualizar
     protected = {"_id", "id"}
     if any(k in protected for k in changes):
         raise HTTPException(status_code=400, detail="Campo(s) no permitidos en update")
 
+    # 2) Diff contra el documento actual: solo se escribe lo que cambia
+    try:
+        current = await products_repo.find_by_id(id)
+    except ValueError:
+        current = None
+    if not current:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+
+    to_unset = {k: "" for k, v in changes.items() if v is None and k in current}
+    to_set   = {k: v  for k, v in changes.items() if v is not None and current.get(k) != v}
+
+    # 3) Sin cambios reales (ej: el front reenvía el formulario completo):
+    #    se evita la escritura y la relectura
+    if not to_set and not to_unset:
+        return _item_response(current)
+
     # 4) Construye el documento de update (solo operadores)
     update_doc: dict = {}
     if to_set:   update_doc["$set"] = to_set
     if to_unset: update_doc["$unset"] = to_unset
 
-    if not update_doc:  # por seguridad
-        raise HTTPException(status_code=400, detail="Nada que actualizar")
-    
-    # 4) Ejecuta update
-    modified = await products_repo.update_by_id(id, update_doc)
-
-    # 5) Lee y retorna
-    doc = await products_repo.find_by_id(id)
+    # 5) Ejecuta update y retorna el documento actualizado (un solo round-trip)
+    doc = await products_repo.update_and_get_by_id(id, update_doc)
+    _invalidate_product_cache(id)
     if not doc:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return _to_out(doc)
+    return _item_response(doc)
 # -------------------------------- Crear ----------------------------------
-@router.post("/Create/", response_model=ProductOut)
+@router.post("/Create/", response_model=None, responses=_ITEM_RESPONSES)
 async def insert_one(
     data: ProductCreate = ...,
 ):
@@ -377,9 +592,34 @@ async def insert_one(
             status_code=409,
             detail="Ya existe un producto con ese SKU."
         )
-    return _to_out(create)
+    _invalidate_product_cache(str(create["_id"]))
+    return _item_response(create)
 
 # -------------------------------- Importar ----------------------------------
+def _csv_stream(rows: Iterable[List[Any]], *, bom: bool = False, batch_size: int = 500) -> Iterator[bytes]:
+    """
+    Genera el CSV (separado por ';') por tramos de 'batch_size' filas:
+    reutiliza un único buffer que se vacía tras cada tramo, así la memoria
+    queda acotada al tramo y no al archivo completo.
+    """
+    buf = io.StringIO(newline="")
+    writer = csv.writer(buf, delimiter=";") #Se fuerza
+    if bom:
+        # BOM para que Excel abra el archivo como UTF-8 (el import acepta utf-8-sig)
+        buf.write("\ufeff")
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= batch_size:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+            pending = 0
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
 @router.get("/import/template")
 def get_import_template_csv():
     """
@@ -390,19 +630,18 @@ def get_import_template_csv():
         "NOMBRE_GRUPO","CODIGO_GRUPO","NOMBRE_SUBGRUPO","CODIGO_SUBGRUPO",
         "PRECIO_NETO","VALOR_REPOSICION","CLASIFICACION"
     ]
-    buf = io.StringIO(newline="")
-    writer = csv.writer(buf, delimiter=";") #Se fuerza
-    writer.writerow(headers)
-    writer.writerow([
-        "PT-0001","7801234567890","Detergente concentrado 5L","UN",
-        "Limpieza","1","Detergentes","10",
-        "4500","3800","PT"
-    ])
-    writer.writerow(["Este es un ejemplo, debes borrarlo antes de enviarlo, recuerda se debe enviar en formato .csv separado por punto y coma."])
-    writer.writerow(["En tipo solo existe PT y MP, deja PT (Producto Terminado) para productos con receta y MP (Materia Prima) productos sin receta."])
-    buf.seek(0)
+    rows = [
+        headers,
+        [
+            "PT-0001","7801234567890","Detergente concentrado 5L","UN",
+            "Limpieza","1","Detergentes","10",
+            "4500","3800","PT"
+        ],
+        ["Este es un ejemplo, debes borrarlo antes de enviarlo, recuerda se debe enviar en formato .csv separado por punto y coma."],
+        ["En tipo solo existe PT y MP, deja PT (Producto Terminado) para productos con receta y MP (Materia Prima) productos sin receta."],
+    ]
     return StreamingResponse(
-        io.BytesIO(buf.getvalue().encode("utf-8")),
+        _csv_stream(rows, bom=True),
         media_type="text/csv",
         headers={"Content-Disposition": 'attachment; filename="plantilla_import_productos.csv"'}
     )
@@ -410,7 +649,7 @@ def get_import_template_csv():
 @router.post("/import/validate")
 async def import_validate(
     file: UploadFile = File(...),
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    db: AsyncDatabase = Depends(get_db),
 ):
     """
     Valida un CSV separado por ';', arma preview y guarda un batch temporal (TTL).
@@ -419,144 +658,33 @@ async def import_validate(
     if not file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Solo se acepta CSV con separador ';'.")
 
-    raw = await file.read()
+    # Decodificar y parsear es CPU + lectura bloqueante del archivo subido:
+    # corre en un thread para no frenar el event loop con archivos grandes.
     try:
-        text = raw.decode("utf-8-sig")
+        parsed = await asyncio.to_thread(_parse_import_csv, file.file, "utf-8-sig")
     except UnicodeDecodeError:
-        text = raw.decode("latin-1")
-
-    first_line = text.splitlines()[0] if text else ""
-    if ";" not in first_line:
-        raise HTTPException(status_code=400, detail="El archivo debe usar ';' como separador.")
-
-    reader = csv.reader(io.StringIO(text), delimiter=';')
-    rows = list(reader)
-    if not rows:
-        raise HTTPException(status_code=400, detail="El archivo está vacío.")
-
-    headers = [h.strip() for h in rows[0]]
-    missing = [h for h in REQUIRED_HEADERS if h not in headers]
-    if missing:
-        raise HTTPException(
-            status_code=422,
-            detail=f"Faltan columnas requeridas: {', '.join(missing)}"
-        )
-
-    idx = {h: i for i, h in enumerate(headers)}
-    data_rows = rows[1:1+MAX_ROWS]
-
-    # ─────────────────────────────────────────────────────────────
-    # NUEVO: pre-pase para consultar SKUs existentes en la BD
-    # ─────────────────────────────────────────────────────────────
-    skus_in_file: list[str] = []
-    for row in data_rows:
-        i = idx.get("SKU")
-        sku_val = (row[i] if (i is not None and i < len(row)) else "") or ""
-        skus_in_file.append(sku_val.strip().upper())
-
+        file.file.seek(0)
+        parsed = await asyncio.to_thread(_parse_import_csv, file.file, "latin-1")
+    headers, preview, items_for_batch, errorsByRow, warningsByRow = parsed
+    if not items_for_batch:
+        # Sin filas no hay batch que guardar ni nada que confirmar
+        raise HTTPException(status_code=400, detail="El CSV no contiene filas de datos.")
+
+    # Una sola consulta a BD con los SKU vistos en el archivo; la advertencia
+    # se agrega después del recorrido (las listas de warnings son compartidas).
     existing_skus = await products_repo.find_existing_skus(
         db,
-        list({s for s in skus_in_file if s})
+        (it["payload"]["sku"] for it in items_for_batch),
     )
-    # ─────────────────────────────────────────────────────────────
-
-    preview: List[Dict[str, Any]] = []
-    items_for_batch: List[Dict[str, Any]] = []
-    errorsByRow: Dict[int, List[str]] = {}
-    warningsByRow: Dict[int, List[str]] = {}
-    seen_skus = set()
-
-    for r_index, row in enumerate(data_rows, start=1):
-        def val(col: str) -> Optional[str]:
-            i = idx.get(col)
-            if i is None or i >= len(row):
-                return None
-            return (row[i] or "").strip()
-
-        errs: List[str] = []
-        warns: List[str] = []
-
-        sku = (val("SKU") or "").upper()
-        nombre = val("NOMBRE") or ""
-        uom = (val("UNIDAD_MEDIDA") or "").upper()
-        clasif = (val("CLASIFICACION") or "").upper()
-
-        if not sku: errs.append("SKU es requerido.")
-        if not nombre: errs.append("NOMBRE es requerido.")
-        if not uom: errs.append("UNIDAD_MEDIDA es requerida.")
-        if clasif not in ("MP", "PT"):
-            errs.append("CLASIFICACION debe ser MP o PT.")
-
-        if sku in seen_skus:
-            errs.append("SKU duplicado en el archivo.")
-        seen_skus.add(sku)
-
-        # ─────────────────────────────────────────────────────────
-        # NUEVO: advertir si ese SKU ya existe en la base de datos
-        # ─────────────────────────────────────────────────────────
+    for it in items_for_batch:
+        sku = it["payload"]["sku"]
         if sku and sku in existing_skus:
+            warns = it["warnings"]
             warns.append(f"SKU '{sku}' ya existe en la base de datos; se actualizará en la confirmación.")
-        # ─────────────────────────────────────────────────────────
-
-        pneto = _to_int(val("PRECIO_NETO"), 0)
-        if pneto <= 0:
-            errs.append("PRECIO_NETO debe ser mayor a 0.")
-
-        dg = val("NOMBRE_GRUPO") or ""
-        dsg = val("NOMBRE_SUBGRUPO") or ""
-        codigo_g = _to_int(val("CODIGO_GRUPO"), 0)
-        codigo_sg = _to_int(val("CODIGO_SUBGRUPO"), 0)
-
-        cod_g_res, cod_sg_res, dg_res, dsg_res = resolve_codes(dg, dsg, codigo_g, codigo_sg)
-
-        if not dg and not codigo_g:
-            errs.append("Debe informar NOMBRE_GRUPO o CODIGO_GRUPO.")
-        if not dsg and not codigo_sg:
-            errs.append("Debe informar NOMBRE_SUBGRUPO o CODIGO_SUBGRUPO.")
-
-        c_barra = _to_int(val("CODIGO_BARRA"), 0)
-        valor_repo = _to_int(val("VALOR_REPOSICION"), 0)  # opcional
-
-        payload = {
-            "nombre": nombre.upper(),
-            "nombre_ci": nombre.lower(),
-            "sku": sku,
-            "c_barra": c_barra,
-            "unidad": uom.upper(),
-            "dg": dg_res.upper() or "",
-            "codigo_g": int(cod_g_res or 0),
-            "dsg": dsg_res.upper() or "",
-            "codigo_sg": int(cod_sg_res or 0),
-            "pneto": pneto,
-            "piva": int(round(pneto * 1.19)),
-            "tipo": clasif.upper(),
-            "valor_repo": str(valor_repo),
-        }
-
-        if errs:
-            errorsByRow[r_index] = errs
-        if warns:
-            warningsByRow[r_index] = warns
-
-        if len(preview) < PREVIEW_LIMIT:
-            preview.append({**payload, "__row": r_index})
-
-        items_for_batch.append({
-            "row": r_index,
-            "payload": payload,
-            "errors": errs,
-            "warnings": warns,
-        })
-
-    # Guardamos batch en Mongo vía repositorio (con TTL)
-    batch_id = await products_repo.save_import_batch(db, items_for_batch, ttl_minutes=30)
+            warningsByRow[it["row"]] = warns
 
-    columns_out = ["FILA", *headers]
-    rows_out = []
-    for row in preview:
-        r = {"FILA": row.get("__row")}
-        r.update({k: row.get(k) for k in headers})
-        rows_out.append(r)
+    # Guardamos batch temporal vía repositorio (con TTL)
+    batch_id = await products_repo.save_import_batch(db, items_for_batch, ttl_minutes=30)
 
     return JSONResponse({
         "batchId": batch_id,
@@ -582,49 +710,77 @@ async def import_validate(
 @router.post("/import/confirm")
 async def import_confirm(
     data: Dict[str, Any] = Body(...),
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    db: AsyncDatabase = Depends(get_db),
 ):
     """
     Confirma un batch validado:
-    - Lee el batch (repo), filtra filas con error
+    - Recorre el batch por lotes (repo), filtra filas con error
     - Fuerza activo=True
-    - Ejecuta bulk upsert por SKU (repo)
+    - Ejecuta bulk upsert por SKU (repo) en cada lote
     - Borra el batch
     """
     batch_id = data.get("batchId")
     if not batch_id:
         raise HTTPException(status_code=400, detail="Falta batchId")
 
-    batch = await products_repo.get_import_batch(db, batch_id)
-    if not batch:
+    # Los ítems se leen y se escriben por lotes: el batch nunca se carga completo
+    found = False
+    created = updated = skipped = 0
+    errors: List[Dict[str, Any]] = []
+    async for items in products_repo.iter_import_batch(db, batch_id):
+        found = True
+        docs: List[Dict[str, Any]] = []
+        row_by_sku: Dict[str, Any] = {}
+        for it in items:
+            if it.get("errors"):
+                skipped += 1
+                continue
+            doc = dict(it["payload"])
+            doc["activo"] = True  # regla: todos se crean/habilitan activos
+            sku = (doc.get("sku") or "").strip().upper()
+            if not sku:
+                skipped += 1
+                continue
+            docs.append(doc)
+            row_by_sku[sku] = it.get("row")
+
+        c, u, unchanged, errs = await products_repo.bulk_upsert_products_by_sku(db, docs)
+        created += c
+        updated += u
+        skipped += unchanged
+        # Cada error indica el SKU y la fila del CSV que falló
+        errors.extend({"row": row_by_sku.get(e["sku"]), **e} for e in errs)
+
+    if not found:
         raise HTTPException(status_code=404, detail="Batch no encontrado o expirado")
 
-    items = batch.get("items", [])
-    if not items:
-        await products_repo.delete_import_batch(db, batch_id)
-        return {"ok": True, "created": 0, "updated": 0, "skipped": 0}
-
-    docs: List[Dict[str, Any]] = []
-    skipped = 0
-    for it in items:
-        if it.get("errors"):
-            skipped += 1
-            continue
-        doc = dict(it["payload"])
-        doc["activo"] = True  # regla: todos se crean/habilitan activos
-        sku = (doc.get("sku") or "").strip().upper()
-        if not sku:
-            skipped += 1
-            continue
-        docs.append(doc)
-
-    try:
-        created, updated = await products_repo.bulk_upsert_products_by_sku(db, docs)
-    except BulkWriteError as bwe:
-        # Caso de conflicto masivo u otros errores del bulk
-        raise HTTPException(status_code=400, detail=str(bwe.details))
+    _invalidate_product_cache()
+    if errors and not (created or updated):
+        # Nada se escribió: se mantiene el batch para reintentar
+        raise HTTPException(status_code=400, detail=errors)
 
     # Limpieza del batch
     await products_repo.delete_import_batch(db, batch_id)
 
+    if errors:
+        # Éxito parcial: se informan los conteos reales y las filas que fallaron
+        return {"ok": False, "created": created, "updated": updated, "skipped": skipped, "errors": errors}
     return {"ok": True, "created": created, "updated": updated, "skipped": skipped}
+
+
+# ------------------------- Producto completo por id --------------------------
+# Se registra al final: '/{product_id}' atrapa cualquier ruta de un segmento
+# (ej: '/by-mixed' sin barra final), así que las rutas fijas deben ir antes.
+@router.get("/{product_id}", response_model=None, responses=_ITEM_RESPONSES)
+async def get_product(product_id: str):
+    """
+    GET /products/{product_id}
+    - Documento completo por _id. Id inválido o inexistente responde 404.
+    """
+    try:
+        doc = await products_repo.find_by_id(product_id)
+    except ValueError:
+        doc = None
+    if not doc:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return _item_response(doc)
@@ -1,21 +1,29 @@
 # app/api/v1/recipes.py
 from __future__ import annotations
 
+import asyncio
+import csv
+import hashlib
+import io
 import re
+import uuid
+from functools import lru_cache
+from itertools import islice
 from typing import List, Optional, Literal
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from pydantic import BaseModel, ConfigDict, Field
+import orjson
 from bson import ObjectId
-from datetime import datetime , timezone
-from fastapi.responses import StreamingResponse
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query, Depends, Request, Response, UploadFile, File
 from fastapi.responses import PlainTextResponse
-import csv, io
+from pydantic import BaseModel, ConfigDict, Field
 
 from app.db.mongo import get_db
 from app.db.repositories import recipes_repo
 from app.services import recipes_service
 from app.services import recipes_valuation
+from app.utils import cache
+from app.utils.json_body import openapi_body, parse_body
 
 # Schemas de entrada (request) para crear/actualizar
 from app.models.recipes import (
@@ -37,22 +45,119 @@ class RecipeOut(BaseModel):
     model_config = ConfigDict(extra="allow")
 
 # --------------------------- Helpers de serialización ------------------------
-def bson_to_py(value):
-    """Convierte ObjectId a str de manera recursiva para respuestas JSON."""
-    if isinstance(value, ObjectId):
+def _oid_default(value):
+    """
+    Hook de orjson: ObjectId (incluso anidados en versiones/componentes) -> str.
+    orjson solo lo llama para tipos no nativos (str/int/float/bool/None/datetime,
+    dict y list se serializan sin pasar por Python).
+    """
+    if type(value) is ObjectId:
         return str(value)
-    if isinstance(value, list):
-        return [bson_to_py(v) for v in value]
-    if isinstance(value, dict):
-        return {k: bson_to_py(v) for k, v in value.items()}
-    return value
-
-def _to_out_dict(doc: dict) -> dict:
-    """Transforma un doc Mongo a un dict API-friendly, renombrando _id -> id."""
-    data = bson_to_py(doc)
-    if "_id" in data:
-        data["id"] = data.pop("_id")
-    return data
+    raise TypeError
+
+def _json_response(content) -> Response:
+    """
+    Serializa con orjson; los ObjectId anidados los resuelve _oid_default.
+    Sin OPT_NON_STR_KEYS: las claves de documentos BSON siempre son str y la
+    opción saca a orjson de su camino rápido para dicts.
+    """
+    return Response(
+        orjson.dumps(content, default=_oid_default),
+        media_type="application/json",
+    )
+
+def _list_response(docs: List[dict], limit: Optional[int] = None) -> Response:
+    """
+    Respuesta para listados: solo renombra _id -> id en el primer nivel y
+    serializa con orjson, sin recorrer cada doc en Python ni revalidar con
+    response_model.
+    - Con 'limit' y página completa agrega X-Next-Cursor (id del último item),
+      que el cliente reenvía como 'after'. Solo aplica a listados por _id.
+    """
+    for d in docs:
+        if "_id" in d:
+            d["id"] = d.pop("_id")
+    resp = _json_response(docs)
+    if limit and docs and len(docs) >= limit:
+        resp.headers[NEXT_CURSOR_HEADER] = str(docs[-1]["id"])
+    return resp
+
+def _item_response(doc: dict) -> Response:
+    """Igual que _list_response para una receta (doc Mongo o mapeado por el service)."""
+    if "_id" in doc:
+        doc["id"] = doc.pop("_id")
+    return _json_response(doc)
+
+@lru_cache(maxsize=512)
+def _prefix_pattern(q: str) -> str:
+    """
+    Prefijo anclado (^q) sobre 'nombre_ci' (ya en minúsculas): sin flag 'i',
+    Mongo recorre solo el rango de idx_nombre_ci en vez de toda la colección.
+    """
+    return "^" + re.escape(q.lower())
+
+# ------------------------------ Paginado ------------------------------------
+# Más allá de este skip se exige paginar por cursor (after=<id del último item>).
+MAX_SKIP = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+_AFTER_DESCRIPTION = "Cursor: id del último item recibido (header X-Next-Cursor). Ignora skip."
+
+def _parse_after(after: Optional[str], skip: int) -> Optional[ObjectId]:
+    if after:
+        try:
+            return ObjectId(after)
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=400, detail="Cursor 'after' inválido")
+    if skip > MAX_SKIP:
+        raise HTTPException(
+            status_code=400,
+            detail=f"skip máximo {MAX_SKIP}; usa after=<id del último item> para paginar más allá.",
+        )
+    return None
+
+# Listados: por defecto sin el BOM de cada versión (la vista de lista no lo
+# usa y es la parte pesada del documento). ?fields=a,b,c pide campos puntuales.
+_LIST_DEFAULT_PROJECTION = {"versiones.componentes": 0}
+_FIELDS_DESCRIPTION = (
+    "Campos a devolver separados por coma (ej: 'nombre,vigenteVersion,versiones'). "
+    "Por defecto se omite versiones.componentes."
+)
+
+def _list_projection(fields: Optional[str]) -> dict:
+    if not fields:
+        return _LIST_DEFAULT_PROJECTION
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    wanted.discard("id")  # _id siempre viene
+    return {f: 1 for f in wanted} or _LIST_DEFAULT_PROJECTION
+
+# ------------------------------- Cache ---------------------------------------
+# Lecturas por SKU / PT: las pide el front después de cada mutación y la
+# receta cambia poco. TTL corto para acotar lo stale; las escrituras de este
+# router invalidan todo el prefijo (una receta se cachea bajo varias claves).
+RECIPE_CACHE_TTL_SECONDS = 5
+RECIPE_CACHE_PREFIX = "recipe:"
+
+def _recipe_cache_key(kind: str, ref: str) -> str:
+    return f"{RECIPE_CACHE_PREFIX}{kind}:{ref}"
+
+def _invalidate_recipe_cache() -> None:
+    cache.clear_prefix(RECIPE_CACHE_PREFIX)
+
+def _write_response(doc: dict) -> Response:
+    """_item_response para escrituras: invalida antes las lecturas cacheadas."""
+    _invalidate_recipe_cache()
+    return _item_response(doc)
+
+def _model_response(model: BaseModel) -> Response:
+    """
+    Respuesta de un modelo ya validado en el handler: se serializa una vez en
+    pydantic-core, sin que FastAPI lo vuelva a pasar por response_model.
+    """
+    return Response(model.model_dump_json(), media_type="application/json")
+
+# Documentan el esquema en OpenAPI sin validar la respuesta en runtime
+_LIST_RESPONSES = {200: {"model": List[RecipeOut]}}
+_ITEM_RESPONSES = {200: {"model": RecipeOut}}
 
 # ========================= MODELOS PARA VALORIZACIÓN =========================
 class ValueRecipeIn(BaseModel):
@@ -79,11 +184,11 @@ class ValueRecipeOut(BaseModel):
     warnings: List[str] = []
 
 # -------------------------------- Listado ------------------------------------
-@router.get("", response_model=List[RecipeOut])
+@router.get("", response_model=None, responses=_LIST_RESPONSES)
 async def list_recipes(
     q: Optional[str] = Query(
         None,
-        description="Filtro simple por nombre (regex, case-insensitive)."
+        description="Filtro simple por prefijo del nombre (case-insensitive)."
     ),
     limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
     skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
@@ -93,79 +198,96 @@ async def list_recipes(
     sort_dir: Optional[Literal[-1, 1]] = Query(
         None, description="Dirección de orden: 1 asc, -1 desc."
     ),
+    fields: Optional[str] = Query(None, description=_FIELDS_DESCRIPTION),
+    after: Optional[str] = Query(None, description=_AFTER_DESCRIPTION),
 ):
     """
     GET /recipes
     - Construye un filtro simple (por nombre si viene 'q').
-    - Llama al repositorio para traer documentos paginados y ordenados.
+    - Llama al repositorio para traer documentos paginados y ordenados
+      (por _id si no se indica sort_field).
     - Serializa cada doc para exponer 'id' en lugar de '_id'.
+    - Con 'after' pagina por cursor (orden por _id).
     """
+    after_id = _parse_after(after, skip)
+    if sort_field is None or sort_dir is None or after_id is not None:
+        sort_field, sort_dir = "_id", 1
+    by_id = sort_field == "_id" and sort_dir == 1
+
     filtro = {}
     if q:
-        # Búsqueda por nombre con regex (case-insensitive)
-        filtro = {"nombre": {"$regex": q, "$options": "i"}}
-
-    sort = [(sort_field, sort_dir)] if (sort_field is not None and sort_dir is not None) else None
+        # Búsqueda por prefijo de nombre (case-insensitive vía nombre_ci)
+        filtro = {"nombre_ci": {"$regex": _prefix_pattern(q.strip())}}
 
     docs = await recipes_repo.find_all(
         filtro=filtro,
         limit=limit,
         skip=skip,
-        sort=sort,
+        sort=[(sort_field, sort_dir)],
+        projection=_list_projection(fields),
+        after=after_id,
     )
-    return [_to_out_dict(d) for d in docs]
+    return _list_response(docs, limit if by_id else None)
 
 # ----------------------------- Búsqueda like ---------------------------------
-@router.get("/like-name/{name}", response_model=List[RecipeOut])
+@router.get("/like-name/{name}", response_model=None, responses=_LIST_RESPONSES)
 async def get_like_name(
     name: str,
     limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
     skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
+    fields: Optional[str] = Query(None, description=_FIELDS_DESCRIPTION),
+    after: Optional[str] = Query(None, description=_AFTER_DESCRIPTION),
 ):
     """
     GET /recipes/like-name/{name}
-    - Búsqueda %name% (case-insensitive) sobre 'nombre_ci'
+    - Búsqueda %name% (case-insensitive) sobre 'nombre_ci', ordenada por _id
     """
     docs = await recipes_repo.find_like(
         name,
         limit=limit,
-        skip=skip
+        skip=skip,
+        after=_parse_after(after, skip),
+        projection=_list_projection(fields),
     )
     if not docs:
         raise HTTPException(status_code=404, detail="Receta(s) no encontradas.")
-    return [_to_out_dict(d) for d in docs]
+    return _list_response(docs, limit)
 
 # ----------------------------- Búsqueda mixta --------------------------------
-@router.get("/by-mixed/", response_model=List[RecipeOut])
+@router.get("/by-mixed/", response_model=None, responses=_LIST_RESPONSES)
 async def find_product_mixed(
     name: str | None = Query(None),
     productPTId: str | None = Query(None),
     estado: str | None = Query(None),
     limit: int = Query(20, ge=1, le=1000, description="Máximo de items a devolver."),
     skip: int = Query(0, ge=0, description="Desplazamiento para paginado."),
+    fields: Optional[str] = Query(None, description=_FIELDS_DESCRIPTION),
+    after: Optional[str] = Query(None, description=_AFTER_DESCRIPTION),
 ):
     """
     GET /recipes/by-mixed
-    - Filtro mixto por nombre_ci, productPTId (regex), y estado dentro de versiones
+    - Filtro mixto por prefijo de nombre_ci, productPTId (regex), y estado dentro de versiones
     """
     filtro: dict = {}
     if name:
-        filtro["nombre_ci"] = {"$regex": f"{re.escape(name.lower())}"}
+        filtro["nombre_ci"] = {"$regex": _prefix_pattern(name.strip())}
     if estado:
         filtro["versiones.estado"] = {"$regex": f"{re.escape(estado.lower())}"}
 
     docs = await recipes_repo.find_product_mixed(
         filtro,
         limit=limit,
-        skip=skip
+        skip=skip,
+        after=_parse_after(after, skip),
+        projection=_list_projection(fields),
     )
     if not docs:
         raise HTTPException(status_code=404, detail="Receta(s) no encontradas.")
-    return [_to_out_dict(d) for d in docs]
+    return _list_response(docs, limit)
 
 # --------------------------- Crear receta (PT) --------------------------------
-@router.post("", response_model=RecipeOut)
-async def create_recipe(body: CreateRecetaIn, db=Depends(get_db)):
+@router.post("", response_model=None, responses=_ITEM_RESPONSES, openapi_extra=openapi_body(CreateRecetaIn))
+async def create_recipe(request: Request, db=Depends(get_db)):
     """
     POST /recipes
     Crea una receta para un PT con su primera versión.
@@ -173,27 +295,29 @@ async def create_recipe(body: CreateRecetaIn, db=Depends(get_db)):
     - Proceso opcional (catálogo o especial)
     - Defaults: fechaPublicacion=hoy (si no viene), mermaPct=0
     """
+    body = await parse_body(request, CreateRecetaIn)
     try:
         doc = await recipes_service.create_recipe(db, body)
-        return doc  # ya viene con ids stringeados desde el service
+        return _write_response(doc)  # el service ya expone "id"; orjson convierte los ObjectId
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # --------------------------- Agregar nueva versión ---------------------------
-@router.post("/{skuPT}/versions", response_model=RecipeOut)
-async def add_version(skuPT: str, body: RecetaVersionIn, db=Depends(get_db)):
+@router.post("/{skuPT}/versions", response_model=None, responses=_ITEM_RESPONSES, openapi_extra=openapi_body(RecetaVersionIn))
+async def add_version(skuPT: str, request: Request, db=Depends(get_db)):
     """
     POST /recipes/{skuPT}/versions
     Agrega una NUEVA versión a la receta existente del PT.
     """
+    body = await parse_body(request, RecetaVersionIn)
     try:
         doc = await recipes_service.add_version(db, skuPT, body)
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # --------------------------- Marcar versión vigente --------------------------
-@router.put("/{skuPT}", response_model=RecipeOut)
+@router.put("/{skuPT}", response_model=None, responses=_ITEM_RESPONSES)
 async def set_vigente(skuPT: str, body: UpdateRecetaIn, db=Depends(get_db)):
     """
     PUT /recipes/{skuPT}
@@ -203,16 +327,16 @@ async def set_vigente(skuPT: str, body: UpdateRecetaIn, db=Depends(get_db)):
         raise HTTPException(status_code=422, detail="vigenteVersion requerido")
     try:
         doc = await recipes_service.set_vigente(db, skuPT, int(body.vigenteVersion))
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # --------------------------- Update versión completa -------------------------
-@router.put("/{skuPT}/versions/{version}", response_model=RecipeOut)
+@router.put("/{skuPT}/versions/{version}", response_model=None, responses=_ITEM_RESPONSES, openapi_extra=openapi_body(UpdateRecetaVersionIn))
 async def update_version_full(
     skuPT: str,
     version: int,
-    body: UpdateRecetaVersionIn,
+    request: Request,
     db=Depends(get_db),
 ):
     """
@@ -220,32 +344,34 @@ async def update_version_full(
     Actualiza campos de una versión específica. Si envías 'componentes',
     se reemplaza la lista completa (agrupa y suma duplicados por MP).
     """
+    body = await parse_body(request, UpdateRecetaVersionIn)
     try:
         doc = await recipes_service.update_version_full(db, skuPT, version, body)
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # --------------------------- Reemplazar componentes --------------------------
-@router.patch("/{skuPT}/versions/{version}/componentes", response_model=RecipeOut)
+@router.patch("/{skuPT}/versions/{version}/componentes", response_model=None, responses=_ITEM_RESPONSES, openapi_extra=openapi_body(UpdateComponentesIn))
 async def replace_componentes(
     skuPT: str,
     version: int,
-    body: UpdateComponentesIn,
+    request: Request,
     db=Depends(get_db),
 ):
     """
     PATCH /recipes/{skuPT}/versions/{version}/componentes
     Reemplaza COMPLETAMENTE los componentes de una versión (BOM).
     """
+    body = await parse_body(request, UpdateComponentesIn)
     try:
         doc = await recipes_service.replace_componentes(db, skuPT, version, body)
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # ============================ VALORIZACIÓN (NUEVO) ===========================
-@router.post("/{skuPT}/versions/{version}/valorizar:preview", response_model=ValueRecipeOut)
+@router.post("/{skuPT}/versions/{version}/valorizar:preview", response_model=None, responses={200: {"model": ValueRecipeOut}})
 async def value_version_preview(
     skuPT: str,
     version: int,
@@ -261,11 +387,11 @@ async def value_version_preview(
     """
     try:
         result = await recipes_valuation.value_version(db, skuPT, version, body.cost_method, body.currency, persist=False)
-        return ValueRecipeOut(**result)
+        return _model_response(ValueRecipeOut.model_validate(result))
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
-@router.post("/{skuPT}/versions/{version}/valorizar", response_model=ValueRecipeOut)
+@router.post("/{skuPT}/versions/{version}/valorizar", response_model=None, responses={200: {"model": ValueRecipeOut}})
 async def value_version_persist(
     skuPT: str,
     version: int,
@@ -278,43 +404,56 @@ async def value_version_persist(
     """
     try:
         result = await recipes_valuation.value_version(db, skuPT, version, "pneto", body.currency, persist=True)
-        return ValueRecipeOut(**result)
+        _invalidate_recipe_cache()
+        return _model_response(ValueRecipeOut.model_validate(result))
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
 # ------------------------ Obtener receta por productPTId ---------------------
-@router.get("/by-pt-id/{pt_ref}", response_model=RecipeOut)
+@router.get("/by-pt-id/{pt_ref}", response_model=None, responses=_ITEM_RESPONSES)
 async def get_recipe_by_pt_id(pt_ref: str, db=Depends(get_db)):
     """
     GET /recipes/by-pt-id/{pt_ref}
     Permite buscar la receta usando el ObjectId del PT o directamente su SKU.
     """
+    key = _recipe_cache_key("pt", pt_ref)
+    cached = cache.get(key)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
     try:
         doc = await recipes_service.get_recipe_by_pt_id(db, pt_ref)
-        return doc
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    resp = _item_response(doc)
+    cache.set(key, resp.body, RECIPE_CACHE_TTL_SECONDS, keep_stale=False)
+    return resp
 
 # --------------------------- Obtener receta por SKU PT -----------------------
 # IMPORTANTE: este endpoint debe ir al final (para no interferir con rutas anteriores).
-@router.get("/{skuPT}", response_model=RecipeOut)
+@router.get("/{skuPT}", response_model=None, responses=_ITEM_RESPONSES)
 async def get_recipe_by_sku(skuPT: str, db=Depends(get_db)):
     """
     GET /recipes/{skuPT}
     Obtiene la receta (todas sus versiones) por SKU del Producto Terminado.
     """
+    key = _recipe_cache_key("sku", skuPT)
+    cached = cache.get(key)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
     try:
         doc = await recipes_service.get_recipe_by_sku(db, skuPT)
-        return doc
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    resp = _item_response(doc)
+    cache.set(key, resp.body, RECIPE_CACHE_TTL_SECONDS, keep_stale=False)
+    return resp
 
 # ===================== HABILITAR / DESHABILITAR VERSIONES ====================
 
 class EnableIn(BaseModel):
     version: int = Field(..., ge=1, description="Número de versión a habilitar")
 
-@router.post("/{skuPT}/enable", response_model=RecipeOut)
+@router.post("/{skuPT}/enable", response_model=None, responses=_ITEM_RESPONSES)
 async def enable_recipe(skuPT: str, body: EnableIn, db=Depends(get_db)):
     """
     Fija la versión indicada como 'vigente'.
@@ -324,98 +463,73 @@ async def enable_recipe(skuPT: str, body: EnableIn, db=Depends(get_db)):
     """
     try:
         doc = await recipes_service.set_vigente(db, skuPT, int(body.version))
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
-@router.post("/{skuPT}/disable", response_model=RecipeOut)
+async def _get_pt_id(db, skuPT: str) -> ObjectId:
+    pt = await recipes_repo.get_pt_by_sku(skuPT, db)
+    if not pt:
+        raise HTTPException(status_code=404, detail="PT no encontrado")
+    return pt["_id"]
+
+@router.post("/{skuPT}/disable", response_model=None, responses=_ITEM_RESPONSES)
 async def disable_current_vigente(skuPT: str, db=Depends(get_db)):
     """
     Deshabilita la versión vigente actual del PT:
     - Si hay 'vigenteVersion', la marca 'obsoleta'
     - Limpia 'vigenteVersion' (unset)
     """
-    # Traer receta por skuPT
-    try:
-        rec = await recipes_service.get_recipe_by_sku(db, skuPT)
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-
-    vigente = rec.get("vigenteVersion")
-    if vigente is None:
-        # Idempotente: nada que deshabilitar
-        return rec
+    pt_id = await _get_pt_id(db, skuPT)
+    # Marcar vigente como obsoleta y limpiar vigenteVersion en un solo update
+    cleaned = await recipes_repo.disable_version(pt_id, db=db)
+    if cleaned is not None:
+        return _write_response(cleaned)
 
-    # Marcar vigente como obsoleta
-    updated = await recipes_repo.update_version_estado(
-        recipe_id=ObjectId(rec["id"]),
-        version_num=int(vigente),
-        nuevo_estado="obsoleta",
-        db=db,
-    )
-    # Unset de vigenteVersion
-    cleaned = await recipes_repo.clear_vigente_version(
-        recipe_id=ObjectId(rec["id"]),
-        db=db,
-    )
-    return _to_out_dict(cleaned)
+    # Sin vigente (idempotente: nada que deshabilitar) o sin receta
+    rec = await recipes_repo.find_by_pt_id(pt_id, db=db)
+    if rec is None:
+        raise HTTPException(status_code=404, detail="Receta no encontrada")
+    return _item_response(rec)
 
-@router.post("/{skuPT}/versions/{version}/enable", response_model=RecipeOut)
+@router.post("/{skuPT}/versions/{version}/enable", response_model=None, responses=_ITEM_RESPONSES)
 async def enable_specific_version(skuPT: str, version: int, db=Depends(get_db)):
     """
     Habilita específicamente la versión indicada (alias de set_vigente).
     """
     try:
         doc = await recipes_service.set_vigente(db, skuPT, int(version))
-        return doc
+        return _write_response(doc)
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
 
-@router.post("/{skuPT}/versions/{version}/disable", response_model=RecipeOut)
+@router.post("/{skuPT}/versions/{version}/disable", response_model=None, responses=_ITEM_RESPONSES)
 async def disable_specific_version(skuPT: str, version: int, db=Depends(get_db)):
     """
     Deshabilita (marca 'obsoleta') la versión indicada. Si era la vigente, también limpia 'vigenteVersion'.
     """
-    # Traer receta por skuPT
-    try:
-        rec = await recipes_service.get_recipe_by_sku(db, skuPT)
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-
-    versiones = rec.get("versiones", [])
-    if not any(int(v.get("version")) == int(version) for v in versiones):
-        raise HTTPException(status_code=422, detail=f"La versión {version} no existe para este PT")
-
-    # Marcar la versión como obsoleta
-    await recipes_repo.update_version_estado(
-        recipe_id=ObjectId(rec["id"]),
-        version_num=int(version),
-        nuevo_estado="obsoleta",
-        db=db,
-    )
-
-    # Si era la vigente, limpiar vigenteVersion
-    if rec.get("vigenteVersion") is not None and int(rec["vigenteVersion"]) == int(version):
-        cleaned = await recipes_repo.clear_vigente_version(
-            recipe_id=ObjectId(rec["id"]),
-            db=db,
-        )
-        return _to_out_dict(cleaned)
+    pt_id = await _get_pt_id(db, skuPT)
+    # El filtro exige que la versión exista; si era la vigente, el mismo update
+    # limpia vigenteVersion
+    updated = await recipes_repo.disable_version(pt_id, int(version), db=db)
+    if updated is not None:
+        return _write_response(updated)
 
-    # Si no era la vigente, devolver doc actualizado
-    updated = await recipes_repo.find_by_id(rec["id"], db=db)
-    return _to_out_dict(updated)
+    exists = await recipes_repo.find_by_pt_id(pt_id, db=db)
+    if exists is None:
+        raise HTTPException(status_code=404, detail="Receta no encontrada")
+    raise HTTPException(status_code=422, detail=f"La versión {version} no existe para este PT")
 
 # --- IMPORT CSV ---
-from fastapi import UploadFile, File, Form
-import csv, io, uuid
+# Filas por lote al leer el CSV e insertarlo en staging.
+_STAGE_BATCH_ROWS = 1000
 
 class ImportStageOut(BaseModel):
     batch_id: str
     inserted: int
     warnings: List[str] = []
 
-@router.post("/import/csv:stage", response_model=ImportStageOut)
+@router.post("/import/csv:stage", response_model=None, responses={200: {"model": ImportStageOut}})
 async def import_csv_stage(
     file: UploadFile = File(...),
     db=Depends(get_db),
@@ -426,27 +540,65 @@ async def import_csv_stage(
       sku_MP,cantidad_por_base,unidad_MP,merma_pct,process_codigo,process_especial_nombre,
       process_especial_costo,fecha_publicacion,publicado_por,notas
     """
-    content = await file.read()
-    text = content.decode("utf-8", errors="ignore")
-    reader = csv.DictReader(io.StringIO(text))
-    rows = [r for r in reader]
-
-    if not rows:
+    # Lectura en streaming: el archivo se decodifica y parsea por lotes en un
+    # thread (la lectura del archivo subido es bloqueante), sin cargarlo entero.
+    # csv.reader (C) + columnas resueltas una vez: un solo dict por fila, ya
+    # con las columnas permitidas, en vez de DictReader + limpieza posterior.
+    wrapper = io.TextIOWrapper(file.file, encoding="utf-8-sig", errors="ignore", newline="")
+    pending: Optional[asyncio.Task] = None
+    try:
+        reader = csv.reader(wrapper)
+        header = await asyncio.to_thread(next, reader, None)
+        columns = recipes_repo.staging_columns(header or [])
+        batch_id = str(uuid.uuid4())
+        total_rows = 0
+        inserted = 0
+        warnings: List[str] = []
+
+        def read_batch() -> List[List[str]]:
+            return list(islice(reader, _STAGE_BATCH_ROWS))
+
+        while True:
+            raw = await asyncio.to_thread(read_batch)
+            if not raw:
+                break
+            # Las líneas en blanco se omiten (igual que DictReader)
+            rows = [recipes_repo.staging_row(row, columns) for row in raw if row]
+            if not rows:
+                continue
+            total_rows += len(rows)
+            # Pipeline: el insert de este lote corre mientras se lee el siguiente
+            if pending is not None:
+                ins, warns = await pending
+                inserted += ins
+                warnings.extend(warns)
+            pending = asyncio.create_task(
+                recipes_repo.stage_insert_rows(rows, batch_id=batch_id, db=db)
+            )
+        if pending is not None:
+            ins, warns = await pending
+            inserted += ins
+            warnings.extend(warns)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+        # No cerrar el archivo subido al liberar el wrapper
+        wrapper.detach()
+
+    if not total_rows:
         raise HTTPException(status_code=422, detail="CSV vacío")
 
-    batch_id = str(uuid.uuid4())
-    ins, warnings = await recipes_repo.stage_insert_rows(rows, batch_id=batch_id, db=db)
-    return ImportStageOut(batch_id=batch_id, inserted=ins, warnings=warnings)
+    return _model_response(ImportStageOut(batch_id=batch_id, inserted=inserted, warnings=warnings))
 
 class ImportStatusOut(BaseModel):
     batch_id: str
     total: int
     first_rows: List[dict]
 
-@router.get("/import/csv:status", response_model=ImportStatusOut)
+@router.get("/import/csv:status", response_model=None, responses={200: {"model": ImportStatusOut}})
 async def import_csv_status(batch_id: str = Query(...), db=Depends(get_db)):
     total, sample = await recipes_repo.stage_status(batch_id=batch_id, db=db)
-    return ImportStatusOut(batch_id=batch_id, total=total, first_rows=sample)
+    return _model_response(ImportStatusOut(batch_id=batch_id, total=total, first_rows=sample))
 
 class PromoteIn(BaseModel):
     batch_id: str
@@ -463,58 +615,71 @@ class PromoteOut(BaseModel):
     warnings: List[str]
     errores: List[str]
 
-@router.post("/import/csv:promote", response_model=PromoteOut)
-async def import_csv_promote(body: PromoteIn, db=Depends(get_db)):
+@router.post(
+    "/import/csv:promote",
+    response_model=None,
+    responses={200: {"model": PromoteOut}},
+    openapi_extra=openapi_body(PromoteIn),
+)
+async def import_csv_promote(request: Request, db=Depends(get_db)):
+    body = await parse_body(request, PromoteIn)
     res = await recipes_service.promote_staging_batch(
         db=db,
         batch_id=body.batch_id,
         overwrite_version=body.overwrite_version,
         dry_run=body.dry_run,
     )
-    return PromoteOut(**res)
+    if not body.dry_run:
+        _invalidate_recipe_cache()
+    return _model_response(PromoteOut.model_validate(res))
 
 @router.delete("/import/csv:stage/{batch_id}")
 async def import_csv_clear(batch_id: str, db=Depends(get_db)):
     deleted = await recipes_repo.stage_clear(batch_id=batch_id, db=db)
     return {"batch_id": batch_id, "deleted": deleted}
 
-@router.get("/import/csv:template")
-async def download_recipes_csv_template(sample: bool = False):
-    """
-    Devuelve la plantilla CSV para importar recetas.
-    - ?sample=true incluye 2-3 filas de ejemplo
-    """
-    # Encabezados EXACTOS (coinciden con staging)
-    headers = [
-        "sku_PT","version","estado","marcar_vigente","base_qty","unidad_PT",
-        "sku_MP","cantidad_por_base","unidad_MP","merma_pct",
-        "process_codigo","process_especial_nombre","process_especial_costo",
-        "fecha_publicacion","publicado_por","notas"
-    ]
+# Encabezados EXACTOS: los mismos que acepta staging
+_TEMPLATE_HEADERS = recipes_repo.STAGING_COLUMNS
 
-    # Buffer en memoria
+# Filas de ejemplo (una fila por componente)
+_TEMPLATE_SAMPLE_ROWS = [
+    ["301002", 1, "borrador", "true", 1, "un", "801007", 10, "kg", 2, "PROC-ABC", "", "", "2025-10-13", "import_csv", "Receta base v1"],
+    ["301002", 1, "borrador", "true", 1, "un", "901576", 1, "un", 0, "PROC-ABC", "", "", "2025-10-13", "import_csv", ""],
+    ["500100", 1, "borrador", "false", 10, "kg", "702010", 3.5, "kg", 1, "", "mezcla fina", 1200, "2025-10-14", "import_csv", "Proceso especial"],
+]
+
+def _template_bytes(sample: bool) -> bytes:
     buffer = io.StringIO()
     writer = csv.writer(buffer)
-
-    # Escribir cabeceras
-    writer.writerow(headers)
-
+    writer.writerow(_TEMPLATE_HEADERS)
     if sample:
-        # Filas de ejemplo (una fila por componente)
-        writer.writerow(["301002", 1, "borrador", "true", 1, "un", "801007", 10, "kg", 2, "PROC-ABC", "", "", "2025-10-13", "import_csv", "Receta base v1"])
-        writer.writerow(["301002", 1, "borrador", "true", 1, "un", "901576", 1, "un", 0, "PROC-ABC", "", "", "2025-10-13", "import_csv", ""])
-        writer.writerow(["500100", 1, "borrador", "false", 10, "kg", "702010", 3.5, "kg", 1, "", "mezcla fina", 1200, "2025-10-14", "import_csv", "Proceso especial"])
+        writer.writerows(_TEMPLATE_SAMPLE_ROWS)
+    return buffer.getvalue().encode("utf-8")
 
-    buffer.seek(0)
+def _etag(content: bytes) -> str:
+    return '"' + hashlib.md5(content).hexdigest() + '"'
 
-    # Nombre de archivo
-    filename = "plantilla_recetas.csv" if not sample else "plantilla_recetas_ejemplo.csv"
+# El contenido es fijo: se arma una sola vez al importar el módulo.
+_TEMPLATE_CSV = _template_bytes(sample=False)
+_TEMPLATE_SAMPLE_CSV = _template_bytes(sample=True)
+_TEMPLATE_ETAGS = {
+    False: _etag(_TEMPLATE_CSV),
+    True: _etag(_TEMPLATE_SAMPLE_CSV),
+}
 
-    return StreamingResponse(
-        buffer,
+@router.get("/import/csv:template")
+async def download_recipes_csv_template(sample: bool = False):
+    """
+    Devuelve la plantilla CSV para importar recetas.
+    - ?sample=true incluye 2-3 filas de ejemplo
+    """
+    filename = "plantilla_recetas.csv" if not sample else "plantilla_recetas_ejemplo.csv"
+    return Response(
+        content=_TEMPLATE_SAMPLE_CSV if sample else _TEMPLATE_CSV,
         media_type="text/csv; charset=utf-8",
         headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "ETag": _TEMPLATE_ETAGS[sample],
         },
     )
 
@@ -575,14 +740,20 @@ sku_PT,version,estado,marcar_vigente,base_qty,unidad_PT,sku_MP,cantidad_por_base
 301002,1,borrador,true,1,un,901577,1,un,0,PROC-ABC,,,2025-10-13,import_csv,
 """
 
+_MANUAL_BYTES = _manual_text().encode("utf-8")
+_MANUAL_ETAG = _etag(_MANUAL_BYTES)
+
 @router.get("/import/csv:manual", response_class=PlainTextResponse)
 async def download_recipes_csv_manual():
     """
     Manual de uso para la plantilla CSV (TXT plano, sin dependencias).
     """
     return PlainTextResponse(
-        content=_manual_text(),
-        headers={"Content-Disposition": 'attachment; filename="manual_csv_recetas.txt"'}
+        content=_MANUAL_BYTES,
+        headers={
+            "Content-Disposition": 'attachment; filename="manual_csv_recetas.txt"',
+            "ETag": _MANUAL_ETAG,
+        },
     )
 
 #====== Metodo para modificar nombre de receta =======
@@ -593,6 +764,7 @@ async def update_recipe_name_by_sku(
     db=Depends(get_db)
 ):
     modified = await recipes_repo.set_recipe_name_by_sku(skuPT, body.nombre, db=db)
+    _invalidate_recipe_cache()
     if modified == 0:
         # coherente con el resto: 404 si no existe PT/receta para ese SKU
         raise HTTPException(status_code=404, detail="Receta o PT no encontrado para el SKU indicado")
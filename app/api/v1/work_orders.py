@@ -1,16 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 import csv
 import io
+from itertools import islice
 
-from typing import Literal
+from typing import Any, AsyncIterator, Dict, List, Literal, Tuple
 
 from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File
+from fastapi.responses import PlainTextResponse
 
 from app.db.mongo import get_db
+from app.utils import cache
 from app.models.work_orders import (
     WorkOrderCreateIn,
     WorkOrderOut,
@@ -28,34 +31,57 @@ from app.services import WO, wms_service
 
 router = APIRouter(prefix="/work-orders", tags=["work-orders"])
 
+# Lecturas de OT cacheadas en memoria. Las escrituras de este router (crear,
+# importar, cambiar estado) invalidan el prefijo completo; las que ocurren
+# fuera (ej: cierre diario en gestion_ot_prod) usan WO.invalidate_cache().
+WO_CACHE_TTL_SECONDS = 30
+WO_CACHE_PREFIX = WO.CACHE_PREFIX
+
+
+def _wo_cache_key(*parts: Any) -> str:
+    return WO_CACHE_PREFIX + ":".join(str(p) for p in parts)
+
+
+def _invalidate_wo_cache() -> None:
+    WO.invalidate_cache()
+
 
 @router.post("", response_model=WorkOrderOut)
 async def create_work_order(body: WorkOrderCreateIn, db=Depends(get_db)):
     try:
-        return await WO.create_work_order(db, body)
+        created = await WO.create_work_order(db, body)
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=str(exc))
+    _invalidate_wo_cache()
+    return created
 
 
 @router.get("/next", response_model=NextWorkOrderOut)
 async def get_next_work_order_number(db=Depends(get_db)):
-    next_ot = await WO.get_next_ot(db)
+    key = _wo_cache_key("next")
+    next_ot = cache.get(key)
+    if next_ot is None:
+        next_ot = await WO.get_next_ot(db)
+        cache.set(key, next_ot, WO_CACHE_TTL_SECONDS, keep_stale=False)
     return {"next": next_ot}
 
 
 @router.get("/last", response_model=LastWorkOrderOut)
 async def get_last_work_order_number(db=Depends(get_db)):
-    try:
-        last_ot = await WO.get_last_created_ot(db)
-    except ValueError as exc:
-        message = str(exc)
-        status = 404 if "no hay" in message.lower() else 422
-        raise HTTPException(status_code=status, detail=message)
+    key = _wo_cache_key("last")
+    last_ot = cache.get(key)
+    if last_ot is None:
+        try:
+            last_ot = await WO.get_last_created_ot(db)
+        except ValueError as exc:
+            message = str(exc)
+            status = 404 if "no hay" in message.lower() else 422
+            raise HTTPException(status_code=status, detail=message)
+        cache.set(key, last_ot, WO_CACHE_TTL_SECONDS, keep_stale=False)
     return {"OT": last_ot}
 
 
-@router.get("/template", response_class=StreamingResponse)
-async def download_template():
+def _build_template_csv() -> str:
     header = ["OT", "SKU", "Cantidad", "Encargado", "linea", "fecha", "fecha_ini", "fecha_fin"]
     sample_row = {
         "OT": "1001",
@@ -72,29 +98,75 @@ async def download_template():
     writer = csv.DictWriter(buffer, fieldnames=header)
     writer.writeheader()
     writer.writerow(sample_row)
-    buffer.seek(0)
+    return buffer.getvalue()
+
+
+# La plantilla es fija: se arma una sola vez al importar el módulo.
+_TEMPLATE_CSV = _build_template_csv()
 
-    response = StreamingResponse(
-        iter([buffer.getvalue()]),
+
+@router.get("/template", response_class=PlainTextResponse)
+async def download_template():
+    return PlainTextResponse(
+        _TEMPLATE_CSV,
         media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=work_orders_template.csv"},
     )
-    response.headers["Content-Disposition"] = "attachment; filename=work_orders_template.csv"
-    return response
+
+
+# Filas por lote al leer el CSV de import.
+_IMPORT_BATCH_ROWS = 1000
+
+
+def _read_row_batch(reader, columns: List[Tuple[int, str]]) -> Tuple[bool, List[Dict[str, str]]]:
+    """
+    Lee hasta _IMPORT_BATCH_ROWS filas con csv.reader (parser en C) y arma solo
+    los dict de las columnas del header. El primer valor indica si quedaban filas.
+    """
+    raw = list(islice(reader, _IMPORT_BATCH_ROWS))
+    rows = [
+        {name: row[i] for i, name in columns if i < len(row)}
+        for row in raw
+        if row  # filas en blanco se omiten, igual que DictReader
+    ]
+    return bool(raw), rows
+
+
+async def _iter_csv_rows(reader, columns: List[Tuple[int, str]]) -> AsyncIterator[Dict[str, str]]:
+    """
+    Entrega las filas del CSV leyendo por lotes en un thread: la lectura del
+    archivo subido y el decode son bloqueantes y no deben frenar el event loop.
+    """
+    while True:
+        more, batch = await asyncio.to_thread(_read_row_batch, reader, columns)
+        if not more:
+            return
+        for row in batch:
+            yield row
 
 
 @router.post("/import", response_model=WorkOrderBulkImportOut)
 async def import_work_orders(file: UploadFile = File(...), db=Depends(get_db)):
+    # Decode incremental sobre el stream del upload (sin file.read() completo)
+    wrapper = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
     try:
-        content = (await file.read()).decode("utf-8-sig")
+        reader = csv.reader(wrapper)
+        header = await asyncio.to_thread(next, reader, None)
+        fieldnames = [(h or "").strip() for h in header] if header is not None else None
+        columns = list(enumerate(fieldnames or []))
+        result = await WO.import_work_orders_from_csv(db, fieldnames, _iter_csv_rows(reader, columns))
+        if result.created:
+            _invalidate_wo_cache()
+        return result
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="No se pudo decodificar el CSV (utf-8)")
-
-    try:
-        return await WO.import_work_orders_from_csv(db, content)
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=str(exc))
     except Exception as exc:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(exc))
+    finally:
+        # No cerrar el archivo subido al liberar el wrapper
+        wrapper.detach()
 
 
 @router.get("/recipe/print")
@@ -114,7 +186,7 @@ async def download_recipe_pdf(
         fecha_ini=fecha_ini,
     )
     try:
-        filename, file_stream = await WO.generate_recipe_pdf(db, payload)
+        filename, pdf_bytes = await WO.generate_recipe_pdf(db, payload)
     except ValueError as exc:
         raise HTTPException(status_code=422, detail=str(exc))
     except FileNotFoundError:
@@ -123,17 +195,13 @@ async def download_recipe_pdf(
         raise HTTPException(status_code=500, detail=str(exc) or "Error al generar la receta en PDF")
 
     headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(
-        file_stream,
-        media_type="application/pdf",
-        headers=headers,
-    )
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
 
 @router.get("/{ot}/print")
 async def download_work_order_pdf(ot: int, db=Depends(get_db)):
     try:
-        filename, file_stream = await WO.generate_work_order_pdf(db, ot)
+        filename, pdf_bytes = await WO.generate_work_order_pdf(db, ot)
     except ValueError as exc:
         message = str(exc)
         status = 404 if "no encontrada" in message.lower() else 422
@@ -144,21 +212,23 @@ async def download_work_order_pdf(ot: int, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(exc))
 
     headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-    return StreamingResponse(
-        file_stream,
-        media_type="application/pdf",
-        headers=headers,
-    )
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
 
 @router.get("/{ot}", response_model=WorkOrderOut)
 async def get_work_order(ot: int, db=Depends(get_db)):
+    key = _wo_cache_key("ot", ot)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     try:
-        return await WO.get_work_order_by_ot(db, ot)
+        order = await WO.get_work_order_by_ot(db, ot)
     except ValueError as exc:
         message = str(exc)
         status = 404 if "no encontrada" in message.lower() else 422
         raise HTTPException(status_code=status, detail=message)
+    cache.set(key, order, WO_CACHE_TTL_SECONDS, keep_stale=False)
+    return order
 
 
 @router.get("", response_model=list[WorkOrderOut])
@@ -171,8 +241,14 @@ async def list_work_orders(
     ),
     db=Depends(get_db),
 ):
+    key = _wo_cache_key("list", limit, skip, estado)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     filters = WorkOrderListFilters(estado=estado) if estado else None
-    return await WO.list_work_orders(db, limit=limit, skip=skip, filters=filters)
+    orders = await WO.list_work_orders(db, limit=limit, skip=skip, filters=filters)
+    cache.set(key, orders, WO_CACHE_TTL_SECONDS, keep_stale=False)
+    return orders
 
 
 @router.post("/integration/send", response_model=WorkOrderIntegrationResponse)
@@ -229,8 +305,10 @@ async def update_work_order_estado(
     db=Depends(get_db),
 ):
     try:
-        return await WO.update_work_order_estado(db, ot, body)
+        updated = await WO.update_work_order_estado(db, ot, body)
     except ValueError as exc:
         message = str(exc)
         status = 404 if "no encontrada" in message.lower() else 422
         raise HTTPException(status_code=status, detail=message)
+    _invalidate_wo_cache()
+    return updated
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -6,6 +8,14 @@ class Settings(BaseSettings):
     API_V1_PREFIX: str = "/api/v1"
     MONGO_URI: str
     MONGO_DB: str
+    MONGO_MAX_POOL_SIZE: int = 200
+    MONGO_MIN_POOL_SIZE: int = 20
+    # Compresión de red opcional, ej. "zstd,zlib" (zstd requiere el paquete zstandard)
+    MONGO_COMPRESSORS: str = ""
+    # Falla rápido si no hay servidor disponible en vez de esperar 30 s por request
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 3000
+    # Cierra conexiones ociosas del pool (0 = sin límite)
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
     WMS_URL: str = ""
     WMS_USER: str = ""
     WMS_PASS: str = ""
@@ -16,6 +26,8 @@ class Settings(BaseSettings):
     WMS_LOGIN_URL_QA: str = ""
     WMS_LOGIN_URL_PROD: str = ""
     LOG_LEVEL: str = "INFO"
+    # Agrupa lecturas find_by_id concurrentes en un solo $in (app/db/loader.py)
+    MONGO_BATCH_READS: bool = False
 
     # indica dónde leer .env en local
     model_config = SettingsConfigDict(
@@ -24,4 +36,10 @@ class Settings(BaseSettings):
         extra='ignore'
     )
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Instancia única de Settings: el .env se lee una sola vez por proceso."""
+    return Settings()
+
+
+settings = get_settings()
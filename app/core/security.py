@@ -1,18 +1,34 @@
 # app/core/security.py
 from __future__ import annotations
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
-# Soporta verificación de hashes antiguos "bcrypt"
-# y genera nuevos hashes con "bcrypt_sha256" (sin límite de 72 bytes).
+# Nuevos hashes con Argon2id (verificación más barata que bcrypt a seguridad
+# equivalente). Se siguen verificando los hashes "bcrypt_sha256" y "bcrypt"
+# antiguos; al iniciar sesión se re-hashean a Argon2 (deprecated="auto").
 pwd_context = CryptContext(
-    schemes=["bcrypt_sha256", "bcrypt"],
-    default="bcrypt_sha256",
+    schemes=["argon2", "bcrypt_sha256", "bcrypt"],
+    default="argon2",
     deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=64 * 1024,
+    argon2__parallelism=2,
 )
 
+# Las funciones son CPU-bound (decenas a cientos de ms): desde código async
+# deben llamarse con asyncio.to_thread para no bloquear el event loop.
+
 def hash_password(plain: str) -> str:
-    # passlib se encarga de pre-hashear con SHA-256 y luego bcrypt
     return pwd_context.hash(plain)
 
 def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
+
+def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si el hash usa un esquema obsoleto, retorna el
+    nuevo hash Argon2 a persistir (None si no hace falta actualizarlo).
+    """
+    return pwd_context.verify_and_update(plain, hashed)
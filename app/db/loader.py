@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+logger = logging.getLogger(__name__)
+
+# Ventana en la que se agrupan lecturas concurrentes (segundos).
+_BATCH_DELAY_SECONDS = 0.002
+
+
+class BatchLoader:
+    """
+    Agrupa lecturas por _id concurrentes sobre una colección en un único
+    find({"_id": {"$in": [...]}}). Cada llamador recibe su propio documento
+    (o None si no existe).
+    """
+
+    def __init__(
+        self,
+        collection: AsyncCollection,
+        *,
+        projection: Optional[Dict[str, int]] = None,
+        delay: float = _BATCH_DELAY_SECONDS,
+    ):
+        self._collection = collection
+        self._projection = projection
+        self._delay = delay
+        self._pending: Dict[Any, List[asyncio.Future]] = {}
+        self._scheduled = False
+
+    async def load(self, key: Any) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_later(self._delay, lambda: asyncio.ensure_future(self._flush()))
+        return await future
+
+    async def _flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._scheduled = False
+        if not pending:
+            return
+        try:
+            cursor = self._collection.find({"_id": {"$in": list(pending)}}, self._projection)
+            found = {doc["_id"]: doc async for doc in cursor}
+        except Exception as exc:
+            logger.exception("Error en lectura agrupada sobre %s", self._collection.name)
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for key, futures in pending.items():
+            doc = found.get(key)
+            for future in futures:
+                if not future.done():
+                    # Cada llamador recibe su copia para no compartir el dict mutable
+                    future.set_result(dict(doc) if doc is not None else None)
+
+
+_LOADERS: Dict[str, BatchLoader] = {}
+
+
+def get_loader(collection: AsyncCollection) -> BatchLoader:
+    """Retorna (o crea) el BatchLoader asociado a la colección."""
+    key = collection.full_name
+    loader = _LOADERS.get(key)
+    if loader is None:
+        loader = BatchLoader(collection)
+        _LOADERS[key] = loader
+    return loader
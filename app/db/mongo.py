@@ -1,25 +1,62 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import AsyncMongoClient, WriteConcern
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from app.core.config import settings
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 
-client: Optional[AsyncIOMotorClient]
-_db: Optional[AsyncIOMotorDatabase]
+client: Optional[AsyncMongoClient] = None
+_db: Optional[AsyncDatabase] = None
+# Colecciones de la BD por defecto ya construidas (nombre, write concern).
+_collections: Dict[Tuple[str, Optional[Tuple]], AsyncCollection] = {}
 
 async def connect()->None:
     global client,_db
 
-    client = AsyncIOMotorClient(settings.MONGO_URI)
+    # El write concern por defecto (majority) se mantiene para contadores/OT;
+    # los logs lo relajan a nivel de colección (ver logs_repo).
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "retryWrites": True,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    if settings.MONGO_MAX_IDLE_TIME_MS:
+        options["maxIdleTimeMS"] = settings.MONGO_MAX_IDLE_TIME_MS
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    client = AsyncMongoClient(settings.MONGO_URI, **options)
     _db=client[settings.MONGO_DB]
+    _collections.clear()
 
-def get_db() -> AsyncIOMotorDatabase:
+def get_db() -> AsyncDatabase:
     if _db is None: raise RuntimeError("Mongo Down.")
     return _db
 
+def get_collection(
+    name: str,
+    db: Optional[AsyncDatabase] = None,
+    *,
+    write_concern: Optional[WriteConcern] = None,
+) -> AsyncCollection:
+    """
+    Colección 'name' (síncrono: no hay I/O). Las de la BD por defecto se
+    construyen una vez y se reutilizan; con otra 'db' (ej: tests) se arma al vuelo.
+    """
+    if db is not None and db is not _db:
+        return db.get_collection(name, write_concern=write_concern)
+    key = (name, tuple(sorted(write_concern.document.items())) if write_concern else None)
+    col = _collections.get(key)
+    if col is None:
+        col = get_db().get_collection(name, write_concern=write_concern)
+        _collections[key] = col
+    return col
+
 async def close()->None:
     global client, _db
 
-    if client is not None: client.close()
+    if client is not None: await client.close()
     client=None
     _db=None
+    _collections.clear()
 
@@ -2,38 +2,51 @@ from __future__ import annotations
 
 from typing import Any, Dict, Optional
 
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo import ReturnDocument
 
-from app.db.mongo import get_db
+from app.core.config import settings
+from app.db.loader import get_loader
+from app.db import mongo
 
 _COLLECTION = "counters"
 
 
-async def _collection(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION]
+def _collection(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION, db)
 
 
 async def find_by_id(
     counter_id: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await _collection(db)
+    col = _collection(db)
+    if settings.MONGO_BATCH_READS:
+        return await get_loader(col).load(counter_id)
     return await col.find_one({"_id": counter_id})
 
 
+async def exists(
+    counter_id: str,
+    *,
+    db: Optional[AsyncDatabase] = None,
+) -> bool:
+    col = _collection(db)
+    return await col.find_one({"_id": counter_id}, {"_id": 1}) is not None
+
+
 async def update_seq(
     counter_id: str,
     seq: int,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await _collection(db)
+    col = _collection(db)
     return await col.find_one_and_update(
         {"_id": counter_id},
-        {"$set": {"seq": int(seq)}},
+        {"$set": {"seq": seq}},
         return_document=ReturnDocument.AFTER,
     )
 
@@ -42,12 +55,12 @@ async def increment_seq(
     counter_id: str,
     step: int = 1,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await _collection(db)
+    col = _collection(db)
     return await col.find_one_and_update(
         {"_id": counter_id},
-        {"$inc": {"seq": int(step)}},
+        {"$inc": {"seq": step}},
         return_document=ReturnDocument.AFTER,
     )
 
@@ -57,15 +70,15 @@ async def decrement_seq(
     step: int = 1,
     *,
     floor: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Disminuye el contador de forma atómica siempre que no quede bajo 'floor'.
     Si 'seq' es menor al paso solicitado, no modifica nada y retorna None.
     """
-    col = await _collection(db)
+    col = _collection(db)
     return await col.find_one_and_update(
-        {"_id": counter_id, "seq": {"$gte": int(floor) + int(step)}},
-        {"$inc": {"seq": -int(step)}},
+        {"_id": counter_id, "seq": {"$gte": floor + step}},
+        {"$inc": {"seq": -step}},
         return_document=ReturnDocument.AFTER,
     )
@@ -3,17 +3,21 @@ from __future__ import annotations
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
-from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ASCENDING, ReturnDocument
 
-from app.db.mongo import get_db
+from app.core.config import settings
+from app.db.loader import get_loader
+from app.db import mongo
 
 _COLLECTION_NAME = "encargados"
+# Proyección por defecto de los chequeos de duplicado
+_ID_ONLY: Dict[str, int] = {"_id": 1}
 
 
-async def get_collection(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+def get_collection(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION_NAME, db)
 
 
 def _parse_object_id(_id: str | ObjectId) -> ObjectId:
@@ -24,15 +28,16 @@ def _parse_object_id(_id: str | ObjectId) -> ObjectId:
     return ObjectId(_id)
 
 
-async def ensure_indexes(*, db: Optional[AsyncIOMotorDatabase] = None) -> None:
-    col = await get_collection(db)
+async def ensure_indexes(*, db: Optional[AsyncDatabase] = None) -> None:
+    col = get_collection(db)
     await col.create_index([("nombre", ASCENDING), ("linea", ASCENDING)], name="idx_nombre_linea")
 
 
-async def insert_encargado(doc: Dict[str, Any], *, db: Optional[AsyncIOMotorDatabase] = None) -> Dict[str, Any]:
-    col = await get_collection(db)
+async def insert_encargado(doc: Dict[str, Any], *, db: Optional[AsyncDatabase] = None) -> Dict[str, Any]:
+    col = get_collection(db)
     res = await col.insert_one(doc)
-    return await col.find_one({"_id": res.inserted_id})
+    # El documento insertado ya está en memoria: se evita el find_one de vuelta
+    return {**doc, "_id": res.inserted_id}
 
 
 async def find_all(
@@ -40,20 +45,25 @@ async def find_all(
     filtro: Optional[Dict[str, Any]] = None,
     limit: int = 100,
     skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    cursor = col.find(filtro or {}).sort("nombre", ASCENDING).skip(int(skip)).limit(int(limit))
-    return [doc async for doc in cursor]
+    col = get_collection(db)
+    cursor = col.find(filtro or {}, projection).sort("nombre", ASCENDING).skip(skip).limit(limit)
+    # Un solo batch del servidor para páginas de hasta 500 documentos
+    cursor = cursor.batch_size(min(limit, 500))
+    return await cursor.to_list(length=limit)
 
 
 async def find_by_id(
     _id: str | ObjectId,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     oid = _parse_object_id(_id)
+    if settings.MONGO_BATCH_READS:
+        return await get_loader(col).load(oid)
     return await col.find_one({"_id": oid})
 
 
@@ -61,12 +71,15 @@ async def update_encargado(
     _id: str | ObjectId,
     update: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     oid = _parse_object_id(_id)
-    await col.update_one({"_id": oid}, {"$set": update})
-    return await col.find_one({"_id": oid})
+    return await col.find_one_and_update(
+        {"_id": oid},
+        {"$set": update},
+        return_document=ReturnDocument.AFTER,
+    )
 
 
 async def find_by_nombre_linea(
@@ -74,11 +87,16 @@ async def find_by_nombre_linea(
     linea: str,
     *,
     exclude_id: Optional[str | ObjectId] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = _ID_ONLY,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    """
+    Busca un encargado por nombre y línea. Por defecto solo trae el _id (chequeo
+    de duplicados); pasar projection=None para el documento completo.
+    """
+    col = get_collection(db)
     filtro: Dict[str, Any] = {"nombre": nombre, "linea": linea}
     if exclude_id:
         filtro["_id"] = {"$ne": _parse_object_id(exclude_id)}
-    return await col.find_one(filtro)
+    return await col.find_one(filtro, projection)
 
@@ -1,17 +1,27 @@
 from __future__ import annotations
 
+import logging
 from typing import Iterable, Optional, Set, Any
 
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure
 
-from app.db.mongo import get_db
+from app.db import mongo
+
+logger = logging.getLogger(__name__)
 
 _COLLECTION_NAME = "exclude_skus"
+# IndexOptionsConflict / IndexKeySpecsConflict: an equivalent index already
+# exists under another name or with other options.
+_INDEX_CONFLICT_CODES = (85, 86)
 
 
 def _normalize_sku_for_query(value: Any) -> Set[Any]:
     """
-    Returns possible representations for a SKU so the query matches numeric or string values.
+    Returns possible representations for a SKU: the canonical string plus its
+    int form, so numeric values written after the migration still match.
     """
     if value is None:
         return set()
@@ -28,15 +38,40 @@ def _normalize_sku_for_query(value: Any) -> Set[Any]:
     return options
 
 
-async def get_collection(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+def get_collection(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION_NAME, db)
+
+
+async def ensure_indexes(db: Optional[AsyncDatabase] = None) -> None:
+    """
+    SKUs are stored as canonical strings. Legacy numeric values are converted
+    before building the index; an equivalent index created under another name
+    does not abort startup.
+    """
+    col = get_collection(db)
+    await col.update_many(
+        {"sku": {"$type": ["int", "long", "double", "decimal"]}},
+        [{"$set": {"sku": {"$toString": "$sku"}}}],
+    )
+    try:
+        await col.create_index([("sku", ASCENDING)], unique=True, name="uq_exclude_skus_sku")
+        return
+    except OperationFailure as exc:
+        if exc.code in _INDEX_CONFLICT_CODES:
+            return
+    # Duplicates left over after the conversion: keep serving with a plain index
+    logger.warning("exclude_skus has duplicated SKUs; creating a non-unique index")
+    try:
+        await col.create_index([("sku", ASCENDING)], name="idx_sku")
+    except OperationFailure as exc:
+        if exc.code not in _INDEX_CONFLICT_CODES:
+            raise
 
 
 async def find_matching_skus(
     skus: Iterable[str],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> set[str]:
     """
     Returns the SKUs present in the 'exclude_skus' collection that intersect with the provided list.
@@ -48,11 +83,6 @@ async def find_matching_skus(
     if not candidates:
         return set()
 
-    col = await get_collection(db)
-    cursor = col.find({"sku": {"$in": list(candidates)}}, {"sku": 1})
-    excluded: Set[str] = set()
-    async for doc in cursor:
-        if doc.get("sku") is None:
-            continue
-        excluded.add(str(doc.get("sku")))
-    return excluded
+    col = get_collection(db)
+    results = await col.distinct("sku", {"sku": {"$in": list(candidates)}})
+    return {str(sku) for sku in results if sku is not None}
@@ -1,53 +1,82 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+from datetime import datetime
 from typing import Any, Dict, Optional, Sequence, Tuple
 
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
-from pymongo import ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION_NAME = "gestion_OT_prod"
 
 
-async def get_collection(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+def get_collection(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION_NAME, db)
 
 
-async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None) -> None:
-    col = await get_collection(db)
+async def ensure_indexes(db: Optional[AsyncDatabase] = None) -> None:
+    col = get_collection(db)
     await col.create_index("OT", unique=True, name="uq_gestion_ot_prod_ot")
+    await col.create_index(
+        [
+            ("contenido.fecha", ASCENDING),
+            ("audit.createdHour", ASCENDING),
+            ("audit.createdAt", DESCENDING),
+        ],
+        name="idx_fecha_hora_createdAt",
+    )
+    await col.create_index(
+        [("audit.createdAt", DESCENDING), ("_id", DESCENDING)],
+        name="idx_createdAt_id",
+    )
+    # Cierre diario: igualdad/rango en estado y rango en contenido.fecha (ESR)
+    await col.create_index(
+        [("estado", ASCENDING), ("contenido.fecha", DESCENDING)],
+        name="idx_estado_fecha",
+    )
+    await backfill_created_hour(db=db)
+
+
+async def backfill_created_hour(*, db: Optional[AsyncDatabase] = None) -> int:
+    """Migración: calcula audit.createdHour en documentos creados antes del campo."""
+    col = get_collection(db)
+    res = await col.update_many(
+        {"audit.createdHour": {"$exists": False}, "audit.createdAt": {"$type": "date"}},
+        [{"$set": {"audit.createdHour": {"$hour": "$audit.createdAt"}}}],
+    )
+    return res.modified_count
 
 
 async def find_by_id(
     _id: ObjectId,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one({"_id": _id})
 
 
 async def find_by_ot(
     ot: int,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
-    return await col.find_one({"OT": int(ot)})
+    col = get_collection(db)
+    return await col.find_one({"OT": ot}, projection)
 
 
 async def insert_entry(
     entry: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
+    col = get_collection(db)
     res = await col.insert_one(entry)
-    return await col.find_one({"_id": res.inserted_id})
+    return {**entry, "_id": res.inserted_id}
 
 
 async def list_entries(
@@ -56,22 +85,23 @@ async def list_entries(
     skip: int = 0,
     filtro: Optional[Dict[str, Any]] = None,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> list[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     query = filtro or {}
-    cursor = col.find(query)
+    cursor = col.find(query, projection)
     if sort:
         cursor = cursor.sort(list(sort))
-    cursor = cursor.skip(int(skip)).limit(int(limit))
-    return [doc async for doc in cursor]
+    cursor = cursor.skip(skip).limit(limit).batch_size(min(limit, 500))
+    return await cursor.to_list(length=limit)
 
 
 async def update_estado_by_ot(
     ot: int,
     estado: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
     return await update_fields_by_ot(
         ot,
@@ -84,17 +114,16 @@ async def update_fields_by_ot(
     ot: int,
     fields: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
     if not fields:
-        return await find_by_ot(int(ot), db=db)
+        return await find_by_ot(ot, db=db)
 
-    col = await get_collection(db)
-    update_fields = dict(fields)
-    update_fields["audit.updatedAt"] = datetime.now(timezone.utc)
+    col = get_collection(db)
+    # audit.updatedAt lo estampa el servidor: un único reloj para todas las réplicas
     return await col.find_one_and_update(
-        {"OT": int(ot)},
-        {"$set": update_fields},
+        {"OT": ot},
+        {"$set": fields, "$currentDate": {"audit.updatedAt": {"$type": "date"}}},
         return_document=ReturnDocument.AFTER,
     )
 
@@ -102,24 +131,22 @@ async def update_fields_by_ot(
 async def close_until_fecha(
     fecha_fin_exclusive: datetime,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Marca como CERRADA todas las OT cuyo campo contenido.fecha sea
     menor a 'fecha_fin_exclusive' y no estén ya cerradas.
     Útil para cerrar backlog (días anteriores y no solo ayer).
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     result = await col.update_many(
         {
             "contenido.fecha": {"$lt": fecha_fin_exclusive},
             "estado": {"$ne": "CERRADA"},
         },
         {
-            "$set": {
-                "estado": "CERRADA",
-                "audit.updatedAt": datetime.now(timezone.utc),
-            }
+            "$set": {"estado": "CERRADA"},
+            "$currentDate": {"audit.updatedAt": {"$type": "date"}},
         },
     )
     return int(result.modified_count)
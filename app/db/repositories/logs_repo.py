@@ -2,17 +2,22 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo import ASCENDING, DESCENDING
+from pymongo.write_concern import WriteConcern
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION = "logs"
 
+# Logs de auditoría: se acepta perder las últimas escrituras ante una caída
+# del primario a cambio de no esperar réplica ni journal.
+_WRITE_CONCERN = WriteConcern(w=1, j=False)
 
-async def coll(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION]
+
+def coll(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION, db, write_concern=_WRITE_CONCERN)
 
 
 def _normalize_sort(
@@ -28,19 +33,42 @@ def _normalize_sort(
     return normalized
 
 
-async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None) -> None:
-    c = await coll(db)
-    await c.create_index([("loggedAt", DESCENDING)], name="idx_loggedAt")
-    await c.create_index([("severity", ASCENDING)], name="idx_severity")
-    await c.create_index([("userAlias_ci", ASCENDING)], name="idx_userAlias_ci")
+async def ensure_indexes(db: Optional[AsyncDatabase] = None) -> None:
+    c = coll(db)
+    # idx_loggedAt, idx_severity e idx_userAlias_ci son prefijos de los
+    # compuestos: solo suman costo de escritura, se eliminan si existen de
+    # versiones anteriores.
+    existing = await c.index_information()
+    for name in ("idx_loggedAt", "idx_severity", "idx_userAlias_ci"):
+        if name in existing:
+            await c.drop_index(name)
+    await c.create_index(
+        [("loggedAt", DESCENDING), ("_id", DESCENDING)],
+        name="idx_loggedAt_id",
+    )
+    await c.create_index(
+        [("severity", ASCENDING), ("loggedAt", DESCENDING)],
+        name="idx_severity_loggedAt",
+    )
+    await c.create_index(
+        [("userAlias_ci", ASCENDING), ("loggedAt", DESCENDING)],
+        name="idx_userAlias_loggedAt",
+    )
 
 
 async def insert_log(
-    doc: Dict[str, Any], db: Optional[AsyncIOMotorDatabase] = None
+    doc: Dict[str, Any], db: Optional[AsyncDatabase] = None
 ) -> Dict[str, Any]:
-    c = await coll(db)
+    c = coll(db)
     res = await c.insert_one(doc)
-    return await c.find_one({"_id": res.inserted_id})
+    return {**doc, "_id": res.inserted_id}
+
+
+async def insert_many_logs(
+    docs: List[Dict[str, Any]], db: Optional[AsyncDatabase] = None
+) -> None:
+    c = coll(db)
+    await c.insert_many(docs, ordered=False)
 
 
 async def list_logs(
@@ -49,24 +77,32 @@ async def list_logs(
     skip: int = 0,
     limit: int = 50,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> List[Dict[str, Any]]:
-    c = await coll(db)
+    c = coll(db)
     query = filtro or {}
-    cursor = c.find(query)
+    cursor = c.find(query, projection)
     normalized_sort = _normalize_sort(sort)
     if normalized_sort:
         cursor = cursor.sort(normalized_sort)
     if skip:
         cursor = cursor.skip(int(skip))
     if limit:
-        cursor = cursor.limit(int(limit))
-    return [doc async for doc in cursor]
+        cursor = cursor.limit(int(limit)).batch_size(min(int(limit), 500))
+        return await cursor.to_list(length=int(limit))
+    return await cursor.to_list(length=None)
 
 
 async def count_logs(
     filtro: Optional[Dict[str, Any]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
-    c = await coll(db)
+    c = coll(db)
     return await c.count_documents(filtro or {})
+
+
+async def estimated_count_logs(db: Optional[AsyncDatabase] = None) -> int:
+    """Conteo desde la metadata de la colección (sin escanear); solo sin filtros."""
+    c = coll(db)
+    return await c.estimated_document_count()
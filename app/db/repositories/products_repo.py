@@ -1,34 +1,50 @@
 # app/db/repositories/products_repo.py
 # -----------------------------------------------------------------------------
-# Repositorio de acceso a datos para la colección "products" (Motor + MongoDB).
+# Repositorio de acceso a datos para la colección "products" (PyMongo Async + MongoDB).
 # - Mantén aquí SOLO queries a la BD (lecturas/escrituras/aggregations/índices).
 # - La API NO debe hablar con Mongo directo; usa un service que consuma este repo.
 # -----------------------------------------------------------------------------
 from __future__ import annotations
 
+import asyncio
 import re
-from typing import Optional, Iterable, Sequence, Tuple, List, Dict, Any
+from typing import Optional, AsyncIterator, Iterable, Sequence, Tuple, List, Dict, Any
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from uuid import uuid4
 from bson import ObjectId
-from motor.motor_asyncio import (
-    AsyncIOMotorCollection,
-    AsyncIOMotorDatabase,
-)
-from pymongo import ASCENDING, DESCENDING, UpdateOne
-from pymongo.errors import BulkWriteError
+from bson.errors import InvalidId
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.collation import Collation
+from pymongo.errors import BulkWriteError, OperationFailure
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION_NAME = "products"
 _IMPORT_BATCHES = "import_batches"  # 👈 colección temporal para batches de import
 
+# Comparación de 'nombre' sin distinguir mayúsculas (ni acentos en mayúsculas):
+# reemplaza al antiguo campo derivado 'nombre_ci'. Debe coincidir con la del
+# índice idx_nombre_es_ci para que Mongo lo use.
+NOMBRE_COLLATION = Collation(locale="es", strength=2)
+
 # ------------------------------ Helpers base ---------------------------------
+def _after_filter(filtro: Optional[Dict[str, Any]], after: Optional[ObjectId]) -> Dict[str, Any]:
+    """Paginado por cursor: solo documentos con _id posterior al último visto."""
+    filtro = dict(filtro or {})
+    if after is not None:
+        filtro["_id"] = {"$gt": after}
+    return filtro
+
+
 def _parse_object_id(_id: str) -> ObjectId:
     """Valida y castea un str a ObjectId o levanta ValueError si es inválido."""
-    if not ObjectId.is_valid(_id):
+    try:
+        return ObjectId(_id)
+    except (InvalidId, TypeError):
         raise ValueError(f"ObjectId inválido: '{_id}'")
-    return ObjectId(_id)
 
 
 def _wrap_update(update: Dict[str, Any]) -> Dict[str, Any]:
@@ -40,6 +56,46 @@ def _wrap_update(update: Dict[str, Any]) -> Dict[str, Any]:
     return update if has_operator else {"$set": update}
 
 
+def _sync_sku_ci(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mantiene 'sku_ci' (sku en minúsculas) junto a 'sku': la búsqueda %like%
+    por SKU usa un regex sin $options "i" sobre idx_sku_ci.
+    A diferencia de 'nombre' (igualdad, orden y prefijo, resueltos con
+    NOMBRE_COLLATION), un regex de subcadena no respeta collation, así que
+    SKU sí necesita el campo derivado.
+    """
+    sku = fields.get("sku")
+    if isinstance(sku, str):
+        fields["sku_ci"] = sku.lower()
+    return fields
+
+
+async def _paginated_find(
+    col: AsyncCollection,
+    filtro: Optional[Dict[str, Any]],
+    *,
+    limit: int,
+    skip: int,
+    projection: Optional[Dict[str, Any]] = None,
+    sort: Optional[List[Tuple[str, int]]] = None,
+    hint: Optional[List[Tuple[str, int]]] = None,
+    collation: Optional[Collation] = None,
+) -> List[Dict[str, Any]]:
+    """find paginado común a los listados (limit/skip en 0 = sin límite/desplazamiento)."""
+    cursor = col.find(filtro or {}, projection=projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if collation is not None:
+        cursor = cursor.collation(collation)
+    if hint is not None:
+        cursor = cursor.hint(hint)
+    if skip:
+        cursor = cursor.skip(int(skip))
+    if limit:
+        cursor = cursor.limit(int(limit))
+    return await cursor.to_list(length=int(limit) or None)
+
+
 def _normalize_sort(
     sort: Optional[Sequence[Tuple[str, int]]],
 ) -> Optional[List[Tuple[str, int]]]:
@@ -58,97 +114,176 @@ def _normalize_sort(
     return normalized
 
 
-async def get_collection(
-    db: Optional[AsyncIOMotorDatabase] = None,
-) -> AsyncIOMotorCollection:
+def get_collection(
+    db: Optional[AsyncDatabase] = None,
+) -> AsyncCollection:
     """
     Retorna la colección 'products'. Permite inyectar 'db' en tests.
     """
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+    return mongo.get_collection(_COLLECTION_NAME, db)
+
+_SKU_LOOKUP_CHUNK = 1000
+
 
 async def find_existing_skus(
-    db: AsyncIOMotorDatabase,
-    skus: list[str],
-) -> set[str]:
+    db: AsyncDatabase,
+    skus: Iterable[str],
+) -> frozenset[str]:
+    """
+    Retorna los SKU que ya existen en BD entre los entregados.
+    - Consulta en bloques de _SKU_LOOKUP_CHUNK en paralelo.
+    - Proyección solo a 'sku' (sin _id): se resuelve desde el índice uniq_sku.
     """
-    Retorna un set con los SKU que ya existen en BD entre la lista entregada.
+    unique = list({s for s in skus if s})
+    if not unique:
+        return frozenset()
+    col = get_collection(db)
+    chunks = [
+        unique[i:i + _SKU_LOOKUP_CHUNK]
+        for i in range(0, len(unique), _SKU_LOOKUP_CHUNK)
+    ]
+    results = await asyncio.gather(*(
+        col.find({"sku": {"$in": chunk}}, {"_id": 0, "sku": 1}).to_list(length=None)
+        for chunk in chunks
+    ))
+    return frozenset(str(d["sku"]) for docs in results for d in docs if d.get("sku"))
+
+# Índices de 'products' (orden = prioridad al crearlos uno a uno):
+# - uniq_sku: único por SKU.
+# - nombre: binario para prefijos en mayúsculas (/by-mixed) y con collation
+#   'es' strength 2 para orden/igualdad sin distinguir mayúsculas.
+# - sku_ci: búsqueda por SKU sin distinguir mayúsculas (/by-sku).
+# - dg / dsg: búsqueda por prefijo en /by-mixed.
+# - Compuestos ESR para /by-mixed (igualdad -> orden -> rango): tipo/activo
+#   en igualdad + orden por _id (sin sort en memoria) y tipo en igualdad +
+#   prefijos de familia/subfamilia como rango.
+_SKU_INDEX = IndexModel([("sku", ASCENDING)], name="uniq_sku", unique=True)
+_INDEXES = [
+    _SKU_INDEX,
+    IndexModel([("categoria", ASCENDING)], name="idx_categoria"),
+    IndexModel([("activo", ASCENDING)], name="idx_activo"),
+    IndexModel([("nombre", ASCENDING)], name="idx_nombre"),
+    IndexModel([("nombre", ASCENDING)], name="idx_nombre_es_ci", collation=NOMBRE_COLLATION),
+    IndexModel([("sku_ci", ASCENDING)], name="idx_sku_ci"),
+    IndexModel([("dg", ASCENDING)], name="idx_dg"),
+    IndexModel([("dsg", ASCENDING)], name="idx_dsg"),
+    IndexModel(
+        [("tipo", ASCENDING), ("activo", ASCENDING), ("_id", ASCENDING)],
+        name="idx_esr_tipo_activo_id",
+    ),
+    IndexModel(
+        [("tipo", ASCENDING), ("dg", ASCENDING), ("dsg", ASCENDING)],
+        name="idx_tipo_dg_dsg",
+    ),
+]
+# IndexOptionsConflict / IndexKeySpecsConflict: existe un índice equivalente
+# con otro nombre u opciones (ej: creado a mano en otra versión).
+_INDEX_CONFLICT_CODES = (85, 86)
+
+# El TTL conserva el nombre por defecto (expiresAt_1) con que ya existía.
+_BATCH_INDEXES = [
+    IndexModel([("batch_id", ASCENDING)], name="idx_batch_id"),
+    IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+]
+
+
+async def _ensure_indexes_one_by_one(col: AsyncCollection) -> None:
     """
-    if not skus:
-        return set()
-    col = await get_collection(db)
-    cursor = col.find({"sku": {"$in": skus}}, {"sku": 1})
-    docs = [doc async for doc in cursor]
-    return {str(d.get("sku")) for d in docs if d.get("sku")}
+    Camino lento, solo si el batch choca con índices previos: crea cada
+    índice por separado, omite los equivalentes con otro nombre y
+    reconstruye como único el de SKU si existe sin 'unique'.
+    """
+    for model in _INDEXES:
+        try:
+            await col.create_indexes([model])
+        except OperationFailure as exc:
+            if exc.code not in _INDEX_CONFLICT_CODES:
+                raise
+            if model is not _SKU_INDEX:
+                continue
+            existing = await col.index_information()
+            meta = next(
+                (m for m in existing.values() if m.get("key") == [("sku", ASCENDING)]),
+                None,
+            )
+            if meta is not None and not meta.get("unique"):
+                name = next(n for n, m in existing.items() if m is meta)
+                await col.drop_index(name)
+                await col.create_indexes([_SKU_INDEX])
+
 
 async def ensure_indexes(
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> None:
     """
-    Crea/asegura índices útiles para queries frecuentes de forma idempotente.
-    - Si ya existe un índice equivalente pero con otro nombre, no falla.
-    - Si existe el de SKU pero sin 'unique', lo reconstruye como único.
-    """
-    col = await get_collection(db)
-
-    # 1) Inspeccionamos índices existentes
-    #    index_information() devuelve { name: { 'key': [('field', dir)], 'unique': bool, ... } }
-    existing = await col.index_information()
-
-    def has_index_with_key(key_pattern: list[tuple[str, int]]):
-        for meta in existing.values():
-            # meta['key'] es una lista de tuplas [('campo', 1), ...]
-            if meta.get("key") == key_pattern:
-                return True, meta
-        return False, None
-
-    # ---------- Índice único por SKU ----------
-    desired_name = "uniq_sku"   # usa SIEMPRE el mismo nombre para evitar conflictos
-    key = [("sku", ASCENDING)]
-
-    found, meta = has_index_with_key(key)
-    if found:
-        # Si existe pero NO es único, lo reconstruimos
-        if not meta.get("unique"):
-            try:
-                await col.drop_index(meta["name"])
-            except Exception:
-                # Si no se puede dropear por algún motivo, lo ignoramos para no bloquear el arranque.
-                pass
-            await col.create_index(key, name=desired_name, unique=True)
-        else:
-            # Ya existe y es único → nada que hacer (aunque el nombre sea distinto)
-            pass
-    else:
-        # No existe → lo creamos
-        await col.create_index(key, name=desired_name, unique=True)
-
-    # ---------- Otros índices útiles ----------
-    # categoria
-    # Si ya existe con la misma key, no recreamos.
-    if not has_index_with_key([("categoria", ASCENDING)])[0]:
-        await col.create_index([("categoria", ASCENDING)], name="idx_categoria")
-
-    # activo
-    if not has_index_with_key([("activo", ASCENDING)])[0]:
-        await col.create_index([("activo", ASCENDING)], name="idx_activo")
-
-    # nombre (si prefieres búsquedas case-insensitive por 'nombre_ci', cambia aquí)
-    if not has_index_with_key([("nombre", ASCENDING)])[0]:
-        await col.create_index([("nombre", ASCENDING)], name="idx_nombre")
+    Crea/asegura índices útiles para queries frecuentes de forma idempotente:
+    un solo createIndexes (no-op en el servidor si ya existen con ese nombre).
+    Si choca con índices equivalentes de otro nombre, se crean de a uno.
+    """
+    col = get_collection(db)
+    try:
+        await col.create_indexes(_INDEXES)
+    except OperationFailure as exc:
+        if exc.code not in _INDEX_CONFLICT_CODES:
+            raise
+        await _ensure_indexes_one_by_one(col)
+
+    # import_batches: lectura por batch_id y TTL para los batches vencidos
+    # (validados y nunca confirmados)
+    await _batches_col(db).create_indexes(_BATCH_INDEXES)
+
+    await drop_nombre_ci(db=db)
+    await backfill_sku_ci(db=db)
+
+
+# Migraciones de arranque: ninguna recorre 'products' completa en cada boot.
+# - drop_nombre_ci: nada vuelve a escribir 'nombre_ci', así que corre una vez
+#   y deja una marca en 'migrations' (lectura por _id).
+# - backfill_sku_ci: un find_one sobre idx_sku_ci (los faltantes indexan null)
+#   confirma si quedan productos sin sku_ci; el update_many solo corre si hay.
+_MIGRATIONS = "migrations"
+_DROP_NOMBRE_CI = "products.drop_nombre_ci"
+_PENDING_SKU_CI = {"sku": {"$type": "string"}, "sku_ci": {"$exists": False}}
+
+
+async def drop_nombre_ci(*, db: Optional[AsyncDatabase] = None) -> int:
+    """Migración: elimina el campo derivado 'nombre_ci' (reemplazado por collation)."""
+    migrations = mongo.get_collection(_MIGRATIONS, db)
+    if await migrations.find_one({"_id": _DROP_NOMBRE_CI}) is not None:
+        return 0
+    col = get_collection(db)
+    res = await col.update_many({"nombre_ci": {"$exists": True}}, {"$unset": {"nombre_ci": ""}})
+    await migrations.update_one(
+        {"_id": _DROP_NOMBRE_CI},
+        {"$setOnInsert": {"appliedAt": datetime.utcnow()}},
+        upsert=True,
+    )
+    return res.modified_count
+
+
+async def backfill_sku_ci(*, db: Optional[AsyncDatabase] = None) -> int:
+    """Migración: calcula sku_ci en productos creados antes del campo."""
+    col = get_collection(db)
+    if await col.find_one(_PENDING_SKU_CI, {"_id": 1}) is None:
+        return 0
+    res = await col.update_many(
+        _PENDING_SKU_CI,
+        [{"$set": {"sku_ci": {"$toLower": "$sku"}}}],
+    )
+    return res.modified_count
 
 # ------------------------------ Lecturas -------------------------------------
 async def find_by_id(
     _id: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Busca un producto por _id (string). Retorna el documento o None.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     oid = _parse_object_id(_id)
     return await col.find_one({"_id": oid}, projection=projection)
 
@@ -156,47 +291,25 @@ async def find_by_id(
 async def find_by_sku(
     sku: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> Optional[Dict[str, Any]]:
     """
     Busca un producto por SKU exacto.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one({"sku": sku}, projection=projection)
 
 
-async def find_by_sku_like(
-    sku_fragment: str,
-    *,
-    limit: int = 20,
-    skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
-    projection: Optional[Dict[str, int]] = None,
-) -> List[Dict[str, Any]]:
-    """
-    Busca productos cuyo SKU contenga 'sku_fragment' (case-insensitive).
-    Pensado para búsquedas en vivo, incluye paginación.
-    """
-    col = await get_collection(db)
-    filtro = {"sku": {"$regex": re.escape(sku_fragment), "$options": "i"}}
-    cursor = col.find(filtro, projection=projection)
-    if skip:
-        cursor = cursor.skip(int(skip))
-    if limit:
-        cursor = cursor.limit(int(limit))
-    return [doc async for doc in cursor]
-
-
 async def count(
     filtro: Optional[Dict[str, Any]] = None,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Cuenta documentos que calzan con 'filtro'.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.count_documents(filtro or {})
 
 
@@ -207,90 +320,81 @@ async def find_many(
     skip: int = 0,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
     projection: Optional[Dict[str, int]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> List[Dict[str, Any]]:
     """
     Lista productos por filtro con paginado y orden.
     - filtro: dict de condiciones Mongo (ej: {"categoria": "A", "activo": True})
     - sort: lista de tuplas (campo, 1|-1) ej: [("nombre", 1), ("precio", -1)]
+    - Ordenar por 'nombre' no distingue mayúsculas (NOMBRE_COLLATION).
+    - after: paginado por cursor (_id > after, orden por _id); ignora sort/skip.
     """
-    col = await get_collection(db)
-    cursor = col.find(filtro or {}, projection=projection)
-
+    col = get_collection(db)
+    if after is not None:
+        filtro, sort, skip = _after_filter(filtro, after), [("_id", ASCENDING)], 0
     sort_norm = _normalize_sort(sort)
-    if sort_norm:
-        cursor = cursor.sort(sort_norm)
-    if skip:
-        cursor = cursor.skip(int(skip))
-    if limit:
-        cursor = cursor.limit(int(limit))
-
-    results: List[Dict[str, Any]] = [doc async for doc in cursor]
-    return results
-
-
-async def find_product_by_fam(
-    familia: str,
-    *,
-    limit: int = 20,
-    skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
-    projection: Optional[Dict[str, Any]] = None
-) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    filtro = {"dg": {"$regex": f"{re.escape(familia.upper())}"}}
-    cursor = col.find(filtro, projection=projection)
-    if limit: cursor.limit(int(limit))
-    if skip: cursor.skip(int(skip))
-    return [doc async for doc in cursor]
-
-
-async def find_product_by_subfam(
-    subfamilia: str,
-    *,
-    limit: int = 20,
-    skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
-    projection: Optional[Dict[str, Any]] = None
-) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    filtro = {"dsg": {"$regex": f"{re.escape(subfamilia.upper())}"}}
-    cursor = col.find(filtro, projection=projection)
-    if limit: cursor.limit(int(limit))
-    if skip: cursor.skip(int(skip))
-    return [doc async for doc in cursor]
-
-
-async def find_product_by_name(
-    name: str,
-    *,
-    limit: int = 20,
-    skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
-    projection: Optional[Dict[str, Any]] = None
-) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    filtro = {"nombre": {"$regex": f"{re.escape(name.upper())}"}}
-    cursor = col.find(filtro, projection=projection)
-    if limit: cursor.limit(int(limit))
-    if skip: cursor.skip(int(skip))
-    return [doc async for doc in cursor]
-
-
-async def find_product_by_type(
-    tipo: str,
+    return await _paginated_find(
+        col,
+        filtro,
+        limit=limit,
+        skip=skip,
+        projection=projection,
+        sort=sort_norm,
+        collation=NOMBRE_COLLATION if sort_norm and sort_norm[0][0] == "nombre" else None,
+    )
+
+
+# Búsquedas "contiene" (regex sin ancla): no acotan rangos del índice, pero
+# con hint Mongo evalúa el patrón sobre las claves del índice del campo y solo
+# lee los documentos que calzan, en vez de recorrer la colección por _id.
+# 'nombre' no se incluye: tiene dos índices con la misma clave (uno con collation).
+_CONTAINS_HINTS: Dict[str, List[Tuple[str, int]]] = {
+    "dg": [("dg", ASCENDING)],
+    "dsg": [("dsg", ASCENDING)],
+}
+
+
+async def find_by_field(
+    field: str,
+    value: str,
     *,
+    uppercase: bool = True,
     limit: int = 20,
     skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, Any]] = None
 ) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    filtro = {"tipo": {"$regex": f"{re.escape(tipo.upper())}"}}
-    cursor = col.find(filtro, projection=projection)
-    if limit: cursor.limit(int(limit))
-    if skip: cursor.skip(int(skip))
-    return [doc async for doc in cursor]
+    """
+    Busca productos cuyo 'field' contenga 'value', ordenados por _id.
+    - uppercase=True: el valor se pasa a mayúsculas (así se guardan dg/dsg/nombre/tipo).
+    - uppercase=False: búsqueda case-insensitive sobre el campo derivado
+      '<field>_ci' en minúsculas (solo existe sku_ci).
+    - after: paginado por cursor (_id > after); ignora skip.
+    """
+    col = get_collection(db)
+    hint = _CONTAINS_HINTS.get(field)
+    if uppercase:
+        filtro = {field: {"$regex": re.escape(value.upper())}}
+    else:
+        # Un regex con $options "i" no puede usar las claves del índice: se
+        # compara en minúsculas contra idx_<field>_ci (el índice se recorre,
+        # pero solo se leen los documentos que calzan).
+        field_ci = f"{field}_ci"
+        filtro = {field_ci: {"$regex": re.escape(value.lower())}}
+        hint = [(field_ci, ASCENDING)]
+    if after is not None:
+        filtro, skip = _after_filter(filtro, after), 0
+    return await _paginated_find(
+        col,
+        filtro,
+        limit=limit,
+        skip=skip,
+        projection=projection,
+        sort=[("_id", ASCENDING)],
+        hint=hint,
+    )
 
 
 async def find_product_mixed(
@@ -298,29 +402,35 @@ async def find_product_mixed(
     *,
     limit: int = 20,
     skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, Any]] = None
 ) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    cursor = col.find(filtro, projection=projection)
-    if limit: cursor.limit(int(limit))
-    if skip: cursor.skip(int(skip))
-    return [doc async for doc in cursor]
+    col = get_collection(db)
+    if after is not None:
+        filtro, skip = _after_filter(filtro, after), 0
+    # Orden por _id: paginado estable (skip o cursor)
+    return await _paginated_find(
+        col,
+        filtro,
+        limit=limit,
+        skip=skip,
+        projection=projection,
+        sort=[("_id", ASCENDING)],
+    )
 
 
 # ------------------------------ Escrituras -----------------------------------
 async def insert_one(
     doc: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> str:
     """
     Inserta un producto y retorna el documento (con _id ya asignado).
-    - Regla local: nombre_ci = nombre.lower() para búsquedas/orden insensible a mayúsculas.
     """
-    col = await get_collection(db)
-    doc['nombre_ci'] = doc['nombre'].lower()
-    result = await col.insert_one(doc)
+    col = get_collection(db)
+    result = await col.insert_one(_sync_sku_ci(doc))
     doc['_id'] = result.inserted_id
     return doc
 
@@ -330,180 +440,237 @@ async def update_by_id(
     update: Dict[str, Any],
     *,
     upsert: bool = False,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Actualiza un producto por _id. Retorna cantidad modificada (0|1).
     Si 'update' no contiene operadores ($set, $inc, ...), se envuelve en $set.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     oid = _parse_object_id(_id)
     safe_update = _wrap_update(update)
+    if "$set" in safe_update:
+        _sync_sku_ci(safe_update["$set"])
     result = await col.update_one({"_id": oid}, safe_update, upsert=upsert)
     return int(result.modified_count)
 
 
+async def update_and_get_by_id(
+    _id: str,
+    update: Dict[str, Any],
+    *,
+    db: Optional[AsyncDatabase] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Actualiza un producto por _id y retorna el documento ya actualizado
+    (o None si no existe) en un solo round-trip.
+    """
+    col = get_collection(db)
+    oid = _parse_object_id(_id)
+    safe_update = _wrap_update(update)
+    if "$set" in safe_update:
+        _sync_sku_ci(safe_update["$set"])
+    return await col.find_one_and_update(
+        {"_id": oid}, safe_update, return_document=ReturnDocument.AFTER
+    )
+
+
 # -------------------------- IMPORT: Batches & Bulk ---------------------------
-async def _batches_col(
-    db: Optional[AsyncIOMotorDatabase] = None,
-) -> AsyncIOMotorCollection:
-    # Motor no permite truthiness: compara con None explícitamente
-    database = db if db is not None else get_db()
-    return database["import_batches"]
+def _batches_col(
+    db: Optional[AsyncDatabase] = None,
+) -> AsyncCollection:
+    return mongo.get_collection(_IMPORT_BATCHES, db)
 
 
 async def save_import_batch(
-    db: AsyncIOMotorDatabase,
+    db: AsyncDatabase,
     items: List[Dict[str, Any]],
     *,
     ttl_minutes: int = 30,
 ) -> str:
     """
     Guarda un batch temporal de import en 'import_batches' con TTL.
-    - items: [{ row, payload, errors, warnings }, ...]
-    - Crea índice TTL sobre 'expiresAt' (idempotente).
+    - items: [{ row, payload, errors, warnings }, ...]; cada ítem es un
+      documento propio con su batch_id (sin límite de 16 MB por batch).
+      El router rechaza los CSV sin filas, así que items nunca viene vacío.
+    - Los índices (batch_id y TTL sobre 'expiresAt') se crean en ensure_indexes.
     - Devuelve el batch_id (string).
     """
-    from datetime import datetime, timedelta
-
-    col = await _batches_col(db)
-    batch_id = f"batch-{datetime.utcnow().timestamp()}".replace(".", "")
-    doc = {
-        "_id": batch_id,
-        "items": items,
-        "createdAt": datetime.utcnow(),
-        "expiresAt": datetime.utcnow() + timedelta(minutes=ttl_minutes),
-    }
-    await col.insert_one(doc)
-    # Índice TTL (si no existe, lo crea; si existe, no falla)
-    await col.create_index("expiresAt", expireAfterSeconds=0)
+    col = _batches_col(db)
+    batch_id = f"batch-{uuid4().hex}"
+    expires_at = datetime.utcnow() + timedelta(minutes=ttl_minutes)
+    docs = [
+        {
+            "batch_id": batch_id,
+            "row": it.get("row"),
+            "payload": it.get("payload"),
+            "errors": it.get("errors") or [],
+            "warnings": it.get("warnings") or [],
+            "expiresAt": expires_at,
+        }
+        for it in items
+    ]
+    if docs:
+        await col.insert_many(docs, ordered=False)
     return batch_id
 
 
-async def get_import_batch(
-    db: AsyncIOMotorDatabase,
+# Ítems por lote al leer un batch (memoria acotada sin multiplicar round-trips)
+_BATCH_READ_SIZE = 1000
+
+
+async def iter_import_batch(
+    db: AsyncDatabase,
     batch_id: str,
-) -> Optional[Dict[str, Any]]:
-    """Lee un batch temporal por ID (o None si expiró o no existe)."""
-    col = await _batches_col(db)
-    return await col.find_one({"_id": batch_id})
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Recorre los ítems de un batch en lotes de _BATCH_READ_SIZE, sin cargar el
+    batch completo en memoria. No entrega nada si expiró o no existe.
+    """
+    col = _batches_col(db)
+    cursor = col.find(
+        {"batch_id": batch_id},
+        {"_id": 0, "row": 1, "payload": 1, "errors": 1},
+    ).batch_size(_BATCH_READ_SIZE)
+    chunk: List[Dict[str, Any]] = []
+    async for it in cursor:
+        chunk.append(it)
+        if len(chunk) >= _BATCH_READ_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 async def delete_import_batch(
-    db: AsyncIOMotorDatabase,
+    db: AsyncDatabase,
     batch_id: str,
 ) -> None:
     """Elimina un batch temporal (limpieza post confirm)."""
-    col = await _batches_col(db)
-    await col.delete_one({"_id": batch_id})
+    col = _batches_col(db)
+    await col.delete_many({"batch_id": batch_id})
+
+
+_UPSERT_CHUNK = 1000
+# El import confirma miles de filas de una vez: sin esperar journal por lote.
+_IMPORT_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+
+async def _bulk_upsert_chunk(
+    col: AsyncCollection,
+    ops: List[UpdateOne],
+    skus: List[str],
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """
+    Ejecuta un tramo; un BulkWriteError se reporta como éxito parcial.
+    skus va en paralelo a ops: cada error informa el SKU de su op.
+    """
+    try:
+        result = await col.bulk_write(ops, ordered=False)
+        return (result.upserted_count or 0, result.modified_count or 0, [])
+    except BulkWriteError as bwe:
+        details = bwe.details or {}
+        errors = [
+            {"sku": skus[e.get("index", 0)], "code": e.get("code"), "errmsg": e.get("errmsg")}
+            for e in details.get("writeErrors", [])
+        ]
+        return (details.get("nUpserted", 0), details.get("nModified", 0), errors)
+
+
+# Campos que no cuentan como cambio al comparar contra el documento actual
+_DIFF_IGNORED = frozenset({"_id", "createdAt", "updatedAt"})
+
+
+async def _upsert_ops_by_sku(
+    col: AsyncCollection,
+    docs: List[Tuple[str, Dict[str, Any]]],
+) -> Tuple[List[UpdateOne], List[str], int]:
+    """
+    Arma los UpdateOne(upsert) de (sku, doc) en vez de un find_one por fila:
+    - Los documentos existentes se leen de una vez ($in por tramos en paralelo),
+      proyectando solo los campos que traen los docs.
+    - Existentes: $set solo de los campos que cambian; sin cambios no hay op.
+    - Nuevos: $set completo.
+    Retorna (ops, op_skus, unchanged); op_skus[i] es el SKU de ops[i].
+    """
+    skus = list({sku for sku, _ in docs})
+    projection = {k: 1 for _, doc in docs for k in doc if k not in _DIFF_IGNORED}
+    projection["sku"] = 1
+    results = await asyncio.gather(*(
+        col.find({"sku": {"$in": skus[i:i + _SKU_LOOKUP_CHUNK]}}, projection).to_list(length=None)
+        for i in range(0, len(skus), _SKU_LOOKUP_CHUNK)
+    ))
+    existing = {d["sku"]: d for found in results for d in found}
+
+    ops: List[UpdateOne] = []
+    op_skus: List[str] = []
+    unchanged = 0
+    for sku, doc in docs:
+        current = existing.get(sku)
+        if current is None:
+            update: Dict[str, Any] = {"$set": dict(doc)}
+        else:
+            changes = {
+                k: v for k, v in doc.items()
+                if k not in _DIFF_IGNORED and current.get(k) != v
+            }
+            if not changes:
+                unchanged += 1
+                continue
+            update = {"$set": changes}
+        ops.append(UpdateOne({"sku": sku}, update, upsert=True))
+        op_skus.append(sku)
+    return ops, op_skus, unchanged
+
+
+async def _run_upserts(
+    col: AsyncCollection,
+    ops: List[UpdateOne],
+    op_skus: List[str],
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """
+    Ejecuta las ops en tramos de _UPSERT_CHUNK que corren en paralelo
+    (ordered=False), así otras operaciones se intercalan con el import.
+    """
+    if not ops:
+        return (0, 0, [])
+    results = await asyncio.gather(*(
+        _bulk_upsert_chunk(col, ops[i:i + _UPSERT_CHUNK], op_skus[i:i + _UPSERT_CHUNK])
+        for i in range(0, len(ops), _UPSERT_CHUNK)
+    ))
+    created = sum(r[0] for r in results)
+    updated = sum(r[1] for r in results)
+    errors = [e for r in results for e in r[2]]
+    return (created, updated, errors)
 
 
 async def bulk_upsert_products_by_sku(
-    db: AsyncIOMotorDatabase,
+    db: AsyncDatabase,
     docs: List[Dict[str, Any]],
-) -> Tuple[int, int]:
+) -> Tuple[int, int, int, List[Dict[str, Any]]]:
     """
     Realiza un bulk upsert por clave 'sku'.
     - docs deben venir listos para persistir (con 'sku' y demás campos mapeados).
-    - Retorna (created, updated).
+    - Solo se escriben los campos que cambian (ver _upsert_ops_by_sku).
+    - Retorna (created, updated, unchanged, errors); errors lista los
+      writeErrors de los tramos que fallaron parcialmente como
+      {"sku", "code", "errmsg"}.
     """
     if not docs:
-        return (0, 0)
-
-    col = await get_collection(db)
-    ops: List[UpdateOne] = []
+        return (0, 0, 0, [])
 
+    col = (get_collection(db)).with_options(write_concern=_IMPORT_WRITE_CONCERN)
+    keyed: List[Tuple[str, Dict[str, Any]]] = []
     for d in docs:
         sku = (d.get("sku") or "").strip().upper()
         if not sku:
             # Si viene sin SKU lo saltamos (y que el router lo cuente como skipped si quiere)
             continue
-        # upsert por SKU
-        ops.append(UpdateOne({"sku": sku}, {"$set": d}, upsert=True))
-
-    if not ops:
-        return (0, 0)
-
-    try:
-        result = await col.bulk_write(ops, ordered=False)
-        created = result.upserted_count or 0
-        updated = result.modified_count or 0
-        return (created, updated)
-    except BulkWriteError as bwe:
-        # Propagamos el error para que el router decida cómo responder.
-        raise bwe
-
-async def confirm_import_batch(
-    db: AsyncIOMotorDatabase,
-    batch_id: str,
-) -> dict:
-    """
-    Confirma un batch de importación:
-      - Inserta los ítems válidos (sin errores) que no existan por SKU -> created
-      - Actualiza los que existan -> updated
-      - Si no hay cambios efectivos -> skipped
-      - Fuerza activo=True y setea/actualiza 'nombre_ci' y timestamps.
-    Retorna: { ok, created, updated, skipped }
-    """
-    col = await get_collection(db)
-
-    # Cargamos el batch
-    batches = db.get_collection("import_batches")
-    batch = await batches.find_one({"_id": batch_id})
-    if not batch:
-        return {"ok": False, "created": 0, "updated": 0, "skipped": 0, "message": "Batch no encontrado"}
-
-    created = updated = skipped = 0
-
-    items = batch.get("items", [])
-    for it in items:
-        payload: dict = it.get("payload") or {}
-        errors: list = it.get("errors") or []
-        if errors:
-            # Filas inválidas no se procesan
-            continue
-
-        sku = (payload.get("sku") or "").strip()
-        if not sku:
-            # Sin SKU no se procesa
-            continue
-
-        # Normalizaciones y campos derivados
-        doc = {**payload}
-        doc["activo"] = True
-        if "nombre" in doc and isinstance(doc["nombre"], str):
-            doc["nombre_ci"] = doc["nombre"].lower()
+        keyed.append((sku, _sync_sku_ci(d)))
 
-        now = datetime.utcnow()
-        # createdAt solo para insert; updatedAt para ambos casos
-        doc.setdefault("createdAt", now)
-        doc["updatedAt"] = now
+    if not keyed:
+        return (0, 0, 0, [])
 
-        # ¿Existe por SKU?
-        current = await col.find_one({"sku": sku})
-
-        if not current:
-            # INSERT
-            await col.insert_one(doc)
-            created += 1
-        else:
-            # UPDATE (solo si hay cambios efectivos)
-            # Construimos set de cambios comparando 'current' vs 'doc'
-            set_changes = {}
-            for k, v in doc.items():
-                # evitamos tocar _id
-                if k == "_id":
-                    continue
-                if current.get(k) != v:
-                    set_changes[k] = v
-
-            if set_changes:
-                await col.update_one({"_id": current["_id"]}, {"$set": set_changes})
-                updated += 1
-            else:
-                skipped += 1
-
-    # Limpieza opcional del batch
-    await batches.delete_one({"_id": batch_id})
-
-    return {"ok": True, "created": created, "updated": updated, "skipped": skipped}
+    ops, op_skus, unchanged = await _upsert_ops_by_sku(col, keyed)
+    created, updated, errors = await _run_upserts(col, ops, op_skus)
+    return (created, updated, unchanged, errors)
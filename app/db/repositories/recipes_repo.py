@@ -5,12 +5,16 @@ import re
 from typing import Optional, Iterable, Sequence, Tuple, List, Dict, Any
 from datetime import datetime
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
-from pymongo import ASCENDING, DESCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION_NAME = "recipes"
+_NOMBRE_CI_KEY = [("nombre_ci", ASCENDING)]
+_NOMBRE_CI_ESTADO_KEY = [("nombre_ci", ASCENDING), ("versiones.estado", ASCENDING)]
 
 # ------------------------------ Helpers base ---------------------------------
 def _parse_object_id(_id: str) -> ObjectId:
@@ -35,37 +39,69 @@ def _normalize_sort(
         normalized.append((field, dir_norm))
     return normalized
 
-async def get_collection(
-    db: Optional[AsyncIOMotorDatabase] = None,
-) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+def _after_filter(filtro: Optional[Dict[str, Any]], after: Optional[ObjectId]) -> Dict[str, Any]:
+    """Paginado por cursor: solo documentos con _id posterior al último visto."""
+    filtro = dict(filtro or {})
+    if after is not None:
+        filtro["_id"] = {"$gt": after}
+    return filtro
+
+def get_collection(
+    db: Optional[AsyncDatabase] = None,
+) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION_NAME, db)
+
+async def _create_index_if_missing(
+    col: AsyncCollection,
+    key: List[Tuple[str, int]],
+    name: str,
+) -> None:
+    # Compara por key (no por nombre) para no duplicar índices creados a mano
+    existing = await col.index_information()
+    if not any(meta.get("key") == key for meta in existing.values()):
+        await col.create_index(key, name=name)
+
+async def ensure_indexes(
+    *,
+    db: Optional[AsyncDatabase] = None,
+) -> None:
+    """
+    Índices que usan las rutas de /recipes:
+    - nombre_ci: búsquedas por nombre (prefijo anclado y %like%)
+    - nombre_ci + versiones.estado: /by-mixed con nombre y estado
+    - productPTId: lookup de la receta de un PT (create/promote/renombrar)
+    - staging_recipes.batch_id: status/promote/clear de un import
+    """
+    col = get_collection(db)
+    await _create_index_if_missing(col, _NOMBRE_CI_KEY, "idx_nombre_ci")
+    await _create_index_if_missing(col, _NOMBRE_CI_ESTADO_KEY, "idx_nombre_ci_estado")
+    await _create_index_if_missing(col, [("productPTId", ASCENDING)], "idx_productPTId")
+    staging = staging_coll(db)
+    await _create_index_if_missing(staging, [("batch_id", ASCENDING)], "idx_batch_id")
 
 # ---------------------- Colecciones relacionadas -----------------------------
-async def products_coll(db: Optional[AsyncIOMotorDatabase] = None):
-    database = db if db is not None else get_db()
-    return database["products"]
+def products_coll(db: Optional[AsyncDatabase] = None):
+    return mongo.get_collection("products", db)
 
-async def processes_coll(db: Optional[AsyncIOMotorDatabase] = None):
-    database = db if db is not None else get_db()
-    return database["processes"]
+def processes_coll(db: Optional[AsyncDatabase] = None):
+    return mongo.get_collection("processes", db)
 
 # ---------------------- Lookups auxiliares (products/processes) --------------
-async def get_product_by_sku(sku: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    col = await products_coll(db)
+async def get_product_by_sku(sku: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    col = products_coll(db)
     return await col.find_one({"sku": sku})
 
-async def get_pt_by_sku(sku: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    col = await products_coll(db)
+async def get_pt_by_sku(sku: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    col = products_coll(db)
     return await col.find_one({"sku": sku, "tipo": "PT"})
 
-async def get_process_by_code(code: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    col = await processes_coll(db)
+async def get_process_by_code(code: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    col = processes_coll(db)
     return await col.find_one({"codigo": code})
 
 # NUEVO: obtener proceso por _id (para valorización)
-async def get_process_by_id(_id: Any, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    col = await processes_coll(db)
+async def get_process_by_id(_id: Any, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    col = processes_coll(db)
     oid = _id if isinstance(_id, ObjectId) else (ObjectId(_id) if ObjectId.is_valid(str(_id)) else None)
     if not oid:
         return None
@@ -75,47 +111,121 @@ async def get_process_by_id(_id: Any, db: Optional[AsyncIOMotorDatabase] = None)
 async def find_products_by_ids(
     ids: List[ObjectId],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> List[Dict[str, Any]]:
     if not ids:
         return []
-    col = await products_coll(db)
+    col = products_coll(db)
     cursor = col.find({"_id": {"$in": ids}}, projection=projection)
     return [doc async for doc in cursor]
 #----------------------- Helpers de versiones-----------------------------------------------
+async def _update_and_get(
+    col: AsyncCollection,
+    recipe_id: ObjectId,
+    update: Dict[str, Any],
+    *,
+    version_num: Optional[int] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Aplica 'update' y retorna la receta ya actualizada en un solo round-trip.
+    Si se filtra por versión y esta no existe, no hay cambios y se retorna la
+    receta tal cual (igual que el update_one + find_one anterior).
+    """
+    filtro: Dict[str, Any] = {"_id": recipe_id}
+    if version_num is not None:
+        filtro["versiones.version"] = int(version_num)
+    doc = await col.find_one_and_update(filtro, update, return_document=ReturnDocument.AFTER)
+    if doc is None and version_num is not None:
+        return await col.find_one({"_id": recipe_id})
+    return doc
+
 async def update_version_estado(
     recipe_id: ObjectId,
     version_num: int,
     nuevo_estado: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
-    await col.update_one(
-        {"_id": recipe_id, "versiones.version": int(version_num)},
+    return await _update_and_get(
+        get_collection(db),
+        recipe_id,
         {"$set": {"versiones.$.estado": nuevo_estado, "audit.updatedAt": datetime.utcnow()}},
+        version_num=version_num,
     )
-    return await col.find_one({"_id": recipe_id})
 
 async def clear_vigente_version(
     recipe_id: ObjectId,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
-    await col.update_one(
-        {"_id": recipe_id},
+    return await _update_and_get(
+        get_collection(db),
+        recipe_id,
         {"$unset": {"vigenteVersion": ""}, "$set": {"audit.updatedAt": datetime.utcnow()}},
     )
-    return await col.find_one({"_id": recipe_id})
+async def disable_version(
+    pt_id: ObjectId,
+    version_num: Optional[int] = None,
+    *,
+    db: Optional[AsyncDatabase] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Marca la versión como 'obsoleta' y, si era la vigente, limpia 'vigenteVersion'.
+    Sin version_num se deshabilita la vigente actual. El filtro valida que la
+    versión exista: un único update con pipeline, atómico y en un solo
+    round-trip (retorna el doc final). None si no hubo nada que actualizar.
+    """
+    col = get_collection(db)
+    filtro: Dict[str, Any] = {"productPTId": pt_id}
+    if version_num is None:
+        target: Any = "$vigenteVersion"
+        filtro["vigenteVersion"] = {"$ne": None}
+    else:
+        target = int(version_num)
+        filtro["versiones.version"] = target
+    # Las expresiones de un mismo $set leen el documento de entrada, así que
+    # "$vigenteVersion" es el valor previo en ambos campos.
+    pipeline = [
+        {
+            "$set": {
+                "versiones": {
+                    "$map": {
+                        "input": "$versiones",
+                        "as": "v",
+                        "in": {
+                            "$cond": [
+                                {"$eq": ["$$v.version", target]},
+                                {"$mergeObjects": ["$$v", {"estado": "obsoleta"}]},
+                                "$$v",
+                            ]
+                        },
+                    }
+                },
+                "vigenteVersion": {
+                    "$cond": [
+                        {"$eq": ["$vigenteVersion", target]},
+                        "$$REMOVE",
+                        "$vigenteVersion",
+                    ]
+                },
+                "audit.updatedAt": datetime.utcnow(),
+            }
+        }
+    ]
+    return await col.find_one_and_update(
+        filtro,
+        pipeline,
+        return_document=ReturnDocument.AFTER,
+    )
+
 # ----------------------[CRUD] existentes + utilidades -------------------------
 async def find_by_id(
     _id: str,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> Optional[Dict[str, Any]]:
-    coll = await get_collection(db)
+    coll = get_collection(db)
     oid = _parse_object_id(_id)
     return await coll.find_one({"_id": oid}, projection=projection)
 
@@ -126,9 +236,13 @@ async def find_all(
     skip=0,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
     projection: Optional[Dict[str, int]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> List[Dict[str, Any]]:
-    coll = await get_collection(db)
+    coll = get_collection(db)
+    # after: paginado por cursor (_id > after, orden por _id); ignora sort/skip
+    if after is not None:
+        filtro, sort, skip = _after_filter(filtro, after), [("_id", ASCENDING)], 0
     cursor = coll.find(filtro or {}, projection=projection)
     sort_norm = _normalize_sort(sort)
     if sort_norm:
@@ -142,10 +256,10 @@ async def find_all(
 async def find_by_name(
     name: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> Optional[Dict[str, Any]]:
-    coll = await get_collection(db)
+    coll = get_collection(db)
     return await coll.find_one({"nombre": name}, projection=projection)
 
 async def find_like(
@@ -153,12 +267,23 @@ async def find_like(
     *,
     limit: int = 20,
     skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> List[Dict[str, Any]]:
-    coll = await get_collection(db)
+    coll = get_collection(db)
     filtro = {"nombre_ci": {"$regex": f"{re.escape(name.lower())}"}}
-    cursor = coll.find(filtro, projection=projection)
+    if after is not None:
+        filtro, skip = _after_filter(filtro, after), 0
+    # Búsqueda %name%: un regex sin ancla no acota rangos, pero sobre
+    # idx_nombre_ci Mongo evalúa el patrón contra las claves del índice y
+    # solo lee los documentos que calzan (en vez de recorrer la colección).
+    # Orden por _id: paginado estable (skip o cursor)
+    cursor = (
+        coll.find(filtro, projection=projection)
+        .sort("_id", ASCENDING)
+        .hint(_NOMBRE_CI_KEY)
+    )
     if limit:
         cursor = cursor.limit(int(limit))
     if skip:
@@ -170,11 +295,19 @@ async def find_product_mixed(
     *,
     limit: int = 20,
     skip: int = 0,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    after: Optional[ObjectId] = None,
+    db: Optional[AsyncDatabase] = None,
     projection: Optional[Dict[str, int]] = None,
 ) -> List[Dict[str, Any]]:
-    col = await get_collection(db)
-    cursor = col.find(filtro or {}, projection=projection)
+    col = get_collection(db)
+    if after is not None:
+        filtro, skip = _after_filter(filtro, after), 0
+    # Orden por _id: paginado estable (skip o cursor)
+    cursor = col.find(filtro or {}, projection=projection).sort("_id", ASCENDING)
+    if filtro and "nombre_ci" in filtro:
+        # Con orden por _id el planner tiende a elegir el índice de _id y
+        # filtrar documento a documento; el prefijo de nombre_ci acota mucho más.
+        cursor = cursor.hint(_NOMBRE_CI_ESTADO_KEY)
     if limit:
         cursor = cursor.limit(int(limit))
     if skip:
@@ -186,9 +319,9 @@ async def update_by_id(
     update: Dict[str, Any],
     *,
     upsert: bool = False,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
-    col = await get_collection(db)
+    col = get_collection(db)
     oid = _parse_object_id(_id)
     safe_update = _wrap_update(update)
     result = await col.update_one({"_id": oid}, safe_update, upsert=upsert)
@@ -198,19 +331,19 @@ async def update_by_id(
 async def find_by_pt_id(
     pt_id: ObjectId,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one({"productPTId": pt_id})
 
 async def insert_recipe(
     recipe_doc: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
+    col = get_collection(db)
     res = await col.insert_one(recipe_doc)
-    return await col.find_one({"_id": res.inserted_id})
+    return {**recipe_doc, "_id": res.inserted_id}
 
 async def push_recipe_version(
     recipe_id: ObjectId,
@@ -218,45 +351,43 @@ async def push_recipe_version(
     *,
     marcar_vigente: bool,
     updated_at: datetime,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
+    col = get_collection(db)
     update: Dict[str, Any] = {
         "$push": {"versiones": version_doc},
         "$set": {"audit.updatedAt": updated_at},
     }
     if marcar_vigente:
         update["$set"]["vigenteVersion"] = version_doc["version"]
-    await col.update_one({"_id": recipe_id}, update)
-    return await col.find_one({"_id": recipe_id})
+    return await _update_and_get(col, recipe_id, update)
 
 async def set_recipe_meta(
     recipe_id: ObjectId,
     *,
     vigente_version: Optional[int],
     updated_at: datetime,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
+    col = get_collection(db)
     set_fields: Dict[str, Any] = {"audit.updatedAt": updated_at}
     if vigente_version is not None:
         set_fields["vigenteVersion"] = int(vigente_version)
-    await col.update_one({"_id": recipe_id}, {"$set": set_fields})
-    return await col.find_one({"_id": recipe_id})
+    return await _update_and_get(col, recipe_id, {"$set": set_fields})
 
 async def update_version_fields(
     recipe_id: ObjectId,
     version_num: int,
     set_fields: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
-    await col.update_one(
-        {"_id": recipe_id, "versiones.version": int(version_num)},
+    return await _update_and_get(
+        get_collection(db),
+        recipe_id,
         {"$set": set_fields},
+        version_num=version_num,
     )
-    return await col.find_one({"_id": recipe_id})
 
 async def replace_version_components(
     recipe_id: ObjectId,
@@ -264,56 +395,71 @@ async def replace_version_components(
     componentes: List[Dict[str, Any]],
     *,
     updated_at: datetime,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
     base = f"versiones.$.componentes"
-    await col.update_one(
-        {"_id": recipe_id, "versiones.version": int(version_num)},
+    return await _update_and_get(
+        get_collection(db),
+        recipe_id,
         {"$set": {base: componentes, "audit.updatedAt": updated_at}},
+        version_num=version_num,
     )
-    return await col.find_one({"_id": recipe_id})
 
 # --- STAGING ---
-async def staging_coll(db: Optional[AsyncIOMotorDatabase] = None):
-    return (db or get_db())["staging_recipes"]
+def staging_coll(db: Optional[AsyncDatabase] = None):
+    return mongo.get_collection("staging_recipes", db)
 
-_STAGING_ALLOWED = {
+# Columnas del CSV de import (también son las cabeceras de la plantilla)
+STAGING_COLUMNS: Tuple[str, ...] = (
     "sku_PT","version","estado","marcar_vigente","base_qty","unidad_PT",
     "sku_MP","cantidad_por_base","unidad_MP","merma_pct",
     "process_codigo","process_especial_nombre","process_especial_costo",
-    "fecha_publicacion","publicado_por","notas"
-}
-
-def _clean_row(raw: Dict[str, Any]) -> Dict[str, Any]:
-    # Normaliza claves desconocidas fuera, trim de strings
-    out: Dict[str, Any] = {}
-    for k, v in raw.items():
-        k2 = k.strip()
-        if k2 in _STAGING_ALLOWED:
-            if isinstance(v, str):
-                v = v.strip()
-            out[k2] = v
-    return out
+    "fecha_publicacion","publicado_por","notas",
+)
+_STAGING_ALLOWED = frozenset(STAGING_COLUMNS)
+
+def staging_columns(header: Sequence[str]) -> List[Tuple[int, str]]:
+    """
+    (posición, columna) de las cabeceras permitidas; el resto se descarta.
+    Se resuelve una vez por archivo en vez de armar un dict por fila.
+    """
+    columns = []
+    for i, name in enumerate(header):
+        name = name.strip()
+        if name in _STAGING_ALLOWED:
+            columns.append((i, name))
+    return columns
+
+def staging_row(row: Sequence[str], columns: List[Tuple[int, str]]) -> Dict[str, Any]:
+    """Fila CSV (lista) -> doc de staging con las columnas permitidas y trim de strings."""
+    n = len(row)
+    return {name: (row[i].strip() if i < n else None) for i, name in columns}
 
 async def stage_insert_rows(rows: List[Dict[str, Any]], *, batch_id: str, db=None) -> Tuple[int, List[str]]:
-    col = await staging_coll(db)
+    """Inserta filas ya normalizadas con staging_row."""
+    col = staging_coll(db)
     docs = []
     warnings: List[str] = []
-    for r in rows:
-        d = _clean_row(r)
-        d["batch_id"] = batch_id
+    for d in rows:
         if not d.get("sku_PT") or not d.get("version"):
-            warnings.append(f"Fila omitida por faltar sku_PT/version: {r}")
+            warnings.append(f"Fila omitida por faltar sku_PT/version: {d}")
             continue
+        d["batch_id"] = batch_id
         docs.append(d)
     if not docs:
         return 0, warnings
-    res = await col.insert_many(docs)
+    # Sin orden: una fila rechazada no corta el resto del lote. Las filas ya se
+    # validaron al parsear, así que se omite la validación del servidor.
+    try:
+        res = await col.insert_many(docs, ordered=False, bypass_document_validation=True)
+    except BulkWriteError as exc:
+        for err in exc.details.get("writeErrors", []):
+            warnings.append(f"Fila no insertada en staging: {err.get('errmsg')}")
+        return int(exc.details.get("nInserted", 0)), warnings
     return len(res.inserted_ids), warnings
 
 async def stage_status(*, batch_id: str, db=None) -> Tuple[int, List[Dict[str, Any]]]:
-    col = await staging_coll(db)
+    col = staging_coll(db)
     total = await col.count_documents({"batch_id": batch_id})
     cursor = col.find({"batch_id": batch_id}).limit(5)
     sample = [doc async for doc in cursor]
@@ -322,7 +468,7 @@ async def stage_status(*, batch_id: str, db=None) -> Tuple[int, List[Dict[str, A
     return total, sample
 
 async def stage_clear(*, batch_id: str, db=None) -> int:
-    col = await staging_coll(db)
+    col = staging_coll(db)
     res = await col.delete_many({"batch_id": batch_id})
     return int(res.deleted_count)
 
@@ -332,13 +478,13 @@ async def set_recipe_name_by_pt_id(
     pt_id: ObjectId,
     nombre: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Actualiza 'nombre' en la receta asociada a productPTId = pt_id.
     Retorna modified_count.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     res = await col.update_one(
         {"productPTId": pt_id},
         {"$set": {"nombre": nombre, "nombre_ci": nombre.lower(), "audit.updatedAt": datetime.utcnow()}},
@@ -349,13 +495,13 @@ async def set_recipe_name_by_sku(
     sku_pt: str,
     nombre: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Resuelve el PT por SKU (en 'products' con tipo:'PT') y actualiza la receta por productPTId.
     Retorna modified_count (0 si no se encontró PT o receta).
     """
-    prod_col = await products_coll(db)
+    prod_col = products_coll(db)
     pt = await prod_col.find_one({"sku": sku_pt, "tipo": "PT"}, {"_id": 1})
     if not pt or not pt.get("_id"):
         return 0
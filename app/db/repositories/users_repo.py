@@ -5,10 +5,11 @@ import re
 from typing import Optional, List, Dict, Any, Sequence, Tuple
 from datetime import datetime
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo import ASCENDING, DESCENDING, ReturnDocument
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION = "users"
 
@@ -27,41 +28,40 @@ def _normalize_sort(sort: Optional[Sequence[Tuple[str, int]]]) -> Optional[List[
         out.append((field, d))
     return out
 
-async def coll(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION]
+def coll(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION, db)
 
 # --------------- índices (opcional llamar al inicio) ---------------
-async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None) -> None:
-    c = await coll(db)
+async def ensure_indexes(db: Optional[AsyncDatabase] = None) -> None:
+    c = coll(db)
     await c.create_index([("email_ci", ASCENDING)], unique=True, name="uq_email_ci")
     await c.create_index([("alias_ci", ASCENDING)], unique=True, name="uq_alias_ci")
     await c.create_index([("status", ASCENDING)], name="idx_status")
     await c.create_index([("role", ASCENDING)], name="idx_role")
 
 # --------------- queries básicas ----------------
-async def find_by_id(user_id: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    c = await coll(db)
+async def find_by_id(user_id: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    c = coll(db)
     return await c.find_one({"_id": _oid(user_id)})
 
-async def find_by_email(email: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    c = await coll(db)
+async def find_by_email(email: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    c = coll(db)
     return await c.find_one({"email_ci": email.strip().lower()})
 
 async def find_by_alias(
     alias: str,
-    db:Optional[AsyncIOMotorDatabase] = None
+    db:Optional[AsyncDatabase] = None
 )-> List[Dict[str, Any]]:
 
-    c = await coll(db)
+    c = coll(db)
     filtro = {"alias_ci": {"$regex": f"{re.escape(alias.lower())}"}}
     cursor = c.find(filtro)
 
     results: List[Dict[str, Any]]=[doc async for doc in cursor]
     return results
 
-async def find_one_by_alias(alias: str, db: Optional[AsyncIOMotorDatabase] = None) -> Optional[Dict[str, Any]]:
-    c = await coll(db)
+async def find_one_by_alias(alias: str, db: Optional[AsyncDatabase] = None) -> Optional[Dict[str, Any]]:
+    c = coll(db)
     return await c.find_one({"alias_ci": alias.strip().lower()})
 
 async def list_users(
@@ -70,9 +70,9 @@ async def list_users(
     skip: int = 0,
     limit: int = 50,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> List[Dict[str, Any]]:
-    c = await coll(db)
+    c = coll(db)
     q = filtro or {}
     cursor = c.find(q)
     s = _normalize_sort(sort)
@@ -81,24 +81,24 @@ async def list_users(
     if limit: cursor = cursor.limit(int(limit))
     return [doc async for doc in cursor]
 
-async def count_users(filtro: Optional[Dict[str, Any]] = None, db: Optional[AsyncIOMotorDatabase] = None) -> int:
-    c = await coll(db)
+async def count_users(filtro: Optional[Dict[str, Any]] = None, db: Optional[AsyncDatabase] = None) -> int:
+    c = coll(db)
     return await c.count_documents(filtro or {})
 
 # --------------- escrituras ----------------
-async def insert_user(doc: Dict[str, Any], db: Optional[AsyncIOMotorDatabase] = None) -> Dict[str, Any]:
-    c = await coll(db)
+async def insert_user(doc: Dict[str, Any], db: Optional[AsyncDatabase] = None) -> Dict[str, Any]:
+    c = coll(db)
     if "alias" in doc:
         doc["alias_ci"]=doc["alias"].lower() # Insertamos alias en minusculas en alias_ci para busqueda rapida. 
     res = await c.insert_one(doc)
-    return await c.find_one({"_id": res.inserted_id})
+    return {**doc, "_id": res.inserted_id}
 
 async def update_user_by_id(
     user_id: str,
     set_fields: Dict[str, Any],
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    c = await coll(db)
+    c = coll(db)
     return await c.find_one_and_update(
         {"_id": _oid(user_id)},
         {"$set": set_fields},
@@ -108,11 +108,28 @@ async def update_user_by_id(
 async def set_password_hash(
     user_id: str,
     password_hash: str,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    c = await coll(db)
+    c = coll(db)
     return await c.find_one_and_update(
         {"_id": _oid(user_id)},
         {"$set": {"passwordHash": password_hash, "audit.updatedAt": datetime.utcnow()}},
         return_document=ReturnDocument.AFTER
     )
+
+async def replace_password_hash(
+    user_id: str | ObjectId,
+    old_hash: str,
+    new_hash: str,
+    db: Optional[AsyncDatabase] = None,
+) -> bool:
+    """
+    Re-hash transparente (cambio de esquema): solo reemplaza si el hash no
+    cambió entretanto y no toca audit.updatedAt porque el usuario no se modificó.
+    """
+    c = coll(db)
+    res = await c.update_one(
+        {"_id": _oid(user_id), "passwordHash": old_hash},
+        {"$set": {"passwordHash": new_hash}},
+    )
+    return res.modified_count == 1
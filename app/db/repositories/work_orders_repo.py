@@ -1,59 +1,61 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional, Sequence, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from bson import ObjectId
-from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
 
-from app.db.mongo import get_db
+from app.db import mongo
 
 _COLLECTION_NAME = "work_orders"
 
 
-async def get_collection(db: Optional[AsyncIOMotorDatabase] = None) -> AsyncIOMotorCollection:
-    database = db if db is not None else get_db()
-    return database[_COLLECTION_NAME]
+def get_collection(db: Optional[AsyncDatabase] = None) -> AsyncCollection:
+    return mongo.get_collection(_COLLECTION_NAME, db)
 
 
-async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None) -> None:
-    col = await get_collection(db)
+async def ensure_indexes(db: Optional[AsyncDatabase] = None) -> None:
+    col = get_collection(db)
     await col.create_index("OT", unique=True, name="uq_work_orders_ot")
 
 
 async def find_by_id(
     _id: ObjectId,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one({"_id": _id})
 
 
 async def find_by_ot(
     ot: int,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    projection: Optional[Dict[str, int]] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
-    return await col.find_one({"OT": int(ot)})
+    col = get_collection(db)
+    return await col.find_one({"OT": int(ot)}, projection)
 
 
 async def find_last_ot(
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one(sort=[("OT", DESCENDING)])
 
 
 async def find_last_created(
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
     """Retorna la última OT creada priorizando la fecha de creación."""
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one(
         sort=[("audit.createdAt", DESCENDING), ("OT", DESCENDING)],
         projection={"OT": 1, "audit.createdAt": 1},
@@ -63,11 +65,41 @@ async def find_last_created(
 async def insert_work_order(
     work_order: Dict[str, Any],
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Dict[str, Any]:
-    col = await get_collection(db)
+    col = get_collection(db)
     res = await col.insert_one(work_order)
-    return await col.find_one({"_id": res.inserted_id})
+    return {**work_order, "_id": res.inserted_id}
+
+
+# Import masivo: lotes sin orden con el write concern por defecto de la colección
+# (las OT importadas son la fuente de verdad de producción).
+_INSERT_CHUNK = 1000
+
+
+async def insert_many_work_orders(
+    docs: List[Dict[str, Any]],
+    *,
+    db: Optional[AsyncDatabase] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Inserta en lotes de _INSERT_CHUNK con ordered=False: una OT rechazada (ej:
+    duplicada por uq_work_orders_ot) no corta el resto. Retorna los errores
+    como {"index", "code", "errmsg"} con index relativo a 'docs'.
+    """
+    col = get_collection(db)
+    errors: List[Dict[str, Any]] = []
+    for offset in range(0, len(docs), _INSERT_CHUNK):
+        try:
+            await col.insert_many(docs[offset:offset + _INSERT_CHUNK], ordered=False)
+        except BulkWriteError as bwe:
+            for e in (bwe.details or {}).get("writeErrors", []):
+                errors.append({
+                    "index": offset + e.get("index", 0),
+                    "code": e.get("code"),
+                    "errmsg": e.get("errmsg"),
+                })
+    return errors
 
 
 async def list_work_orders(
@@ -76,9 +108,9 @@ async def list_work_orders(
     skip: int = 0,
     filtro: Optional[Dict[str, Any]] = None,
     sort: Optional[Sequence[Tuple[str, int]]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> list[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     query = filtro or {}
     cursor = col.find(query)
     if sort:
@@ -92,9 +124,9 @@ async def list_work_orders(
 async def count_work_orders(
     *,
     filtro: Optional[Dict[str, Any]] = None,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.count_documents(filtro or {})
 
 
@@ -102,9 +134,9 @@ async def update_estado_by_ot(
     ot: int,
     estado: str,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> Optional[Dict[str, Any]]:
-    col = await get_collection(db)
+    col = get_collection(db)
     return await col.find_one_and_update(
         {"OT": int(ot)},
         {
@@ -120,14 +152,14 @@ async def update_estado_by_ot(
 async def close_until_fecha(
     fecha_fin_exclusive: datetime,
     *,
-    db: Optional[AsyncIOMotorDatabase] = None,
+    db: Optional[AsyncDatabase] = None,
 ) -> int:
     """
     Marca como CERRADA todas las OT cuyo campo contenido.fecha sea
     menor a 'fecha_fin_exclusive' y no estén ya cerradas.
     Solo se actualiza el campo 'estado'.
     """
-    col = await get_collection(db)
+    col = get_collection(db)
     result = await col.update_many(
         {
             "contenido.fecha": {"$lt": fecha_fin_exclusive},
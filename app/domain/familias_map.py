@@ -2,6 +2,7 @@
 # Mapa maestro familia/subfamilia <-> códigos.
 # Mantén estos datos en un solo lugar para que Import/Crear/Actualizar lo usen igual.
 
+from functools import lru_cache
 from typing import Optional, Tuple
 
 # 👇 Ejemplo: ajústalo a tu catálogo real
@@ -58,6 +59,9 @@ FAMILIAS = {
 def _norm(s: Optional[str]) -> str:
     return (s or "").strip().upper()
 
+# FAMILIAS es estático y el resultado es una tupla inmutable: se cachea por
+# combinación (un import de miles de filas repite pocas familias/subfamilias).
+@lru_cache(maxsize=4096)
 def resolve_codes(
     dg: Optional[str],               # nombre familia
     dsg: Optional[str],              # nombre subfamilia
@@ -1,31 +1,47 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 from app.core.config import settings
 from app.db.mongo import connect, close, get_db
 from app.db.repositories import (
     encargados_repo,
+    exclude_skus_repo,
     gestion_ot_prod_repo,
     logs_repo,
     products_repo,
+    recipes_repo,
     work_orders_repo,
 )
 from app.api.v1 import auth, counters, encargados, gestion_produccion, logs, products, recipes, users, work_orders, dashboards
+from app.services import dashboards as dashboards_service
 from fastapi.middleware.cors import CORSMiddleware
-from app.tasks import daily_close, declarept_sync
+from app.tasks import daily_close, declarept_sync, logs_buffer
 
 
 @asynccontextmanager
 async def init(app:FastAPI):
     await connect()
-    await products_repo.ensure_indexes()
-    await work_orders_repo.ensure_indexes()
-    await gestion_ot_prod_repo.ensure_indexes()
-    await encargados_repo.ensure_indexes()
-    await logs_repo.ensure_indexes()
+    # Handshake (TLS, auth, selección de servidor) antes del primer request;
+    # un MONGO_URI mal configurado falla aquí y no en la primera llamada.
+    await get_db().command("ping")
+    # Cada colección es independiente: los índices se aseguran en paralelo
+    await asyncio.gather(
+        products_repo.ensure_indexes(),
+        recipes_repo.ensure_indexes(),
+        work_orders_repo.ensure_indexes(),
+        gestion_ot_prod_repo.ensure_indexes(),
+        encargados_repo.ensure_indexes(),
+        exclude_skus_repo.ensure_indexes(),
+        logs_repo.ensure_indexes(),
+        dashboards_service.ensure_indexes(),
+    )
     closer_task = daily_close.start_close_task()
     declarept_task = declarept_sync.start_sync_task()
+    logs_buffer.start_flush_task()
     yield
+    await logs_buffer.stop_flush_task()
     await daily_close.stop_close_task()
     await declarept_sync.stop_sync_task()
     await close()
@@ -34,7 +50,8 @@ app = FastAPI(
     title="Backend SC-PWP",
     version="0.1.0",
     lifespan=init,
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    default_response_class=ORJSONResponse,
 )
 
 logging.basicConfig(
@@ -56,7 +73,7 @@ app.add_middleware(
     allow_credentials=True,                       # cookies/Authorization
     allow_methods=["GET","POST","PUT","PATCH","DELETE","OPTIONS"],
     allow_headers=["*"],                          # relajado: acepta cualquier header del preflight
-    expose_headers=["X-Total-Count"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "X-Cache", "ETag"],
     max_age=86400,
 )
 
@@ -63,9 +63,17 @@ class LogsListOut(BaseModel):
     """Respuesta paginada para listados."""
 
     items: list[LogOut]
-    total: int
+    total: Optional[int] = Field(
+        default=None,
+        description="Total de registros; solo se calcula con include_total=true.",
+    )
     skip: int
     limit: int
+    has_more: bool = False
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="Cursor para la página siguiente (enviar como `after`). Null si no hay más.",
+    )
 
 
 class LogsListFilters(BaseModel):
@@ -73,7 +81,7 @@ class LogsListFilters(BaseModel):
 
     q: Optional[str] = Field(
         default=None,
-        description="Filtro LIKE sobre el alias del usuario (case-insensitive).",
+        description="Filtro por prefijo sobre el alias del usuario (case-insensitive).",
     )
     severity: Optional[Literal["INFO", "WARN"]] = Field(
         default=None, description="Filtra por severidad."
@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field, EmailStr, validator
 from typing import Optional, Literal, List, Tuple, cast
 from datetime import datetime
 from typing import get_args
+from functools import lru_cache
 
 # ---- Tipos base
 UserRole = Literal[
@@ -21,18 +22,26 @@ UserRole = Literal[
 UserStatus = Literal["active", "disabled"]
 
 _ROLE_ALLOWED: Tuple[str, ...] = cast(Tuple[str, ...], get_args(UserRole))
-_ROLE_ALLOWED_SET = set(_ROLE_ALLOWED)
+_ROLE_ALLOWED_SET = frozenset(_ROLE_ALLOWED)
 _ROLE_ALIASES = {"administrador": "admin"}
+_ROLE_ERROR = f"Rol no válido. Roles permitidos: {', '.join(sorted(_ROLE_ALLOWED_SET))}"
+
+
+@lru_cache(maxsize=64)
+def _lookup_role(value: str) -> Optional[str]:
+    """Rol canónico para el texto recibido, o None si no es válido (memoizado:
+    en la práctica llegan siempre las mismas pocas variantes)."""
+    normalized = value.strip().lower().replace(" ", "_")
+    normalized = _ROLE_ALIASES.get(normalized, normalized)
+    return normalized if normalized in _ROLE_ALLOWED_SET else None
 
 
 def normalize_role_value(value: Optional[str]) -> Optional[str]:
     if value is None:
         return None
-    normalized = value.strip().lower().replace(" ", "_")
-    normalized = _ROLE_ALIASES.get(normalized, normalized)
-    if normalized not in _ROLE_ALLOWED_SET:
-        allowed = ", ".join(sorted(_ROLE_ALLOWED_SET))
-        raise ValueError(f"Rol no válido. Roles permitidos: {allowed}")
+    normalized = _lookup_role(value)
+    if normalized is None:
+        raise ValueError(_ROLE_ERROR)
     return normalized
 
 
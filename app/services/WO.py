@@ -5,16 +5,18 @@ import subprocess
 import tempfile
 
 from datetime import datetime, timezone, date, time
-import csv
-import io
 from pathlib import Path
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional, Sequence, Tuple
 
 from bson import ObjectId
+from pydantic import TypeAdapter, ValidationError
 
 from app.db.repositories import work_orders_repo, recipes_repo, products_repo, exclude_skus_repo
 from app.services import wms_service
+from app.utils import cache
 from app.models.work_orders import (
     WorkOrderContentIn,
     WorkOrderIntegrationItem,
@@ -112,7 +114,8 @@ def _parse_float(value: Any, field: str) -> float:
         raise ValueError(f"{field} inválido") from exc
 
 
-def _row_to_payload(row: dict) -> WorkOrderCreateIn:
+def _row_to_data(row: dict) -> Dict[str, Any]:
+    """Convierte una fila del CSV al dict de WorkOrderCreateIn (sin validar aún)."""
     ot_raw = row.get("OT")
     if ot_raw is None:
         raise ValueError("OT es requerido")
@@ -121,23 +124,67 @@ def _row_to_payload(row: dict) -> WorkOrderCreateIn:
     except (TypeError, ValueError) as exc:
         raise ValueError("OT debe ser un número entero") from exc
 
-    contenido = WorkOrderContentIn(
-        SKU=str(row.get("SKU") or "").strip(),
-        Cantidad=_parse_float(row.get("Cantidad"), "Cantidad"),
-        Encargado=str(row.get("Encargado") or "").strip(),
-        linea=str(row.get("linea") or "").strip(),
-        fecha=_normalize_date(row.get("fecha"), "fecha"),
-        fecha_ini=_normalize_date(row.get("fecha_ini"), "fecha_ini"),
-        fecha_fin=_normalize_date(row.get("fecha_fin"), "fecha_fin"),
-        descripcion=None,
-    )
-    return WorkOrderCreateIn(
-        OT=ot_int,
-        contenido=contenido,
-        estado="CREADA",
-        merma=0,
-        cantidad_fin=0,
-    )
+    return {
+        "OT": ot_int,
+        "contenido": {
+            "SKU": str(row.get("SKU") or "").strip(),
+            "Cantidad": _parse_float(row.get("Cantidad"), "Cantidad"),
+            "Encargado": str(row.get("Encargado") or "").strip(),
+            "linea": str(row.get("linea") or "").strip(),
+            "fecha": _normalize_date(row.get("fecha"), "fecha"),
+            "fecha_ini": _normalize_date(row.get("fecha_ini"), "fecha_ini"),
+            "fecha_fin": _normalize_date(row.get("fecha_fin"), "fecha_fin"),
+            "descripcion": None,
+        },
+        "estado": "CREADA",
+        "merma": 0,
+        "cantidad_fin": 0,
+    }
+
+
+# Prefijo de las lecturas de OT cacheadas por el router /work-orders. Toda
+# escritura sobre work_orders (router o tareas como el cierre diario) debe
+# invalidarlo con invalidate_cache().
+CACHE_PREFIX = "wo:"
+
+
+def invalidate_cache() -> None:
+    cache.clear_prefix(CACHE_PREFIX)
+
+
+# Validación del import por lotes: un solo llamado al validador (Rust) por lote
+_WORK_ORDERS_ADAPTER = TypeAdapter(List[WorkOrderCreateIn])
+_IMPORT_VALIDATE_BATCH = 500
+# Filas del import cuyos items WMS se arman en paralelo
+_IMPORT_WMS_CONCURRENCY = 32
+
+
+def _validate_rows(
+    batch: List[Tuple[int, Dict[str, Any]]],
+) -> Tuple[List[Tuple[int, WorkOrderCreateIn]], List[WorkOrderImportError]]:
+    """
+    Valida un lote de (fila, datos). Retorna las OT válidas y un error por
+    cada fila inválida; las válidas de un lote con errores se revalidan juntas.
+    """
+    try:
+        validated = _WORK_ORDERS_ADAPTER.validate_python([data for _, data in batch])
+        return [(idx, payload) for (idx, _), payload in zip(batch, validated)], []
+    except ValidationError as exc:
+        messages: Dict[int, List[str]] = {}
+        for err in exc.errors(include_url=False):
+            pos, *field = err["loc"]
+            path = ".".join(str(part) for part in field)
+            messages.setdefault(pos, []).append(f"{path}: {err['msg']}" if path else err["msg"])
+
+    errors = [
+        WorkOrderImportError(row=batch[pos][0], ot=batch[pos][1].get("OT"), error="; ".join(msgs))
+        for pos, msgs in messages.items()
+    ]
+    valid = [item for pos, item in enumerate(batch) if pos not in messages]
+    if not valid:
+        return [], errors
+    validated = _WORK_ORDERS_ADAPTER.validate_python([data for _, data in valid])
+    return [(idx, payload) for (idx, _), payload in zip(valid, validated)], errors
 
 
 async def _filter_excluded_skus_from_payload(
@@ -207,10 +254,17 @@ OT_LOGO_PATH = PLANTILLAS_DIR / "LogoEmpresa.png"
 
 
 async def create_work_order(db, payload) -> Dict[str, Any]:
-    existing = await work_orders_repo.find_by_ot(payload.OT, db=db)
+    existing = await work_orders_repo.find_by_ot(payload.OT, projection={"_id": 1}, db=db)
     if existing:
         raise ValueError(f"La OT {payload.OT} ya existe")
 
+    work_order_doc = _build_work_order_doc(payload)
+    saved = await work_orders_repo.insert_work_order(work_order_doc, db=db)
+    return _map_work_order(saved)
+
+
+def _build_work_order_doc(payload) -> Dict[str, Any]:
+    """Valida fechas y arma el documento de la OT (sin persistir)."""
     contenido = payload.contenido
     fecha = _normalize_date(contenido.fecha, "fecha")
     fecha_ini = _normalize_date(contenido.fecha_ini, "fecha_ini")
@@ -243,9 +297,7 @@ async def create_work_order(db, payload) -> Dict[str, Any]:
         "cantidad_fin": float(payload.cantidad_fin),
         "audit": {"createdAt": now, "updatedAt": now},
     }
-
-    saved = await work_orders_repo.insert_work_order(work_order_doc, db=db)
-    return _map_work_order(saved)
+    return work_order_doc
 
 
 async def list_work_orders(
@@ -303,29 +355,64 @@ async def get_work_order_by_ot(db, ot: int | str) -> Dict[str, Any]:
     return _map_work_order(doc)
 
 
-async def import_work_orders_from_csv(db, csv_text: str) -> WorkOrderBulkImportOut:
-    reader = csv.DictReader(io.StringIO(csv_text))
+async def import_work_orders_from_csv(
+    db,
+    fieldnames: Optional[Sequence[str]],
+    rows: AsyncIterable[Dict[str, Any]],
+) -> WorkOrderBulkImportOut:
+    """
+    Importa OT desde las filas de un CSV (ya parseadas como dict por cabecera).
+    'rows' se consume en streaming: el archivo no se carga completo en memoria.
+    """
     required = {"OT", "SKU", "Cantidad", "Encargado", "linea", "fecha", "fecha_ini", "fecha_fin"}
-    if reader.fieldnames is None or not required.issubset({(h or "").strip() for h in reader.fieldnames}):
+    if fieldnames is None or not required.issubset({(h or "").strip() for h in fieldnames}):
         raise ValueError("CSV inválido: faltan cabeceras requeridas")
 
     errors: list[WorkOrderImportError] = []
     pending_to_save: list[tuple[int, WorkOrderCreateIn]] = []
     integration_items: list[WorkOrderIntegrationItem] = []
 
-    for idx, row in enumerate(reader, start=2):  # empieza en 2 por el header
-        try:
-            payload = _row_to_payload(row)
-            # Construye items para enviar a WMS (sin guardar aún en BD)
-            items = await build_wms_integration_items(
+    semaphore = asyncio.Semaphore(_IMPORT_WMS_CONCURRENCY)
+
+    async def _build_items(payload: WorkOrderCreateIn) -> List[WorkOrderIntegrationItem]:
+        # Construye items para enviar a WMS (sin guardar aún en BD)
+        async with semaphore:
+            return await build_wms_integration_items(
                 db,
                 ot=payload.OT,
                 contenido=payload.contenido,
             )
-            if not items:
-                raise ValueError("Receta sin componentes válidos para enviar a Invas")
-            integration_items.extend(items)
-            pending_to_save.append((idx, payload))
+
+    async def _stage(batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+        valid, invalid = _validate_rows(batch)
+        errors.extend(invalid)
+        # Las lecturas (PT, receta, componentes) de cada OT son independientes:
+        # se solapan entre filas, acotadas para no agotar el pool de conexiones.
+        results = await asyncio.gather(
+            *(_build_items(payload) for _, payload in valid),
+            return_exceptions=True,
+        )
+        for (idx, payload), items in zip(valid, results):
+            if isinstance(items, Exception):
+                errors.append(WorkOrderImportError(row=idx, ot=payload.OT, error=str(items)))
+            elif isinstance(items, BaseException):
+                raise items
+            elif not items:
+                errors.append(WorkOrderImportError(
+                    row=idx,
+                    ot=payload.OT,
+                    error="Receta sin componentes válidos para enviar a Invas",
+                ))
+            else:
+                integration_items.extend(items)
+                pending_to_save.append((idx, payload))
+
+    pending_rows: List[Tuple[int, Dict[str, Any]]] = []
+    idx = 1  # la fila 1 es el header
+    async for row in rows:
+        idx += 1
+        try:
+            pending_rows.append((idx, _row_to_data(row)))
         except Exception as exc:  # noqa: BLE001
             ot_val = None
             try:
@@ -333,6 +420,14 @@ async def import_work_orders_from_csv(db, csv_text: str) -> WorkOrderBulkImportO
             except Exception:
                 ot_val = None
             errors.append(WorkOrderImportError(row=idx, ot=ot_val, error=str(exc)))
+            continue
+        if len(pending_rows) >= _IMPORT_VALIDATE_BATCH:
+            await _stage(pending_rows)
+            pending_rows = []
+    if pending_rows:
+        await _stage(pending_rows)
+    # Los errores de validación llegan por lote: se reordenan por fila
+    errors.sort(key=lambda err: err.row)
 
     wms_response = None
     wms_error = None
@@ -356,13 +451,28 @@ async def import_work_orders_from_csv(db, csv_text: str) -> WorkOrderBulkImportO
 
     if wms_response and not wms_error:
         # Solo guardamos en BD si el envío a Invas fue exitoso
+        to_insert: list[tuple[int, WorkOrderCreateIn, Dict[str, Any]]] = []
         for idx, payload in pending_to_save:
             try:
-                created_doc = await create_work_order(db, payload)
-                created.append(created_doc)
+                to_insert.append((idx, payload, _build_work_order_doc(payload)))
             except Exception as exc:  # noqa: BLE001
                 errors.append(WorkOrderImportError(row=idx, ot=payload.OT, error=str(exc)))
 
+        # insert_many por lotes; el índice único de OT rechaza las existentes
+        write_errors = await work_orders_repo.insert_many_work_orders(
+            [doc for _, _, doc in to_insert],
+            db=db,
+        )
+        failed = {e["index"]: e for e in write_errors}
+        for i, (idx, payload, doc) in enumerate(to_insert):
+            err = failed.get(i)
+            if err is None:
+                created.append(_map_work_order(doc))
+            elif err.get("code") == 11000:
+                errors.append(WorkOrderImportError(row=idx, ot=payload.OT, error=f"La OT {payload.OT} ya existe"))
+            else:
+                errors.append(WorkOrderImportError(row=idx, ot=payload.OT, error=str(err.get("errmsg"))))
+
     created_out = [WorkOrderOut(**doc) for doc in created]
     return WorkOrderBulkImportOut(
         created=created_out,
@@ -407,24 +517,8 @@ def _format_iso_date(value: Any) -> str:
     return str(value)
 
 
-async def generate_work_order_excel(db, ot: int | str) -> Tuple[str, BytesIO]:
-    try:
-        from openpyxl import load_workbook
-    except ImportError as exc:
-        raise RuntimeError(
-            "openpyxl no está instalado. Instálalo para generar la plantilla de OT."
-        ) from exc
-
-    try:
-        from openpyxl.drawing.image import Image
-    except ModuleNotFoundError:
-        Image = None
-
-    if not OT_TEMPLATE_PATH.exists():
-        raise FileNotFoundError(f"No se encontró la plantilla en {OT_TEMPLATE_PATH}")
-    if Image is not None and not OT_LOGO_PATH.exists():
-        raise FileNotFoundError(f"No se encontró el logo en {OT_LOGO_PATH}")
-
+async def _work_order_values(db, ot: int | str) -> Dict[str, Any]:
+    """Datos de la OT que se vuelcan en la plantilla (solo lecturas a BD)."""
     order = await get_work_order_by_ot(db, ot)
     contenido = order.get("contenido", {})
 
@@ -445,6 +539,27 @@ async def generate_work_order_excel(db, ot: int | str) -> Tuple[str, BytesIO]:
         "sku": contenido.get("SKU", ""),
         "cantidad": float(contenido.get("Cantidad", 0) or 0),
     }
+    return value_map
+
+
+def _render_work_order_excel(value_map: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Llena la plantilla de OT (bloqueante: openpyxl + lectura de archivos)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError as exc:
+        raise RuntimeError(
+            "openpyxl no está instalado. Instálalo para generar la plantilla de OT."
+        ) from exc
+
+    try:
+        from openpyxl.drawing.image import Image
+    except ModuleNotFoundError:
+        Image = None
+
+    if not OT_TEMPLATE_PATH.exists():
+        raise FileNotFoundError(f"No se encontró la plantilla en {OT_TEMPLATE_PATH}")
+    if Image is not None and not OT_LOGO_PATH.exists():
+        raise FileNotFoundError(f"No se encontró el logo en {OT_LOGO_PATH}")
 
     workbook = load_workbook(filename=OT_TEMPLATE_PATH)
     sheet = workbook.active
@@ -476,9 +591,8 @@ async def generate_work_order_excel(db, ot: int | str) -> Tuple[str, BytesIO]:
 
     buffer = BytesIO()
     workbook.save(buffer)
-    buffer.seek(0)
     filename = f"OT_{value_map['numero_ot']}.xlsx"
-    return filename, buffer
+    return filename, buffer.getvalue()
 
 
 def _convert_excel_bytes_to_pdf(excel_bytes: bytes, source_filename: str) -> Tuple[str, bytes]:
@@ -535,38 +649,70 @@ def _convert_excel_bytes_to_pdf(excel_bytes: bytes, source_filename: str) -> Tup
         return pdf_path.name, pdf_path.read_bytes()
 
 
-async def generate_work_order_pdf(db, ot: int | str) -> Tuple[str, BytesIO]:
-    filename_xlsx, buffer = await generate_work_order_excel(db, ot)
-    buffer.seek(0)
-    excel_bytes = buffer.read()
-
-    pdf_filename, pdf_bytes = await asyncio.to_thread(
-        _convert_excel_bytes_to_pdf,
-        excel_bytes,
-        filename_xlsx,
-    )
-
-    pdf_buffer = BytesIO(pdf_bytes)
-    pdf_buffer.seek(0)
-    return pdf_filename, pdf_buffer
-
-
-async def generate_recipe_excel(db, payload: RecipePrintRequest) -> Tuple[str, BytesIO]:
-    try:
-        from openpyxl import load_workbook
-    except ModuleNotFoundError as exc:
-        raise RuntimeError("openpyxl no está instalado. Instálalo para generar la plantilla de receta.") from exc
-
-    try:
-        from openpyxl.drawing.image import Image
-    except ModuleNotFoundError:
-        Image = None
-
-    if not RECIPE_TEMPLATE_PATH.exists():
-        raise FileNotFoundError(f"No se encontró la plantilla en {RECIPE_TEMPLATE_PATH}")
-    if Image is not None and not RECIPE_LOGO_PATH.exists():
-        raise FileNotFoundError(f"No se encontró el logo en {RECIPE_LOGO_PATH}")
-
+# Cache de PDFs ya convertidos: LibreOffice tarda segundos por archivo. La
+# clave es el contenido que se vuelca en la plantilla, así que cualquier cambio
+# en la OT/receta genera un PDF nuevo; el TTL acota la memoria ocupada.
+_PDF_CACHE_TTL_SECONDS = 600
+_PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_pdf_cache: "OrderedDict[Tuple, Tuple[float, str, bytes]]" = OrderedDict()
+_pdf_cache_bytes = 0
+
+
+def _pdf_cache_get(key: Tuple) -> Optional[Tuple[str, bytes]]:
+    global _pdf_cache_bytes
+    entry = _pdf_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, filename, data = entry
+    if expires_at <= monotonic():
+        del _pdf_cache[key]
+        _pdf_cache_bytes -= len(data)
+        return None
+    _pdf_cache.move_to_end(key)
+    return filename, data
+
+
+def _pdf_cache_put(key: Tuple, filename: str, data: bytes) -> None:
+    global _pdf_cache_bytes
+    if len(data) > _PDF_CACHE_MAX_BYTES:
+        return
+    previous = _pdf_cache.pop(key, None)
+    if previous is not None:
+        _pdf_cache_bytes -= len(previous[2])
+    _pdf_cache[key] = (monotonic() + _PDF_CACHE_TTL_SECONDS, filename, data)
+    _pdf_cache_bytes += len(data)
+    # Se descartan los menos usados hasta volver bajo el tope
+    while _pdf_cache_bytes > _PDF_CACHE_MAX_BYTES:
+        _, (_, _, old) = _pdf_cache.popitem(last=False)
+        _pdf_cache_bytes -= len(old)
+
+
+async def _excel_to_pdf(key: Tuple, render: Callable[..., Tuple[str, bytes]], *args: Any) -> Tuple[str, bytes]:
+    """Llena la plantilla y la convierte a PDF en un thread (o la toma del cache)."""
+    cached = _pdf_cache_get(key)
+    if cached is not None:
+        return cached
+
+    def build() -> Tuple[str, bytes]:
+        filename_xlsx, excel_bytes = render(*args)
+        return _convert_excel_bytes_to_pdf(excel_bytes, filename_xlsx)
+
+    pdf_filename, pdf_bytes = await asyncio.to_thread(build)
+    _pdf_cache_put(key, pdf_filename, pdf_bytes)
+    return pdf_filename, pdf_bytes
+
+
+async def generate_work_order_pdf(db, ot: int | str) -> Tuple[str, bytes]:
+    value_map = await _work_order_values(db, ot)
+    key = ("ot", tuple(value_map.items()))
+    return await _excel_to_pdf(key, _render_work_order_excel, value_map)
+
+
+async def _recipe_values(
+    db,
+    payload: RecipePrintRequest,
+) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    """Nombre de archivo, celdas simples y filas de materiales (solo lecturas a BD)."""
     sku_pt = payload.skuPT
     pt_doc = await products_repo.find_by_sku(sku_pt, db=db)
     if not pt_doc:
@@ -646,6 +792,47 @@ async def generate_recipe_excel(db, payload: RecipePrintRequest) -> Tuple[str, B
     if len(filas) > max_filas:
         raise ValueError(f"La receta tiene más componentes ({len(filas)}) que filas disponibles ({max_filas}).")
 
+    hoy = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    producto_nombre = pt_doc.get("nombre") or sku_pt
+
+    single_values = {
+        "fechahoy": hoy,
+        "numero_ot": payload.numeroOT or "",
+        # 'linea' se deja intacta en la plantilla
+        "encargado": payload.encargado or "",
+        "producto": producto_nombre,
+        "fecha_ini": _format_iso_date(payload.fecha_ini or date.today()),
+    }
+
+    ot_part = payload.numeroOT or "sin_OT"
+    filename = f"Receta_{sku_pt}_OT_{ot_part}.xlsx"
+    return filename, single_values, filas
+
+
+def _render_recipe_excel(
+    filename: str,
+    single_values: Dict[str, Any],
+    filas: List[Dict[str, Any]],
+) -> Tuple[str, bytes]:
+    """Llena la plantilla de receta (bloqueante: openpyxl + lectura de archivos)."""
+    try:
+        from openpyxl import load_workbook
+    except ModuleNotFoundError as exc:
+        raise RuntimeError("openpyxl no está instalado. Instálalo para generar la plantilla de receta.") from exc
+
+    try:
+        from openpyxl.drawing.image import Image
+    except ModuleNotFoundError:
+        Image = None
+
+    if not RECIPE_TEMPLATE_PATH.exists():
+        raise FileNotFoundError(f"No se encontró la plantilla en {RECIPE_TEMPLATE_PATH}")
+    if Image is not None and not RECIPE_LOGO_PATH.exists():
+        raise FileNotFoundError(f"No se encontró el logo en {RECIPE_LOGO_PATH}")
+
+    rango = RECIPE_EXCEL_MAP["materiales_receta"]["rango_filas"]
+    inicio = rango["inicio"]
+
     workbook = load_workbook(filename=RECIPE_TEMPLATE_PATH)
     sheet = workbook.active
 
@@ -662,18 +849,6 @@ async def generate_recipe_excel(db, payload: RecipePrintRequest) -> Tuple[str, B
         except Exception as exc:
             raise RuntimeError(f"No se pudo insertar el logo en la plantilla: {exc}") from exc
 
-    hoy = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    producto_nombre = pt_doc.get("nombre") or sku_pt
-
-    single_values = {
-        "fechahoy": hoy,
-        "numero_ot": payload.numeroOT or "",
-        # 'linea' se deja intacta en la plantilla
-        "encargado": payload.encargado or "",
-        "producto": producto_nombre,
-        "fecha_ini": _format_iso_date(payload.fecha_ini or date.today()),
-    }
-
     for key, cell in RECIPE_EXCEL_MAP["single_cells"].items():
         if key not in single_values:
             continue
@@ -690,26 +865,18 @@ async def generate_recipe_excel(db, payload: RecipePrintRequest) -> Tuple[str, B
 
     buffer = BytesIO()
     workbook.save(buffer)
-    buffer.seek(0)
-    ot_part = payload.numeroOT or "sin_OT"
-    filename = f"Receta_{sku_pt}_OT_{ot_part}.xlsx"
-    return filename, buffer
+    return filename, buffer.getvalue()
 
 
-async def generate_recipe_pdf(db, payload: RecipePrintRequest) -> Tuple[str, BytesIO]:
-    filename_xlsx, buffer = await generate_recipe_excel(db, payload)
-    buffer.seek(0)
-    excel_bytes = buffer.read()
-
-    pdf_filename, pdf_bytes = await asyncio.to_thread(
-        _convert_excel_bytes_to_pdf,
-        excel_bytes,
-        filename_xlsx,
+async def generate_recipe_pdf(db, payload: RecipePrintRequest) -> Tuple[str, bytes]:
+    filename, single_values, filas = await _recipe_values(db, payload)
+    key = (
+        "receta",
+        filename,
+        tuple(single_values.items()),
+        tuple(tuple(fila.values()) for fila in filas),
     )
-
-    pdf_buffer = BytesIO(pdf_bytes)
-    pdf_buffer.seek(0)
-    return pdf_filename, pdf_buffer
+    return await _excel_to_pdf(key, _render_recipe_excel, filename, single_values, filas)
 
 
 async def build_wms_integration_items(
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, Optional, Tuple
 
 from bson import ObjectId
 
-from app.core.security import verify_password
+from app.core.security import verify_and_update_password
 from app.db.repositories import users_repo
 
 
@@ -44,7 +45,13 @@ async def authenticate(
         return False, "Usuario deshabilitado.", None
 
     hashed_password = user.get("passwordHash", "")
-    if not hashed_password or not verify_password(password, hashed_password):
+    if not hashed_password:
         return False, "Contraseña incorrecta.", None
+    valid, new_hash = await asyncio.to_thread(verify_and_update_password, password, hashed_password)
+    if not valid:
+        return False, "Contraseña incorrecta.", None
+    if new_hash:
+        # Migración transparente de bcrypt a Argon2 en el primer login
+        await users_repo.replace_password_hash(user["_id"], hashed_password, new_hash, db)
 
     return True, "Autenticación exitosa.", _map_user_out(user)
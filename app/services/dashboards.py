@@ -3,10 +3,32 @@ from __future__ import annotations
 import os
 from typing import Dict
 
+from pymongo import ASCENDING
+
+from app.db import mongo
 from app.db.mongo import get_db
+from app.utils.singleflight import SingleFlight
 
 COLL_DECLAREPT = os.getenv("COLL_DECLAREPT", "declare_pt_events")
 COLL_CONSUMIRVASOT = os.getenv("COLL_CONSUMIRVASOT", "consume_vasot_events")
+NET_SKUS_CACHE_TTL_SECONDS = 30
+
+# Evita que varias peticiones simultáneas de la misma OT corran el pipeline a la vez
+_net_skus_flight = SingleFlight()
+
+
+def net_skus_cache_key(ot: int | str) -> str:
+    return f"dash:ot:skus:{int(ot)}"
+
+
+async def ensure_indexes(db=None) -> None:
+    """Índices que sirven el $match inicial de los pipelines del dashboard."""
+    database = db if db is not None else get_db()
+    for collection_name in (COLL_DECLAREPT, COLL_CONSUMIRVASOT):
+        await database[collection_name].create_index(
+            [("work_order", ASCENDING), ("status", ASCENDING)],
+            name="idx_work_order_status",
+        )
 
 
 async def _sum_skus_by_work_order(db, collection_name: str, work_order: str) -> Dict[str, float]:
@@ -14,14 +36,16 @@ async def _sum_skus_by_work_order(db, collection_name: str, work_order: str) ->
     Suma las cantidades por SKU para una work_order en una colección dada.
     Solo considera documentos con status SUCCESS.
     """
-    col = db[collection_name]
+    col = mongo.get_collection(collection_name, db)
+    # $match va siempre primero para que Mongo use idx_work_order_status
     pipeline = [
         {"$match": {"work_order": work_order, "status": "SUCCESS"}},
         {"$project": {"skus": {"$objectToArray": "$skus"}}},
         {"$unwind": "$skus"},
         {"$group": {"_id": "$skus.k", "total": {"$sum": "$skus.v"}}},
     ]
-    results = await col.aggregate(pipeline).to_list(length=None)
+    cursor = await col.aggregate(pipeline)
+    results = await cursor.to_list(length=None)
     return {str(doc["_id"]): float(doc["total"]) for doc in results}
 
 
@@ -39,7 +63,12 @@ async def get_net_skus_by_ot(db=None, ot: int | str = None) -> Dict[str, float]:
 
     work_order = f"OT-{ot_int}"
     database = db if db is not None else get_db()
+    return await _net_skus_flight.do(
+        work_order, lambda: _compute_net_skus(database, work_order)
+    )
+
 
+async def _compute_net_skus(database, work_order: str) -> Dict[str, float]:
     declare_totals = await _sum_skus_by_work_order(database, COLL_DECLAREPT, work_order)
     consume_totals = await _sum_skus_by_work_order(database, COLL_CONSUMIRVASOT, work_order)
 
@@ -7,6 +7,9 @@ from bson import ObjectId
 from app.db.repositories import encargados_repo
 from app.models.encargados import EncargadoCreate, EncargadoUpdate
 
+# Campos que expone EncargadoOut (el _id viene siempre)
+_LIST_PROJECTION = {"nombre": 1, "linea": 1, "predeterminado": 1}
+
 
 def _map_encargado(doc: Dict[str, Any]) -> Dict[str, Any]:
     return {
@@ -30,7 +33,13 @@ async def list_encargados(
         filtro["linea"] = linea.strip()
     if nombre:
         filtro["nombre"] = {"$regex": nombre.strip(), "$options": "i"}
-    docs = await encargados_repo.find_all(filtro=filtro, limit=limit, skip=skip, db=db)
+    docs = await encargados_repo.find_all(
+        filtro=filtro,
+        limit=limit,
+        skip=skip,
+        projection=_LIST_PROJECTION,
+        db=db,
+    )
     return [_map_encargado(doc) for doc in docs]
 
 
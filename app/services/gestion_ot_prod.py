@@ -1,16 +1,27 @@
 from __future__ import annotations
 
 from datetime import date, datetime, time, timezone, timedelta
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from bson import ObjectId
 
 from app.db.repositories import gestion_ot_prod_repo, work_orders_repo
 from app.models.gestion_produccion import (
     GestionOTProdCreateIn,
-    GestionOTProdFilters,
     GestionOTProdUpdateIn,
 )
+from app.services import WO
+from app.utils import pagination
+
+# Campos que expone GestionOTProdOut (el _id viene siempre)
+_LIST_PROJECTION = {
+    "OT": 1,
+    "contenido": 1,
+    "estado": 1,
+    "merma": 1,
+    "cantidad_fin": 1,
+    "audit": 1,
+}
 
 
 def _oid_str(oid: ObjectId | None) -> str | None:
@@ -112,7 +123,7 @@ def _map_entry(doc: Dict[str, Any]) -> Dict[str, Any]:
 
 
 async def create_entry(db, payload: GestionOTProdCreateIn) -> Dict[str, Any]:
-    existing = await gestion_ot_prod_repo.find_by_ot(int(payload.OT), db=db)
+    existing = await gestion_ot_prod_repo.find_by_ot(int(payload.OT), projection={"_id": 1}, db=db)
     if existing:
         raise ValueError(f"La OT {payload.OT} ya existe en Gestión de Producción.")
 
@@ -149,48 +160,50 @@ async def create_entry(db, payload: GestionOTProdCreateIn) -> Dict[str, Any]:
         "estado": payload.estado,
         "merma": float(payload.merma),
         "cantidad_fin": float(payload.cantidad_fin),
-        "audit": {"createdAt": now, "updatedAt": now},
+        # createdHour precalculado para filtrar por hora usando índice (sin $expr)
+        "audit": {"createdAt": now, "updatedAt": now, "createdHour": now.hour},
     }
 
     saved = await gestion_ot_prod_repo.insert_entry(doc, db=db)
     return _map_entry(saved)
 
 
+def build_query(
+    ot: int | None = None,
+    fecha: date | None = None,
+    hora: int | None = None,
+) -> Dict[str, Any]:
+    """Traduce los filtros del listado directo a la query de Mongo ({} si no hay filtros)."""
+    query: Dict[str, Any] = {}
+    if ot is not None:
+        query["OT"] = int(ot)
+    if fecha is not None:
+        start = datetime.combine(fecha, time.min, tzinfo=timezone.utc)
+        query["contenido.fecha"] = {"$gte": start, "$lt": start + timedelta(days=1)}
+    if hora is not None:
+        query["audit.createdHour"] = int(hora)
+    return query
+
+
 async def list_entries(
     db,
     *,
     limit: int = 50,
     skip: int = 0,
-    filters: GestionOTProdFilters | None = None,
+    query: Dict[str, Any] | None = None,
+    after: Tuple[datetime, ObjectId] | None = None,
 ) -> List[Dict[str, Any]]:
-    filtro_db: Dict[str, Any] = {}
-    expr_conditions: List[Dict[str, Any]] = []
-
-    if filters:
-        if filters.ot is not None:
-            filtro_db["OT"] = int(filters.ot)
-        if filters.fecha is not None:
-            start = datetime.combine(filters.fecha, time.min, tzinfo=timezone.utc)
-            end = start + timedelta(days=1)
-            filtro_db["contenido.fecha"] = {"$gte": start, "$lt": end}
-        if filters.hora is not None:
-            expr_conditions.append(
-                {"$eq": [{"$hour": "$audit.createdAt"}, int(filters.hora)]}
-            )
-
-    if expr_conditions:
-        expr = expr_conditions[0] if len(expr_conditions) == 1 else {"$and": expr_conditions}
-        existing_expr = filtro_db.get("$expr")
-        if existing_expr:
-            expr = {"$and": [existing_expr, expr]}
-        filtro_db["$expr"] = expr
-
+    if after is not None:
+        # Keyset: con cursor se ignora skip
+        query = {**(query or {}), **pagination.keyset_filter("audit.createdAt", *after)}
+        skip = 0
     docs = await gestion_ot_prod_repo.list_entries(
         db=db,
         limit=limit,
         skip=skip,
-        filtro=filtro_db or None,
-        sort=[("audit.createdAt", -1)],
+        filtro=query or None,
+        sort=[("audit.createdAt", -1), ("_id", -1)],
+        projection=_LIST_PROJECTION,
     )
     return [_map_entry(doc) for doc in docs]
 
@@ -281,4 +294,7 @@ async def close_previous_day_entries(db) -> Dict[str, int]:
     start_today = datetime.combine(now.date(), time.min, tzinfo=timezone.utc)
     closed_gestion = await gestion_ot_prod_repo.close_until_fecha(start_today, db=db)
     closed_work_orders = await work_orders_repo.close_until_fecha(start_today, db=db)
+    if closed_work_orders:
+        # El estado cambia fuera del router /work-orders: sus lecturas cacheadas quedan viejas
+        WO.invalidate_cache()
     return {"gestion_ot_prod": closed_gestion, "work_orders": closed_work_orders}
@@ -1,13 +1,32 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import re
-from datetime import date, datetime, timedelta, timezone
-from typing import Any, Dict, Tuple
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
 
 from bson import ObjectId
 
 from app.db.repositories import logs_repo
 from app.models.logs import LogCreateIn, LogsListFilters
+from app.tasks import logs_buffer
+from app.utils import cache, pagination
+
+_COUNT_CACHE_TTL_SECONDS = 30
+
+
+# Solo los campos que lee _map_out; evita traer userAlias_ci y otros extras
+_LIST_PROJECTION = {
+    "loggedAt": 1,
+    "severity": 1,
+    "accion": 1,
+    "usuario": 1,
+    "payload": 1,
+    "actor": 1,
+    "entity": 1,
+    "event": 1,
+}
 
 
 def _oid_str(oid: ObjectId | None) -> str | None:
@@ -22,12 +41,15 @@ def _ensure_timezone(dt: datetime | None) -> datetime:
     return dt.astimezone(timezone.utc)
 
 
+_SEVERITIES = frozenset({"INFO", "WARN"})
+_EVENT_SEVERITY = {"disable": "WARN", "delete": "WARN"}
+_DEFAULT_SEVERITY = "INFO"
+
+
 def _determine_severity(explicit: str | None, event: str) -> str:
-    if explicit in {"INFO", "WARN"}:
+    if explicit in _SEVERITIES:
         return explicit
-    if event in {"disable", "delete"}:
-        return "WARN"
-    return "INFO"
+    return _EVENT_SEVERITY.get(event, _DEFAULT_SEVERITY)
 
 
 def _map_out(doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -51,6 +73,7 @@ async def create_log(db, payload: LogCreateIn) -> Dict[str, Any]:
     accion = f"{payload.actor}.{payload.entity}.{payload.event}"
 
     doc = {
+        "_id": ObjectId(),
         "loggedAt": logged_at,
         "severity": severity,
         "accion": accion,
@@ -62,20 +85,26 @@ async def create_log(db, payload: LogCreateIn) -> Dict[str, Any]:
         "event": payload.event,
     }
 
+    # El _id se asigna acá: la respuesta no espera la escritura en Mongo.
+    # Si el buffer no corre o está lleno, se escribe directo.
+    if logs_buffer.is_running() and logs_buffer.enqueue(doc):
+        return _map_out(doc)
+
     created = await logs_repo.insert_log(doc, db=db)
     return _map_out(created)
 
 
 def _build_filters(filters: LogsListFilters) -> Dict[str, Any]:
     filtro: Dict[str, Any] = {}
-    if filters.q:
-        filtro["actor"] = {"$regex": re.escape(filters.q), "$options": "i"}
+    q = (filters.q or "").strip().lower()
+    if q:
+        # Prefijo anclado sobre el alias normalizado: usa idx_userAlias_loggedAt
+        filtro["userAlias_ci"] = {"$regex": f"^{re.escape(q)}"}
     if filters.severity:
         filtro["severity"] = filters.severity
     if filters.date:
-        start = datetime.combine(filters.date, datetime.min.time()).replace(
-            tzinfo=timezone.utc
-        )
+        # Rango sobre el datetime BSON crudo para que Mongo use idx_severity_loggedAt
+        start = datetime.combine(filters.date, time.min, tzinfo=timezone.utc)
         end = start + timedelta(days=1)
         filtro["loggedAt"] = {"$gte": start, "$lt": end}
     return filtro
@@ -86,10 +115,41 @@ async def list_logs(
     filters: LogsListFilters,
     skip: int,
     limit: int,
-) -> Tuple[list[Dict[str, Any]], int]:
+    after: Optional[Tuple[datetime, ObjectId]] = None,
+    include_total: bool = False,
+) -> Tuple[list[Dict[str, Any]], Optional[int], bool]:
+    """Retorna (items, total, has_more). total es None si no se solicita."""
     filtro = _build_filters(filters)
-    docs = await logs_repo.list_logs(
-        filtro=filtro, skip=skip, limit=limit, sort=[("loggedAt", -1)], db=db
+    page_filter = filtro
+    if after is not None:
+        # Keyset: con cursor se ignora skip
+        page_filter = {**filtro, **pagination.keyset_filter("loggedAt", *after)}
+        skip = 0
+    # Se pide un documento extra solo para saber si hay más páginas
+    page = logs_repo.list_logs(
+        filtro=page_filter,
+        skip=skip,
+        limit=limit + 1,
+        sort=[("loggedAt", -1), ("_id", -1)],
+        projection=_LIST_PROJECTION,
+        db=db,
     )
+    if include_total:
+        # Página y total se consultan en paralelo: la latencia queda en max(find, count)
+        docs, total = await asyncio.gather(page, _count_logs(db, filtro))
+    else:
+        docs, total = await page, None
+    has_more = len(docs) > limit
+    return [_map_out(doc) for doc in docs[:limit]], total, has_more
+
+
+async def _count_logs(db, filtro: Dict[str, Any]) -> int:
+    if not filtro:
+        return await logs_repo.estimated_count_logs(db=db)
+    key = "logs:count:" + json.dumps(filtro, sort_keys=True, default=str)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     total = await logs_repo.count_logs(filtro=filtro, db=db)
-    return [_map_out(doc) for doc in docs], total
+    cache.set(key, total, _COUNT_CACHE_TTL_SECONDS, keep_stale=False)
+    return total
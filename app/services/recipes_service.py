@@ -1,16 +1,13 @@
 # app/services/recipes_service.py
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List
 from datetime import datetime, timezone, date
 from bson import ObjectId
 
 from app.db.repositories import recipes_repo
 
 # ------------------------ helpers de mapeo/fechas ----------------------------
-def _oid_str(oid: ObjectId | None) -> Optional[str]:
-    return str(oid) if oid is not None else None
-
 def _today_utc_date_only() -> date:
     now = datetime.now(timezone.utc)
     return date(year=now.year, month=now.month, day=now.day)
@@ -57,30 +54,20 @@ def _normalize_publication_datetime(value: Any) -> datetime:
     return dt
 
 def _map_recipe_out(doc: Dict[str, Any]) -> Dict[str, Any]:
-    """Convierte ObjectIds a str y expone 'id' en lugar de '_id'."""
-    def map_version(v: Dict[str, Any]) -> Dict[str, Any]:
-        out = dict(v)
-        if "processId" in out and out["processId"] is not None:
-            out["processId"] = _oid_str(out["processId"])
-        out["componentes"] = [
-            {
-                "productId": _oid_str(c["productId"]),
-                "cantidadPorBase": c["cantidadPorBase"],
-                "unidad": c["unidad"],
-                "merma_pct": c.get("merma_pct", 0.0),
-            }
-            for c in v.get("componentes", [])
-        ]
-        return out
-
+    """
+    Expone 'id' en lugar de '_id' (una sola pasada, solo primer nivel).
+    Los ObjectId anidados (productPTId, processId, componentes[].productId)
+    se dejan tal cual: el router los serializa a str con orjson al responder.
+    """
+    audit = doc.get("audit") or {}
     return {
-        "id": _oid_str(doc["_id"]),
-        "productPTId": _oid_str(doc["productPTId"]),
+        "id": doc["_id"],
+        "productPTId": doc["productPTId"],
         "vigenteVersion": doc.get("vigenteVersion"),
-        "versiones": [map_version(v) for v in doc.get("versiones", [])],
+        "versiones": doc.get("versiones", []),
         "audit": {
-            "createdAt": doc["audit"]["createdAt"],
-            "updatedAt": doc["audit"]["updatedAt"],
+            "createdAt": audit.get("createdAt"),
+            "updatedAt": audit.get("updatedAt"),
         },
     }
 
@@ -437,10 +424,10 @@ def _to_num(v, default=0.0) -> float:
         return default
 
 async def promote_staging_batch(db, batch_id: str, *, overwrite_version: bool = False, dry_run: bool = False) -> Dict[str, Any]:
-    STAGING = await recipes_repo.staging_coll(db)
-    PRODUCTS = await recipes_repo.products_coll(db)
-    PROCESSES = await recipes_repo.processes_coll(db)
-    RECIPES = await recipes_repo.get_collection(db)
+    STAGING = recipes_repo.staging_coll(db)
+    PRODUCTS = recipes_repo.products_coll(db)
+    PROCESSES = recipes_repo.processes_coll(db)
+    RECIPES = recipes_repo.get_collection(db)
 
     warnings: List[str] = []
     errores: List[str] = []
@@ -64,7 +64,7 @@ async def preview_valuation(
     breakdown: List[Dict[str, Any]] = []
     debug_rows: List[Dict[str, Any]] = []  # 👈 NUEVO
 
-    prod_col = await recipes_repo.products_coll(db)
+    prod_col = recipes_repo.products_coll(db)
 
     # 2) Valorización de materiales
     for comp in componentes:
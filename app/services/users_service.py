@@ -1,6 +1,7 @@
 # app/services/users_service.py
 from __future__ import annotations
 
+import asyncio
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timezone
 from bson import ObjectId
@@ -37,7 +38,7 @@ async def create_user(db, payload: UserCreateIn) -> Dict[str, Any]:
         raise ValueError("email ya registrado")
 
     now = datetime.now(timezone.utc)
-    password_hash = hash_password(payload.password)
+    password_hash = await asyncio.to_thread(hash_password, payload.password)
 
     doc = {
         "email": email_clean,
@@ -125,9 +126,9 @@ async def change_password(db, user_id: str, password_actual: str, password_nueva
         raise ValueError("Usuario no encontrado")
 
     # valida hash actual
-    if not verify_password(password_actual, user.get("passwordHash", "")):
+    if not await asyncio.to_thread(verify_password, password_actual, user.get("passwordHash", "")):
         raise ValueError("La contraseña actual no es válida")
     
-    new_hash = hash_password(password_nueva)
+    new_hash = await asyncio.to_thread(hash_password, password_nueva)
     updated = await users_repo.set_password_hash(user_id, new_hash, db)
     return _map_out(updated)
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
+
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from app.db.mongo import get_db
+from app.db.repositories import logs_repo
+
+logger = logging.getLogger(__name__)
+
+# Se escribe en cuanto se juntan _MAX_BATCH logs o pasan _MAX_WAIT_SECONDS
+# desde el primero pendiente.
+_MAX_BATCH = 50
+_MAX_WAIT_SECONDS = 0.02
+# Tope de logs pendientes; con la cola llena el servicio escribe directo.
+_MAX_QUEUE = 10000
+# Esperas entre reintentos cuando Mongo no está disponible.
+_RETRY_DELAYS_SECONDS = (0.1, 0.5, 2.0)
+_DUPLICATE_KEY = 11000
+
+_STOP = object()
+
+_queue: asyncio.Queue | None = None
+_task: asyncio.Task | None = None
+
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+
+def enqueue(doc: Dict[str, Any]) -> bool:
+    """
+    Agrega un log ya armado (con _id asignado) al buffer de escritura.
+    Devuelve False si la cola está llena: el llamador debe escribirlo directo.
+    """
+    try:
+        _queue.put_nowait(doc)
+    except asyncio.QueueFull:
+        return False
+    return True
+
+
+async def _drain() -> Tuple[List[Dict[str, Any]], bool]:
+    """Junta un lote; el segundo valor indica si se recibió la señal de cierre."""
+    first = await _queue.get()
+    if first is _STOP:
+        return [], True
+    batch = [first]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _MAX_WAIT_SECONDS
+    while len(batch) < _MAX_BATCH:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            doc = await asyncio.wait_for(_queue.get(), timeout=remaining)
+        except asyncio.TimeoutError:
+            break
+        if doc is _STOP:
+            return batch, True
+        batch.append(doc)
+    return batch, False
+
+
+async def _write(batch: List[Dict[str, Any]]) -> None:
+    for delay in (0.0, *_RETRY_DELAYS_SECONDS):
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            await logs_repo.insert_many_logs(batch, db=get_db())
+            return
+        except BulkWriteError as exc:
+            # ordered=False: el resto del lote ya se escribió. Un duplicado
+            # solo aparece al reintentar un lote que llegó a escribirse en parte.
+            errors = exc.details.get("writeErrors", [])
+            if any(e.get("code") != _DUPLICATE_KEY for e in errors):
+                logger.exception("Error al escribir %s logs en lote", len(batch))
+            return
+        except ConnectionFailure:
+            # Error transitorio (AutoReconnect, timeout de red): se reintenta
+            logger.warning(
+                "Mongo no disponible al escribir %s logs; reintentando", len(batch)
+            )
+        except Exception:
+            logger.exception("Error al escribir %s logs en lote", len(batch))
+            return
+    logger.error(
+        "Se descartan %s logs tras %s reintentos", len(batch), len(_RETRY_DELAYS_SECONDS)
+    )
+
+
+async def _flush_loop():
+    while True:
+        batch, stop = await _drain()
+        if batch:
+            await _write(batch)
+        if stop:
+            return
+
+
+def start_flush_task() -> asyncio.Task:
+    """Inicia la tarea en background si no existe."""
+    global _queue, _task
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=_MAX_QUEUE)
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_flush_loop())
+    return _task
+
+
+async def stop_flush_task():
+    global _task
+    if _task is None:
+        return
+    # La señal de cierre entra al final de la cola: se escribe todo lo pendiente
+    await _queue.put(_STOP)
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Tiempo máximo de espera a Mongo antes de servir la copia stale.
+MONGO_TIMEOUT_SECONDS = 0.5
+STALE_HEADER = "X-Cache"
+
+# Cache en memoria del proceso (clave -> (expira_en, valor)).
+# La API corre en un solo proceso uvicorn, por lo que basta con un dict;
+# el TTL es solo una red de seguridad: las mutaciones invalidan explícitamente.
+_STORE: Dict[str, Tuple[float, Any]] = {}
+_STORE_MAX_ENTRIES = 10000
+
+# Última versión conocida de cada clave, sin TTL. Solo se usa como respaldo
+# cuando Mongo no responde (stale-while-revalidate).
+_STALE: Dict[str, Any] = {}
+_STALE_MAX_ENTRIES = 5000
+
+
+def get(key: str) -> Optional[Any]:
+    entry = _STORE.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at <= time.monotonic():
+        _STORE.pop(key, None)
+        return None
+    return value
+
+
+def get_stale(key: str) -> Optional[Any]:
+    return _STALE.get(key)
+
+
+def stale_timeout(key: str) -> Optional[float]:
+    """Límite de espera a Mongo: solo aplica si hay una copia stale que servir."""
+    return MONGO_TIMEOUT_SECONDS if key in _STALE else None
+
+
+def set(key: str, value: Any, ttl: float, *, keep_stale: bool = False) -> None:
+    # Se reinserta al final para que el recorte descarte las claves más antiguas
+    _STORE.pop(key, None)
+    _STORE[key] = (time.monotonic() + ttl, value)
+    if len(_STORE) > _STORE_MAX_ENTRIES:
+        purge_expired()
+        while len(_STORE) > _STORE_MAX_ENTRIES:
+            _STORE.pop(next(iter(_STORE)))
+    if not keep_stale:
+        # Solo los endpoints con respaldo stale (counters, dashboards) lo piden
+        return
+    # Se reinserta al final para que el recorte descarte las claves más antiguas
+    _STALE.pop(key, None)
+    _STALE[key] = value
+    if len(_STALE) > _STALE_MAX_ENTRIES:
+        _STALE.pop(next(iter(_STALE)))
+
+
+def clear(key: str) -> None:
+    _STORE.pop(key, None)
+    _STALE.pop(key, None)
+
+
+def clear_prefix(prefix: str) -> None:
+    """Invalida todas las claves que comienzan con 'prefix' (ej: búsquedas)."""
+    for store in (_STORE, _STALE):
+        for key in [k for k in store if k.startswith(prefix)]:
+            store.pop(key, None)
+
+
+def purge_expired() -> None:
+    """Elimina entradas vencidas que nunca se volvieron a leer."""
+    now = time.monotonic()
+    for key in [k for k, (expires_at, _) in _STORE.items() if expires_at <= now]:
+        _STORE.pop(key, None)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response
+
+
+def weak_etag(*parts: Any) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def content_etag(prefix: Any, payload: Any) -> str:
+    """ETag débil derivado del contenido serializado (orden de claves estable)."""
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return weak_etag(prefix, hashlib.sha1(raw).hexdigest()[:16])
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """Retorna un 304 si el cliente ya tiene esta versión (If-None-Match)."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    candidates = {value.strip() for value in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Type, TypeVar
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+async def parse_body(request: Request, model: Type[ModelT]) -> ModelT:
+    """
+    Valida el body directo desde los bytes (model_validate_json, en Rust),
+    sin pasar por request.json() -> dict. Los errores responden 422 igual
+    que un parámetro body normal de FastAPI.
+    """
+    try:
+        return model.model_validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+
+
+def _inline_refs(node: Any, defs: Dict[str, Any]) -> Any:
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/$defs/"):
+            return _inline_refs(defs[ref.rsplit("/", 1)[-1]], defs)
+        return {k: _inline_refs(v, defs) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_inline_refs(v, defs) for v in node]
+    return node
+
+
+def openapi_body(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    openapi_extra para endpoints que leen el body con parse_body: documenta
+    el esquema del modelo. Los submodelos ($defs) se insertan en línea porque
+    sus $ref no resolverían dentro del documento OpenAPI.
+    """
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_refs(schema, defs)}},
+        }
+    }
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+from bson import ObjectId
+
+
+def encode_cursor(ts: datetime, oid: ObjectId | str) -> str:
+    """Codifica (timestamp, _id) del último elemento como cursor opaco."""
+    raw = f"{ts.isoformat()}|{oid}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        ts_text, oid_text = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts_text), ObjectId(oid_text)
+    except Exception as exc:
+        raise ValueError("Cursor inválido") from exc
+
+
+def keyset_filter(field: str, ts: datetime, oid: ObjectId) -> Dict[str, Any]:
+    """
+    Condición para la página siguiente con orden (field desc, _id desc):
+    evita el skip O(n) y mantiene un orden estable con inserciones concurrentes.
+    """
+    return {
+        "$or": [
+            {field: {"$lt": ts}},
+            {field: ts, "_id": {"$lt": oid}},
+        ]
+    }
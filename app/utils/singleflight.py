@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas concurrentes con la misma clave: solo la primera ejecuta
+    la función y el resto espera el mismo resultado (o la misma excepción).
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _t: self._in_flight.pop(key, None))
+        # shield: si un llamador se cancela (p.ej. timeout), el resto sigue esperando
+        return await asyncio.shield(task)